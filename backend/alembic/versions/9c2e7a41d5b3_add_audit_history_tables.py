@@ -0,0 +1,121 @@
+"""Add audit history tables
+
+Revision ID: 9c2e7a41d5b3
+Revises: 4d4fd9217dc0
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c2e7a41d5b3"
+down_revision: Union[str, None] = "4d4fd9217dc0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "audit_runs",
+        sa.Column("run_id", sa.Text(), nullable=False),
+        sa.Column("period_start", sa.DateTime(), nullable=False),
+        sa.Column("period_end", sa.DateTime(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("total_sales", sa.Integer(), nullable=True),
+        sa.Column("total_receipts", sa.Integer(), nullable=True),
+        sa.Column("total_transactions", sa.Integer(), nullable=True),
+        sa.Column("matched_count", sa.Integer(), nullable=True),
+        sa.Column("discrepancies", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("run_id"),
+    )
+    op.create_index(
+        "ix_audit_runs_period",
+        "audit_runs",
+        ["period_start", "period_end"],
+        unique=False,
+    )
+
+    op.create_table(
+        "audit_discrepancies",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("run_id", sa.Text(), nullable=False),
+        sa.Column("type", sa.Text(), nullable=False),
+        sa.Column("machine_id", sa.Text(), nullable=True),
+        sa.Column("datetime", sa.DateTime(), nullable=True),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("amount_difference", sa.Numeric(precision=18, scale=2), nullable=True),
+        sa.Column("severity", sa.Text(), nullable=False),
+        sa.Column("sale_id", sa.Text(), nullable=True),
+        sa.Column("receipt_number", sa.Text(), nullable=True),
+        sa.Column("transaction_id", sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(["run_id"], ["audit_runs.run_id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_audit_discrepancies_run", "audit_discrepancies", ["run_id"], unique=False
+    )
+    op.create_index(
+        "ix_audit_discrepancies_machine_datetime",
+        "audit_discrepancies",
+        ["machine_id", "datetime"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_audit_discrepancies_type_datetime",
+        "audit_discrepancies",
+        ["type", "datetime"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_audit_discrepancies_datetime",
+        "audit_discrepancies",
+        ["datetime"],
+        unique=False,
+    )
+
+    op.create_table(
+        "audit_machine_summaries",
+        sa.Column("run_id", sa.Text(), nullable=False),
+        sa.Column("machine_id", sa.Text(), nullable=False),
+        sa.Column("total_sales", sa.Integer(), nullable=False),
+        sa.Column("total_amount", sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column("discrepancies", sa.Integer(), nullable=False),
+        sa.Column("cash", sa.Integer(), nullable=False),
+        sa.Column("card", sa.Integer(), nullable=False),
+        sa.Column("qr_click", sa.Integer(), nullable=False),
+        sa.Column("qr_payme", sa.Integer(), nullable=False),
+        sa.Column("qr_uzum", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["run_id"], ["audit_runs.run_id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("run_id", "machine_id"),
+    )
+
+    op.create_table(
+        "audit_payment_summaries",
+        sa.Column("run_id", sa.Text(), nullable=False),
+        sa.Column("payment_method", sa.Text(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("amount", sa.Numeric(precision=18, scale=2), nullable=False),
+        sa.Column("matched", sa.Integer(), nullable=False),
+        sa.Column("unmatched", sa.Integer(), nullable=False),
+        sa.Column("success_rate", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["run_id"], ["audit_runs.run_id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("run_id", "payment_method"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("audit_payment_summaries")
+    op.drop_table("audit_machine_summaries")
+    op.drop_index("ix_audit_discrepancies_datetime", table_name="audit_discrepancies")
+    op.drop_index("ix_audit_discrepancies_type_datetime", table_name="audit_discrepancies")
+    op.drop_index("ix_audit_discrepancies_machine_datetime", table_name="audit_discrepancies")
+    op.drop_index("ix_audit_discrepancies_run", table_name="audit_discrepancies")
+    op.drop_table("audit_discrepancies")
+    op.drop_index("ix_audit_runs_period", table_name="audit_runs")
+    op.drop_table("audit_runs")
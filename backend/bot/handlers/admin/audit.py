@@ -1,54 +1,105 @@
 from aiogram import Router, F
 from aiogram.types import Message, FSInputFile
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
+from datetime import datetime, timedelta
 from pathlib import Path
-import subprocess
-import asyncio
 
 from db.models.user import UserRole
 from bot.filters import RoleFilter
+from src.audit.service import AuditJobService, AuditJob, COMPLETED
+from src.audit.utils.period import parse_period
 
 router = Router(name="admin_audit")
 
+AUDIT_DATA_FOLDER = Path('./audit_data/')
+AUDIT_REPORTS_FOLDER = Path('./audit_reports/')
+
+# Период аудита по кнопке: последние полные дни
+DEFAULT_PERIOD_DAYS = 15
+
+# Процессы сверки запускаются вместе с ботом и переиспользуются между заданиями
+audit_service = AuditJobService(workers=1)
+
+
+@router.startup()
+async def start_audit_service():
+    audit_service.start()
+
+
+@router.shutdown()
+async def stop_audit_service():
+    audit_service.shutdown()
+
+
+def default_period() -> tuple[datetime, datetime]:
+    """Последние DEFAULT_PERIOD_DAYS полных дней"""
+    yesterday = datetime.now().date() - timedelta(days=1)
+    start = yesterday - timedelta(days=DEFAULT_PERIOD_DAYS - 1)
+    return parse_period(f"{start.isoformat()}:{yesterday.isoformat()}")
+
+
 @router.message(F.text == "📊 Запустить аудит", RoleFilter(UserRole.ADMIN))
 async def start_audit(message: Message, state: FSMContext):
     """Запуск аудита через Telegram"""
-    await message.answer(
-        "🔍 Запуск аудита...\n"
-        "Это может занять несколько минут."
-    )
-    
+    await submit_audit(message, *default_period())
+
+
+@router.message(Command("audit"), RoleFilter(UserRole.ADMIN))
+async def audit_command(message: Message, command: CommandObject, state: FSMContext):
+    """Аудит за период: /audit YYYY-MM-DD:YYYY-MM-DD"""
+    if not command.args:
+        await submit_audit(message, *default_period())
+        return
+
     try:
-        # Запускаем аудит в отдельном процессе
-        process = await asyncio.create_subprocess_exec(
-            'python', '-m', 'src.audit.main',
-            '--period', '2025-06-01:2025-06-15',
-            '--upload-folder', './audit_data/',
-            '--output-folder', './audit_reports/',
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode == 0:
-            # Отправляем отчет
-            report_files = list(Path('./audit_reports/').glob('audit_report_*.xlsx'))
-            if report_files:
-                latest_report = max(report_files, key=lambda p: p.stat().st_mtime)
-                
-                await message.answer_document(
-                    FSInputFile(latest_report),
-                    caption="✅ Аудит завершен успешно!"
-                )
-            else:
-                await message.answer("⚠️ Аудит завершен, но отчет не найден.")
-        else:
+        period_start, period_end = parse_period(command.args.strip())
+    except ValueError:
+        await message.answer("⚠️ Укажите период в формате /audit YYYY-MM-DD:YYYY-MM-DD")
+        return
+
+    await submit_audit(message, period_start, period_end)
+
+
+async def submit_audit(message: Message, period_start: datetime, period_end: datetime):
+    """Постановка аудита в очередь; отчет отправляется по завершении"""
+
+    async def send_result(job: AuditJob):
+        if job.status != COMPLETED:
             await message.answer(
                 f"❌ Ошибка при выполнении аудита:\n"
-                f"```\n{stderr.decode()[-500:]}\n```",
+                f"```\n{(job.error or '')[-500:]}\n```",
                 parse_mode="Markdown"
             )
-            
+            return
+
+        report_files = [path for path in job.reports if path.suffix == '.xlsx']
+        if report_files:
+            caption = (f"✅ Аудит завершен успешно!\n"
+                       f"Сверено: {job.summary['matched_count']} из {job.summary['total_sales']}, "
+                       f"несоответствий: {job.summary['discrepancies']}")
+            if 'consumption_variances' in job.summary:
+                caption += f"\nОтклонений расхода ингредиентов: {job.summary['consumption_variances']}"
+            await message.answer_document(FSInputFile(report_files[0]), caption=caption)
+        else:
+            await message.answer("⚠️ Аудит завершен, но отчет не найден.")
+
+    period = f"{period_start.date()} - {period_end.date()}"
+    try:
+        job, created = audit_service.submit(
+            period_start, period_end, AUDIT_DATA_FOLDER, AUDIT_REPORTS_FOLDER, on_finish=send_result
+        )
     except Exception as e:
-        await message.answer(f"❌ Ошибка: {str(e)}")
\ No newline at end of file
+        await message.answer(f"❌ Ошибка: {str(e)}")
+        return
+
+    if created:
+        await message.answer(
+            f"🔍 Запуск аудита за {period}...\n"
+            "Отчет придет, когда аудит завершится."
+        )
+    else:
+        await message.answer(
+            f"⏳ Аудит за {period} уже выполняется.\n"
+            "Отчет придет, когда он завершится."
+        )
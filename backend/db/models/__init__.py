@@ -11,6 +11,12 @@ from .base import (
     HopperStatus,
     Ingredient
 )
+from .audit import (
+    AuditRun,
+    AuditDiscrepancy,
+    AuditMachineSummary,
+    AuditPaymentSummary
+)
 
 __all__ = [
     'Base',
@@ -22,5 +28,9 @@ __all__ = [
     'MachineStatus',
     'Hopper',
     'HopperStatus',
-    'Ingredient'
+    'Ingredient',
+    'AuditRun',
+    'AuditDiscrepancy',
+    'AuditMachineSummary',
+    'AuditPaymentSummary'
 ]
@@ -0,0 +1,90 @@
+# Module import: the audit_discrepancies.datetime column would shadow the datetime type in annotations
+import datetime as dt
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import BigInteger, DateTime, Float, ForeignKey, Index, Integer, Numeric, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class AuditRun(Base):
+    """Audit reconciliation run (written by src.audit PostgresResultStore)"""
+    __tablename__ = "audit_runs"
+    __table_args__ = (
+        Index('ix_audit_runs_period', 'period_start', 'period_end'),
+    )
+
+    run_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    period_start: Mapped[dt.datetime] = mapped_column(DateTime, nullable=False)
+    period_end: Mapped[dt.datetime] = mapped_column(DateTime, nullable=False)
+    status: Mapped[str] = mapped_column(Text, nullable=False)
+    started_at: Mapped[dt.datetime] = mapped_column(DateTime, nullable=False)
+    finished_at: Mapped[Optional[dt.datetime]] = mapped_column(DateTime, nullable=True)
+    total_sales: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    total_receipts: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    total_transactions: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    matched_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    discrepancies: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+
+class AuditDiscrepancy(Base):
+    """Discrepancy found by an audit run"""
+    __tablename__ = "audit_discrepancies"
+    __table_args__ = (
+        Index('ix_audit_discrepancies_run', 'run_id'),
+        Index('ix_audit_discrepancies_machine_datetime', 'machine_id', 'datetime'),
+        Index('ix_audit_discrepancies_type_datetime', 'type', 'datetime'),
+        Index('ix_audit_discrepancies_datetime', 'datetime'),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    run_id: Mapped[str] = mapped_column(Text, ForeignKey('audit_runs.run_id', ondelete='CASCADE'), nullable=False)
+    type: Mapped[str] = mapped_column(Text, nullable=False)
+    machine_id: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    datetime: Mapped[Optional[dt.datetime]] = mapped_column(DateTime, nullable=True)
+    description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    amount_difference: Mapped[Optional[Decimal]] = mapped_column(Numeric(18, 2), nullable=True)
+    severity: Mapped[str] = mapped_column(Text, nullable=False)
+    sale_id: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    receipt_number: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    transaction_id: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+
+class AuditMachineSummary(Base):
+    """Per-machine summary of an audit run"""
+    __tablename__ = "audit_machine_summaries"
+
+    run_id: Mapped[str] = mapped_column(Text, ForeignKey('audit_runs.run_id', ondelete='CASCADE'), primary_key=True)
+    machine_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    total_sales: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_amount: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
+    discrepancies: Mapped[int] = mapped_column(Integer, nullable=False)
+    cash: Mapped[int] = mapped_column(Integer, nullable=False)
+    card: Mapped[int] = mapped_column(Integer, nullable=False)
+    qr_click: Mapped[int] = mapped_column(Integer, nullable=False)
+    qr_payme: Mapped[int] = mapped_column(Integer, nullable=False)
+    qr_uzum: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class AuditPaymentSummary(Base):
+    """Per-payment-method summary of an audit run"""
+    __tablename__ = "audit_payment_summaries"
+
+    run_id: Mapped[str] = mapped_column(Text, ForeignKey('audit_runs.run_id', ondelete='CASCADE'), primary_key=True)
+    payment_method: Mapped[str] = mapped_column(Text, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+    amount: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
+    matched: Mapped[int] = mapped_column(Integer, nullable=False)
+    unmatched: Mapped[int] = mapped_column(Integer, nullable=False)
+    success_rate: Mapped[float] = mapped_column(Float, nullable=False)
+
+
+# Tables of the audit history, in creation order
+AUDIT_TABLES = [
+    AuditRun.__table__,
+    AuditDiscrepancy.__table__,
+    AuditMachineSummary.__table__,
+    AuditPaymentSummary.__table__
+]
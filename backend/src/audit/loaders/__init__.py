@@ -0,0 +1,21 @@
+from .base_loader import BaseLoader
+from .sales_loader import SalesLoader
+from .fiscal_loader import FiscalReceiptLoader
+from .qr_loader import QRTransactionLoader
+from .recipe_loader import RecipeLoader
+from .inventory_loader import InventoryLoader
+from .cache import LoaderCache
+from .parallel import LoadTask, LoadResult, load_files
+
+__all__ = [
+    'BaseLoader',
+    'SalesLoader',
+    'FiscalReceiptLoader',
+    'QRTransactionLoader',
+    'RecipeLoader',
+    'InventoryLoader',
+    'LoaderCache',
+    'LoadTask',
+    'LoadResult',
+    'load_files',
+]
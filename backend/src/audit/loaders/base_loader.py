@@ -1,13 +1,27 @@
 from abc import ABC, abstractmethod
-from typing import List, Any
+from typing import List, Dict, Any, Iterator, Optional, Callable
+from decimal import Decimal, InvalidOperation
 import logging
+import warnings
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+from ..models.audit_models import to_tiyin, to_local, LOCAL_TIMEZONE
+from ..models.record_batch import RecordBatch
+
 logger = logging.getLogger(__name__)
 
 class BaseLoader(ABC):
     """Базовый класс для загрузчиков данных"""
     
+    # Размер порции строк при потоковом чтении
+    CHUNK_SIZE = 50000
+    
+    # Вид записей для RecordBatch ('sales', 'receipts', 'qr_transactions')
+    RECORD_KIND: Optional[str] = None
+    
     def __init__(self, filepath: Path):
         self.filepath = filepath
         if not filepath.exists():
@@ -18,8 +32,163 @@ class BaseLoader(ABC):
         """Загрузка данных из файла"""
         pass
     
+    def stream(self, chunk_size: Optional[int] = None) -> Iterator[Any]:
+        """Потоковая загрузка: записи отдаются по одной
+        
+        По умолчанию файл загружается целиком; загрузчики больших файлов
+        переопределяют метод и читают файл порциями.
+        """
+        return iter(self.load())
+    
+    def iter_batches(self, chunk_size: Optional[int] = None) -> Iterator[RecordBatch]:
+        """Записи порциями RecordBatch
+        
+        По умолчанию пакеты собираются из объектов записей (порциями
+        iter_chunks, если загрузчик их поддерживает); загрузчики Excel
+        переопределяют метод и строят пакеты прямо из колонок.
+        """
+        if self.RECORD_KIND is None:
+            raise NotImplementedError(f"{type(self).__name__} does not produce record batches")
+        
+        iter_chunks = getattr(self, 'iter_chunks', None)
+        chunks = iter_chunks(chunk_size) if iter_chunks else [self.load()]
+        for records in chunks:
+            yield RecordBatch.from_records(self.RECORD_KIND, records)
+    
+    def load_batch(self, chunk_size: Optional[int] = None) -> RecordBatch:
+        """Загрузка всех записей файла одним RecordBatch"""
+        batches = list(self.iter_batches(chunk_size))
+        if not batches:
+            return RecordBatch.from_records(self.RECORD_KIND, [])
+        return RecordBatch.concat(batches)
+    
+    def cache_key(self) -> str:
+        """Ключ загрузчика в кеше разобранных файлов (класс и параметры разбора)"""
+        return type(self).__name__
+    
+    def read_raw_row(self, row: int) -> Optional[Dict[str, Any]]:
+        """Исходная строка файла по номеру строки данных (raw_row записи)
+        
+        Записи не хранят копию исходной строки; для отладки она читается
+        из файла заново. По умолчанию - строка первого листа Excel.
+        """
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(self.filepath, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            header = next(sheet.iter_rows(max_row=1, values_only=True), None)
+            values = next(sheet.iter_rows(min_row=row + 2, max_row=row + 2, values_only=True), None)
+            if header is None or values is None:
+                return None
+            return dict(zip((str(name) for name in header), values))
+        finally:
+            workbook.close()
+    
     def validate_headers(self, headers: List[str], required: List[str]):
         """Проверка наличия обязательных колонок"""
         missing = set(required) - set(headers)
         if missing:
-            raise ValueError(f"Missing required columns: {missing}")
\ No newline at end of file
+            raise ValueError(f"Missing required columns: {missing}")
+    
+    def read_excel_chunks(self, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Чтение первого листа Excel порциями DataFrame
+        
+        Книга открывается openpyxl в режиме read_only, поэтому в памяти
+        одновременно находится не больше chunk_size строк. Первая строка -
+        заголовки. Индекс порций сквозной (номер строки данных, как у
+        pd.read_excel), полностью пустые строки пропускаются. Для листа без
+        данных отдается одна пустая порция с заголовками.
+        """
+        from openpyxl import load_workbook
+        
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        workbook = load_workbook(self.filepath, read_only=True, data_only=True)
+        
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            
+            columns = [str(name) for name in header]
+            width = len(columns)
+            
+            chunk, index = [], []
+            yielded = False
+            for position, row in enumerate(rows):
+                if all(value is None for value in row):
+                    continue
+                
+                chunk.append(row[:width] + (None,) * (width - len(row)))
+                index.append(position)
+                
+                if len(chunk) >= chunk_size:
+                    yield self._chunk_frame(chunk, columns, index)
+                    chunk, index = [], []
+                    yielded = True
+            
+            if chunk or not yielded:
+                yield self._chunk_frame(chunk, columns, index)
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _chunk_frame(rows: List[tuple], columns: List[str], index: List[int]) -> pd.DataFrame:
+        """DataFrame порции; пустые ячейки - NaN, как у pd.read_excel"""
+        df = pd.DataFrame(rows, columns=columns, index=index)
+        text_columns = df.select_dtypes(object).columns
+        df[text_columns] = df[text_columns].where(df[text_columns].notna(), np.nan)
+        return df
+    
+    @staticmethod
+    def _parse_datetime_column(column: pd.Series) -> pd.Series:
+        """Дата и время колонкой (строки разбираются, значения Excel берутся как есть); ошибки - NaT
+
+        Колонка с одним часовым поясом остается с поясом (в местное время
+        ее переводит _timestamp_column), значения с разными поясами или
+        с поясом и без переводятся в местное время по одному (to_local).
+        """
+        if pd.api.types.is_datetime64_any_dtype(column):
+            return column
+        with warnings.catch_warnings():
+            # Разные часовые пояса pandas отдает колонкой объектов datetime
+            warnings.simplefilter('ignore', FutureWarning)
+            parsed = pd.to_datetime(column, errors='coerce', format='mixed')
+        if parsed.dtype == object:
+            parsed = pd.to_datetime(parsed.map(to_local, na_action='ignore'), errors='coerce')
+        return parsed
+    
+    @staticmethod
+    def _parse_tiyin_column(column: pd.Series,
+                            normalize: Optional[Callable[[Decimal], Decimal]] = None) -> pd.Series:
+        """Суммы колонкой в целых тийинах: каждое уникальное значение разбирается один раз
+
+        Неразбираемые и пустые значения - None. normalize применяется к
+        каждой разобранной сумме до перевода в тийины (например, перевод
+        сумм, выгруженных в тийинах, в сумы).
+        """
+        codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        
+        amounts = np.empty(len(uniques), dtype=object)
+        for position, value in enumerate(uniques):
+            try:
+                amount = Decimal(str(value))
+            except InvalidOperation:
+                continue
+            # NaN (пустая ячейка) не дает корректной суммы
+            if amount.is_finite():
+                amounts[position] = to_tiyin(normalize(amount) if normalize else amount)
+        
+        return pd.Series(amounts[codes], index=column.index)
+    
+    @staticmethod
+    def _timestamp_column(datetimes: pd.DatetimeIndex) -> np.ndarray:
+        """Микросекунды от эпохи для дат без пропусков
+
+        Время с часовым поясом переводится в местное (как to_timestamp),
+        а не берется как время UTC.
+        """
+        if datetimes.tz is not None:
+            datetimes = datetimes.tz_convert(LOCAL_TIMEZONE).tz_localize(None)
+        return datetimes.asi8 // 1000
@@ -0,0 +1,198 @@
+from typing import Any, Iterator, Optional, Iterable
+from itertools import islice
+from pathlib import Path
+import hashlib
+import logging
+import os
+import pickle
+
+from ..utils.files import FileFingerprint, file_sha256
+from .base_loader import BaseLoader
+
+logger = logging.getLogger(__name__)
+
+
+class LoaderCache:
+    """Кеш разобранных входных файлов
+
+    Для каждой пары (файл, загрузчик) хранятся два файла:
+    <key>.meta - отпечаток входного файла (путь, размер, mtime, SHA-256)
+    и <key>.pkl - записи загрузчика в pickle (протокол 5) порциями.
+    Запись кеша действительна, если совпадают размер и mtime файла, а
+    при их расхождении - хеш содержимого (файл скопирован или "тронут").
+    Любое изменение содержимого приводит к повторному разбору.
+    """
+
+    # Версия формата записей: увеличивается при изменении разбора в загрузчиках
+    VERSION = 2
+
+    PROTOCOL = 5
+
+    # Последняя запись файла порций; без нее запись кеша обрезана
+    END_MARKER = pickle.dumps(None, protocol=PROTOCOL)
+
+    def __init__(self, cache_folder: Path):
+        self.cache_folder = cache_folder
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+
+    def load(self, loader: BaseLoader) -> Any:
+        """Результат loader.load() из кеша или с разбором файла"""
+        meta = self._valid_meta(loader)
+        if meta is not None:
+            try:
+                chunks = list(self._read_chunks(loader, meta))
+            except Exception as e:
+                logger.warning(f"Cache: broken entry for {loader.filepath}, parsing again: {e}")
+            else:
+                if meta['records'] == 'object':
+                    return chunks[0]
+                return [record for chunk in chunks for record in chunk]
+
+        fingerprint = FileFingerprint.of(loader.filepath)
+        records = loader.load()
+        kind = 'list' if isinstance(records, list) else 'object'
+        for _ in self._write_chunks(loader, fingerprint, kind, [records]):
+            pass
+
+        return records
+
+    def stream(self, loader: BaseLoader, chunk_size: Optional[int] = None) -> Iterator[Any]:
+        """Потоковый вариант: записи из кеша или из loader.iter_chunks()
+
+        При промахе кеш заполняется по мере чтения и сохраняется, только
+        если генератор дочитан до конца. Поврежденная запись кеша, как и в
+        load(), приводит к разбору файла: обрезанная обнаруживается до
+        первой записи, а при ошибке посреди чтения уже отданные записи
+        пропускаются.
+        """
+        yielded = 0
+        meta = self._valid_meta(loader)
+        if meta is not None:
+            try:
+                for chunk in self._read_chunks(loader, meta):
+                    yield from chunk
+                    yielded += len(chunk)
+                return
+            except Exception as e:
+                logger.warning(f"Cache: broken entry for {loader.filepath}, parsing again "
+                               f"(skipping {yielded} records already read): {e}")
+
+        iter_chunks = getattr(loader, 'iter_chunks', None)
+        if iter_chunks is None:
+            yield from islice(self.load(loader), yielded, None)
+            return
+
+        fingerprint = FileFingerprint.of(loader.filepath)
+        records = (
+            record
+            for chunk in self._write_chunks(loader, fingerprint, 'list', iter_chunks(chunk_size))
+            for record in chunk
+        )
+        yield from islice(records, yielded, None)
+
+    def _paths(self, loader: BaseLoader):
+        """Пути файлов записи кеша для загрузчика"""
+        source = f"{loader.filepath.resolve()}|{loader.cache_key()}"
+        key = hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+        return self.cache_folder / f"{key}.meta", self.cache_folder / f"{key}.pkl"
+
+    def _valid_meta(self, loader: BaseLoader) -> Optional[dict]:
+        """Метаданные записи кеша, если она соответствует текущему файлу"""
+        meta_path, data_path = self._paths(loader)
+        if not meta_path.exists() or not data_path.exists():
+            return None
+
+        try:
+            with open(meta_path, 'rb') as file:
+                meta = pickle.load(file)
+        except Exception as e:
+            logger.warning(f"Cache: unreadable entry {meta_path}: {e}")
+            return None
+
+        if meta.get('version') != self.VERSION or meta.get('loader') != loader.cache_key():
+            return None
+
+        fingerprint: FileFingerprint = meta['fingerprint']
+        path = loader.filepath
+        if fingerprint.path == str(path.resolve()) and fingerprint.matches_stat(path):
+            logger.info(f"Cache: using parsed {path}")
+            return meta
+
+        if file_sha256(path) == fingerprint.sha256:
+            # Содержимое прежнее - обновляем только отпечаток
+            meta['fingerprint'] = FileFingerprint.of(path)
+            self._write_meta(meta_path, meta)
+            logger.info(f"Cache: content of {path} is unchanged")
+            return meta
+
+        logger.info(f"Cache: {path} changed, parsing again")
+        return None
+
+    def _read_chunks(self, loader: BaseLoader, meta: dict) -> Iterator[Any]:
+        """Порции записей из файла кеша
+
+        Несоответствие метаданным и обрезанный файл обнаруживаются до
+        первой порции.
+        """
+        _, data_path = self._paths(loader)
+
+        with open(data_path, 'rb') as file:
+            sha256 = pickle.load(file)
+            if sha256 != meta['fingerprint'].sha256:
+                raise ValueError(f"Cache entry {data_path} does not match its metadata")
+
+            position = file.tell()
+            file.seek(-len(self.END_MARKER), os.SEEK_END)
+            if file.tell() < position or file.read() != self.END_MARKER:
+                raise ValueError(f"Cache entry {data_path} is truncated")
+            file.seek(position)
+
+            while True:
+                chunk = pickle.load(file)
+                if chunk is None:
+                    break
+                yield chunk
+
+    def _write_chunks(self,
+                      loader: BaseLoader,
+                      fingerprint: FileFingerprint,
+                      kind: str,
+                      chunks: Iterable[Any]) -> Iterator[Any]:
+        """Запись порций в кеш с их передачей дальше
+
+        Файлы пишутся во временные и атомарно заменяют запись кеша
+        только после последней порции.
+        """
+        meta_path, data_path = self._paths(loader)
+        temp_path = data_path.with_name(f'{data_path.name}.{os.getpid()}.tmp')
+        count = 0
+
+        try:
+            with open(temp_path, 'wb') as file:
+                pickle.dump(fingerprint.sha256, file, protocol=self.PROTOCOL)
+                for chunk in chunks:
+                    pickle.dump(chunk, file, protocol=self.PROTOCOL)
+                    count += len(chunk)
+                    yield chunk
+                pickle.dump(None, file, protocol=self.PROTOCOL)
+
+            os.replace(temp_path, data_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+        self._write_meta(meta_path, {
+            'version': self.VERSION,
+            'loader': loader.cache_key(),
+            'fingerprint': fingerprint,
+            'records': kind,
+            'count': count
+        })
+        logger.info(f"Cache: saved {count} parsed records of {loader.filepath}")
+
+    def _write_meta(self, meta_path: Path, meta: dict):
+        """Атомарная запись метаданных"""
+        temp_path = meta_path.with_name(f'{meta_path.name}.{os.getpid()}.tmp')
+        with open(temp_path, 'wb') as file:
+            pickle.dump(meta, file, protocol=self.PROTOCOL)
+        os.replace(temp_path, meta_path)
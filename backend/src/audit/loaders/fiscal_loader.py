@@ -1,87 +1,185 @@
-import pandas as pd
 import csv
 from datetime import datetime
 from decimal import Decimal
-from typing import List
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional
 from pathlib import Path
 import logging
 
-from ..models.audit_models import FiscalReceipt, PaymentMethod
+from ..models.audit_models import FiscalReceipt, PaymentMethod, to_tiyin, to_timestamp
 from .base_loader import BaseLoader
 
 logger = logging.getLogger(__name__)
 
+# Формат даты и времени в выгрузке ККМ
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+@lru_cache(maxsize=65536)
+def parse_receipt_timestamp(value: str) -> int:
+    """Время чека в микросекундах от эпохи (см. parse_receipt_datetime)
+    
+    Чеки разных машин часто приходятся на одну секунду, поэтому
+    результаты кешируются.
+    """
+    return to_timestamp(parse_receipt_datetime(value))
+
+
+@lru_cache(maxsize=4096)
+def parse_receipt_items(items_str: str) -> tuple:
+    """Позиции чека "Product1:150;Product2:200" - пары (название, сумма)
+    
+    Кеш ограничен: строки позиций повторяются только у одинаковых
+    чеков, идущих рядом (например, одна машина подряд продает один товар).
+    """
+    items = []
+    for item in items_str.split(';'):
+        if ':' in item:
+            name, amount = item.split(':', 1)
+            items.append((name.strip(), Decimal(amount.strip())))
+    return tuple(items)
+
+
+def parse_receipt_datetime(value: str) -> datetime:
+    """Разбор 'YYYY-MM-DD HH:MM:SS' по фиксированным позициям
+    
+    Строки другого вида разбираются strptime (с той же ошибкой для
+    некорректных значений).
+    """
+    if (len(value) == 19 and value[4] == '-' and value[7] == '-' and value[10] == ' '
+            and value[13] == ':' and value[16] == ':'):
+        try:
+            return datetime(
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19])
+            )
+        except ValueError:
+            pass
+    return datetime.strptime(value, DATETIME_FORMAT)
+
+
 class FiscalReceiptLoader(BaseLoader):
     """Загрузчик фискальных чеков"""
     
+    RECORD_KIND = 'receipts'
+    
     REQUIRED_COLUMNS = [
-        'receipt_number', 'machine_id', 'datetime', 
+        'receipt_number', 'machine_id', 'datetime',
         'amount', 'payment_method'
     ]
     
+    def __init__(self, filepath: Path):
+        super().__init__(filepath)
+        
+        # Таблицы значений, заполняемые по мере чтения: в выгрузке мало различных
+        # методов оплаты и сумм, поэтому каждая строка разбирается один раз
+        self._payment_methods: Dict[str, PaymentMethod] = {}
+        self._amounts: Dict[str, int] = {}
+    
     def load(self) -> List[FiscalReceipt]:
         """Загрузка чеков из CSV файла"""
+        return list(self.stream())
+    
+    def stream(self, chunk_size: Optional[int] = None) -> Iterator[FiscalReceipt]:
+        """Потоковая загрузка чеков"""
         logger.info(f"Loading fiscal receipts from {self.filepath}")
         
         try:
-            receipts = []
-            
-            with open(self.filepath, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                self.validate_headers(reader.fieldnames, self.REQUIRED_COLUMNS)
-                
-                for idx, row in enumerate(reader):
-                    try:
-                        receipt = self._parse_receipt(row, idx)
-                        receipts.append(receipt)
-                    except Exception as e:
-                        logger.error(f"Error parsing row {idx}: {e}")
-                        continue
+            count = 0
+            for receipts in self.iter_chunks(chunk_size):
+                count += len(receipts)
+                yield from receipts
             
-            logger.info(f"Loaded {len(receipts)} fiscal receipts")
-            return receipts
+            logger.info(f"Loaded {count} fiscal receipts")
             
         except Exception as e:
             logger.error(f"Error loading fiscal receipts: {e}")
             raise
     
-    def _parse_receipt(self, row: dict, idx: int) -> FiscalReceipt:
-        """Парсинг фискального чека"""
-        # Парсим дату и время
-        dt = datetime.strptime(row['datetime'], '%Y-%m-%d %H:%M:%S')
+    def iter_chunks(self, chunk_size: Optional[int] = None) -> Iterator[List[FiscalReceipt]]:
+        """Чеки порциями по chunk_size строк
         
-        # Определяем метод оплаты
-        payment_str = row['payment_method'].lower()
-        if 'cash' in payment_str or 'налич' in payment_str:
-            payment_method = PaymentMethod.CASH
-        elif 'card' in payment_str or 'карт' in payment_str:
-            payment_method = PaymentMethod.CARD
-        else:
-            payment_method = PaymentMethod.UNKNOWN
+        CSV читается csv.reader, колонки берутся по индексу из заголовка.
+        """
+        chunk_size = chunk_size or self.CHUNK_SIZE
         
-        return FiscalReceipt(
-            receipt_number=row['receipt_number'],
-            machine_id=str(row['machine_id']),
-            datetime=dt,
-            amount=Decimal(row['amount']),
-            payment_method=payment_method,
-            items=self._parse_items(row.get('items', '')),
-            raw_data=row
-        )
+        with open(self.filepath, 'r', encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            self.validate_headers(header, self.REQUIRED_COLUMNS)
+            
+            number_col, machine_col, datetime_col, amount_col, method_col = (
+                header.index(column) for column in self.REQUIRED_COLUMNS
+            )
+            items_col = header.index('items') if 'items' in header else None
+            
+            receipts = []
+            idx = -1
+            for row in reader:
+                if not row:
+                    continue
+                idx += 1
+                
+                try:
+                    items = row[items_col] if items_col is not None and items_col < len(row) else ''
+                    receipts.append(FiscalReceipt.from_epoch(
+                        receipt_number=row[number_col],
+                        machine_id=row[machine_col],
+                        timestamp=parse_receipt_timestamp(row[datetime_col]),
+                        amount_tiyin=self._parse_amount(row[amount_col]),
+                        payment_method=self._map_payment_method(row[method_col]),
+                        items=self._parse_items(items),
+                        raw_row=idx
+                    ))
+                except Exception as e:
+                    logger.error(f"Error parsing row {idx}: {e}")
+                    continue
+                
+                if len(receipts) >= chunk_size:
+                    yield receipts
+                    receipts = []
+            
+            if receipts:
+                yield receipts
+    
+    def read_raw_row(self, row: int) -> Optional[Dict[str, Any]]:
+        """Исходная строка CSV по номеру непустой строки данных (raw_row чека)"""
+        with open(self.filepath, 'r', encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            idx = -1
+            for values in reader:
+                if not values:
+                    continue
+                idx += 1
+                if idx == row:
+                    return dict(zip(header, values))
+        return None
+    
+    def _parse_amount(self, value: str) -> int:
+        """Сумма чека в целых тийинах (с кешем по строке)"""
+        amount = self._amounts.get(value)
+        if amount is None:
+            amount = to_tiyin(Decimal(value))
+            self._amounts[value] = amount
+        return amount
+    
+    def _map_payment_method(self, value: str) -> PaymentMethod:
+        """Метод оплаты по строке выгрузки (с кешем по строке)"""
+        payment_method = self._payment_methods.get(value)
+        if payment_method is None:
+            payment_str = value.lower()
+            if 'cash' in payment_str or 'налич' in payment_str:
+                payment_method = PaymentMethod.CASH
+            elif 'card' in payment_str or 'карт' in payment_str:
+                payment_method = PaymentMethod.CARD
+            else:
+                payment_method = PaymentMethod.UNKNOWN
+            self._payment_methods[value] = payment_method
+        return payment_method
     
     def _parse_items(self, items_str: str) -> List[Dict[str, Any]]:
-        """Парсинг позиций чека"""
+        """Парсинг позиций чека (словари - новые для каждого чека)"""
         if not items_str:
             return []
-        
-        items = []
-        # Предполагаем формат: "Product1:150;Product2:200"
-        for item in items_str.split(';'):
-            if ':' in item:
-                name, amount = item.split(':', 1)
-                items.append({
-                    'name': name.strip(),
-                    'amount': Decimal(amount.strip())
-                })
-        
-        return items
\ No newline at end of file
+        return [{'name': name, 'amount': amount} for name, amount in parse_receipt_items(items_str)]
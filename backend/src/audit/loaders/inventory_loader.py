@@ -0,0 +1,67 @@
+import csv
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Dict, Any, Optional
+from pathlib import Path
+import logging
+
+from ..models.audit_models import InventoryMovement, to_local
+from .base_loader import BaseLoader
+
+logger = logging.getLogger(__name__)
+
+class InventoryLoader(BaseLoader):
+    """Загрузчик движений ингредиентов (пополнения бункеров машин)"""
+    
+    REQUIRED_COLUMNS = [
+        'datetime', 'machine_id', 'ingredient_code', 'quantity', 'movement_type'
+    ]
+    
+    def load(self) -> List[InventoryMovement]:
+        """Загрузка движений из CSV файла
+        
+        Время - ISO 8601 ('YYYY-MM-DD HH:MM:SS', допускается смещение
+        часового пояса - оно переводится в местное время).
+        """
+        logger.info(f"Loading inventory movements from {self.filepath}")
+        
+        try:
+            movements = []
+            with open(self.filepath, 'r', encoding='utf-8', newline='') as file:
+                reader = csv.DictReader(file)
+                self.validate_headers(reader.fieldnames or [], self.REQUIRED_COLUMNS)
+                
+                for idx, row in enumerate(reader):
+                    try:
+                        movements.append(self._parse_movement(row))
+                    except Exception as e:
+                        logger.error(f"Error parsing row {idx}: {e}")
+                        continue
+            
+            logger.info(f"Loaded {len(movements)} inventory movements")
+            return movements
+            
+        except Exception as e:
+            logger.error(f"Error loading inventory movements: {e}")
+            raise
+    
+    def read_raw_row(self, row: int) -> Optional[Dict[str, Any]]:
+        """Исходная строка CSV по номеру строки данных"""
+        with open(self.filepath, 'r', encoding='utf-8', newline='') as file:
+            for idx, values in enumerate(csv.DictReader(file)):
+                if idx == row:
+                    return values
+        return None
+    
+    def _parse_movement(self, row: Dict[str, str]) -> InventoryMovement:
+        """Парсинг движения ингредиента"""
+        return InventoryMovement(
+            datetime=to_local(datetime.fromisoformat(row['datetime'].strip())),
+            machine_id=row['machine_id'],
+            ingredient_code=row['ingredient_code'],
+            ingredient_name=row.get('ingredient_name') or row['ingredient_code'],
+            quantity=Decimal(row['quantity'].strip()),
+            unit=row.get('unit') or 'g',
+            movement_type=row['movement_type'].strip().lower(),
+            operator_id=row.get('operator_id') or None
+        )
@@ -0,0 +1,127 @@
+from typing import List, Any, Callable, Optional
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import logging
+import os
+import time
+
+from .base_loader import BaseLoader
+from .cache import LoaderCache
+
+logger = logging.getLogger(__name__)
+
+
+class LoadTask:
+    """Входной файл для загрузки: источник, ключ данных, путь и фабрика загрузчика
+
+    Фабрика передается в рабочий процесс, поэтому должна сериализоваться
+    pickle (класс загрузчика или functools.partial, но не lambda).
+    """
+
+    __slots__ = ('source', 'key', 'path', 'make_loader')
+
+    def __init__(self, source: str, key: str, path: Path, make_loader: Callable[[Path], BaseLoader]):
+        self.source = source
+        self.key = key
+        self.path = path
+        self.make_loader = make_loader
+
+
+class LoadResult:
+    """Результат загрузки файла: записи, время, сообщения журнала и ошибка"""
+
+    __slots__ = ('source', 'key', 'path', 'records', 'elapsed', 'log_records', 'error')
+
+    def __init__(self, source: str, key: str, path: Path):
+        self.source = source
+        self.key = key
+        self.path = path
+        self.records: Any = None
+        self.elapsed = 0.0
+        self.log_records: List[logging.LogRecord] = []
+        self.error: Optional[str] = None
+
+    def count(self, level: int) -> int:
+        """Количество сообщений журнала заданного уровня"""
+        return sum(1 for record in self.log_records if record.levelno == level)
+
+
+class _RecordCollector(logging.Handler):
+    """Сбор сообщений журнала рабочего процесса для передачи в основной процесс"""
+
+    def __init__(self, level: int):
+        super().__init__(level)
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        # Аргументы и исключение форматируются заранее: запись должна сериализоваться
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def load_file(task: LoadTask,
+              cache_folder: Optional[Path] = None,
+              log_level: Optional[int] = None) -> LoadResult:
+    """Загрузка одного файла
+
+    Сообщения журнала загрузчика сохраняются в result.log_records. В
+    рабочем процессе (задан log_level) они не выводятся, а передаются в
+    основной процесс. Исключение загрузчика не пробрасывается, а
+    сохраняется в result.error.
+    """
+    result = LoadResult(task.source, task.key, task.path)
+
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    if log_level is not None:
+        collector = _RecordCollector(log_level)
+        root.handlers = [collector]
+        root.setLevel(log_level)
+    else:
+        collector = _RecordCollector(root.getEffectiveLevel())
+        root.addHandler(collector)
+
+    started = time.perf_counter()
+    try:
+        loader = task.make_loader(task.path)
+        if cache_folder:
+            result.records = LoaderCache(cache_folder).load(loader)
+        else:
+            result.records = loader.load()
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        result.elapsed = time.perf_counter() - started
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+        result.log_records = collector.records
+
+    return result
+
+
+def load_files(tasks: List[LoadTask],
+               cache_folder: Optional[Path] = None,
+               workers: Optional[int] = None) -> List[LoadResult]:
+    """Параллельная загрузка независимых файлов в пуле процессов
+
+    Результаты возвращаются в порядке задач. Сообщения журнала каждого
+    загрузчика выводятся основным процессом подряд, без перемешивания.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        return [load_file(task, cache_folder) for task in tasks]
+
+    log_level = logging.getLogger().getEffectiveLevel()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(load_file, task, cache_folder, log_level) for task in tasks]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        for record in result.log_records:
+            logging.getLogger(record.name).handle(record)
+
+    return results
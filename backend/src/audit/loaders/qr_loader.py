@@ -1,18 +1,33 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from decimal import Decimal
-from typing import List
+from typing import List, Optional, Iterator, Dict
 from pathlib import Path
 import logging
+import re
 
 from ..models.audit_models import QRTransaction
+from ..models.record_batch import RecordBatch, QR_SERVICE_METHODS
 from .base_loader import BaseLoader
 
 logger = logging.getLogger(__name__)
 
+# Паттерны ID машины в порядке приоритета, объединенные в одно выражение:
+# VM[_-]?(\d+), machine[_-]?(\d+), ^(\d+)$, _(\d+)_. Альтернативы привязаны к
+# началу строки и ищут вхождение через .*?, поэтому срабатывает первая по
+# порядку альтернатива (как при последовательных re.search), а не самое
+# левое вхождение любой из них.
+MACHINE_ID_PATTERN = re.compile(
+    r'^(?:.*?VM[_-]?(\d+)|.*?machine[_-]?(\d+)|(\d+)$|.*?_(\d+)_)',
+    re.IGNORECASE | re.DOTALL
+)
+
 class QRTransactionLoader(BaseLoader):
     """Загрузчик QR транзакций"""
     
+    RECORD_KIND = 'qr_transactions'
+    
     # Маппинг колонок для разных платежных систем
     COLUMN_MAPPINGS = {
         'click': {
@@ -38,71 +53,156 @@ class QRTransactionLoader(BaseLoader):
         }
     }
     
+    # Поля QRTransaction в порядке аргументов QRTransaction.from_epoch
+    RECORD_FIELDS = ('transaction_id', 'service', 'timestamp', 'amount_tiyin',
+                     'machine_id', 'status', 'raw_row')
+    
     def __init__(self, filepath: Path, service: str):
         super().__init__(filepath)
         self.service = service.lower()
         if self.service not in self.COLUMN_MAPPINGS:
             raise ValueError(f"Unknown QR service: {service}")
+        
+        # Разобранные ID машин: одни и те же префиксы заказов повторяются тысячи раз
+        self._machine_ids: Dict[str, Optional[str]] = {}
+    
+    def cache_key(self) -> str:
+        """Ключ загрузчика в кеше: записи зависят от платежной системы"""
+        return f"{type(self).__name__}:{self.service}"
     
     def load(self) -> List[QRTransaction]:
         """Загрузка QR транзакций"""
+        return list(self.stream())
+    
+    def stream(self, chunk_size: Optional[int] = None) -> Iterator[QRTransaction]:
+        """Потоковая загрузка QR транзакций: файл читается порциями по chunk_size строк"""
         logger.info(f"Loading {self.service} transactions from {self.filepath}")
         
         try:
-            df = pd.read_excel(self.filepath)
-            transactions = []
-            
-            mapping = self.COLUMN_MAPPINGS[self.service]
-            
-            for idx, row in df.iterrows():
-                try:
-                    transaction = self._parse_transaction(row, mapping, idx)
-                    if transaction:
-                        transactions.append(transaction)
-                except Exception as e:
-                    logger.error(f"Error parsing row {idx}: {e}")
-                    continue
+            count = 0
+            for transactions in self.iter_chunks(chunk_size):
+                count += len(transactions)
+                yield from transactions
             
-            logger.info(f"Loaded {len(transactions)} {self.service} transactions")
-            return transactions
+            logger.info(f"Loaded {count} {self.service} transactions")
             
         except Exception as e:
             logger.error(f"Error loading QR transactions: {e}")
             raise
     
-    def _parse_transaction(self, row: pd.Series, mapping: dict, idx: int) -> QRTransaction:
-        """Парсинг транзакции"""
-        # Получаем значения по маппингу
-        trans_id = str(row.get(mapping['transaction_id'], f"{self.service}_{idx}"))
+    def iter_chunks(self, chunk_size: Optional[int] = None) -> Iterator[List[QRTransaction]]:
+        """QR транзакции порциями: одна порция строк Excel - один список записей"""
+        mapping = self.COLUMN_MAPPINGS[self.service]
+        for df in self.read_excel_chunks(chunk_size):
+            self.validate_headers(df.columns.tolist(), [mapping['datetime']])
+            yield self._parse_frame(df)
+    
+    def iter_batches(self, chunk_size: Optional[int] = None) -> Iterator[RecordBatch]:
+        """QR транзакции порциями RecordBatch без создания объектов записей"""
+        mapping = self.COLUMN_MAPPINGS[self.service]
+        method = QR_SERVICE_METHODS[self.service]
+        for df in self.read_excel_chunks(chunk_size):
+            self.validate_headers(df.columns.tolist(), [mapping['datetime']])
+            columns = self._parse_columns(df)
+            yield RecordBatch.from_columns(
+                'qr_transactions',
+                columns.pop('machine_id'),
+                columns.pop('timestamp'),
+                columns.pop('amount_tiyin'),
+                [method] * len(columns['transaction_id']),
+                columns.pop('raw_row'),
+                **columns
+            )
+    
+    def _parse_frame(self, df: pd.DataFrame) -> List[QRTransaction]:
+        """QR транзакции порции строк (одним проходом по колонкам)"""
+        columns = self._parse_columns(df)
+        return [
+            QRTransaction.from_epoch(*values)
+            for values in zip(*(columns[name].tolist() for name in self.RECORD_FIELDS))
+        ]
+    
+    def _parse_columns(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Поколоночный разбор порции строк
+
+        Суммы и ID машин разбираются по уникальным значениям, дата - одним
+        вызовом на колонку. Возвращает колонки значений полей
+        QRTransaction (RECORD_FIELDS). Строки с неразбираемой датой или
+        суммой пропускаются.
+        """
+        if df.empty:
+            return {name: np.array([], dtype=object) for name in self.RECORD_FIELDS}
+        
+        mapping = self.COLUMN_MAPPINGS[self.service]
+        
+        transaction_ids = self._text_column(df, mapping['transaction_id'], None)
+        if transaction_ids is None:
+            transaction_ids = pd.Series(f"{self.service}_" + df.index.astype(str), index=df.index)
         
-        # Парсим дату
-        dt_value = row.get(mapping['datetime'])
-        if isinstance(dt_value, str):
-            dt = pd.to_datetime(dt_value)
+        datetimes = self._parse_datetime_column(df[mapping['datetime']])
+        
+        # Для некоторых систем сумма может быть в тийинах
+        if mapping['amount'] in df.columns:
+            amounts = self._parse_tiyin_column(df[mapping['amount']], self._normalize_amount)
         else:
-            dt = dt_value
+            amounts = pd.Series(0, index=df.index, dtype=object)
+        
+        # Извлекаем ID машины из merchant_trans_id или order_id
+        machine_ids = self._extract_machine_ids(self._text_column(df, mapping['machine_id'], ''))
+        statuses = self._text_column(df, mapping['status'], 'success')
+        
+        valid = datetimes.notna() & amounts.notna()
+        for idx in df.index[~valid]:
+            logger.error(f"Error parsing row {idx}: invalid datetime or amount")
         
-        # Парсим сумму (для некоторых систем может быть в тийинах)
-        amount = Decimal(str(row.get(mapping['amount'], 0)))
+        return {
+            'transaction_id': transaction_ids[valid].to_numpy(dtype=object),
+            'service': np.full(int(valid.sum()), self.service, dtype=object),
+            'timestamp': self._timestamp_column(pd.DatetimeIndex(datetimes[valid])),
+            'amount_tiyin': amounts[valid].to_numpy(dtype=np.int64),
+            'machine_id': machine_ids[valid].to_numpy(dtype=object),
+            'status': statuses[valid].to_numpy(dtype=object),
+            'raw_row': df.index[valid].to_numpy(dtype=np.int64)
+        }
+    
+    @staticmethod
+    def _text_column(df: pd.DataFrame, column: str, default: Optional[str]) -> Optional[pd.Series]:
+        """Колонка строками (как str(value)) или значение по умолчанию, если колонки нет"""
+        if column in df.columns:
+            return df[column].astype(str)
+        if default is None:
+            return None
+        return pd.Series(default, index=df.index, dtype=object)
+    
+    def _normalize_amount(self, amount: Decimal) -> Decimal:
+        """Перевод суммы из тийинов в сумы для систем, выгружающих тийины"""
         if self.service in ['payme', 'click'] and amount > 10000:
-            amount = amount / 100  # Конвертируем из тийинов в сумы
+            return amount / 100  # Конвертируем из тийинов в сумы
+        return amount
+    
+    def _extract_machine_ids(self, raw_ids: pd.Series) -> pd.Series:
+        """Извлечение ID машин для колонки
+
+        Регулярное выражение применяется один раз к каждому еще не
+        встречавшемуся значению (Series.str.extract), результаты
+        запоминаются на все порции файла.
+        """
+        codes, uniques = pd.factorize(raw_ids, use_na_sentinel=False)
         
-        # Извлекаем ID машины из merchant_trans_id или order_id
-        machine_id = None
-        if mapping.get('machine_id'):
-            machine_id_raw = str(row.get(mapping['machine_id'], ''))
-            # Пытаемся извлечь ID машины из строки
-            machine_id = self._extract_machine_id(machine_id_raw)
+        unknown = [raw_id for raw_id in uniques if raw_id not in self._machine_ids]
+        if unknown:
+            extracted = pd.Series(unknown, dtype=object).str.extract(MACHINE_ID_PATTERN)
+            # Из четырех групп совпадает не больше одной
+            found = extracted.bfill(axis=1).iloc[:, 0]
+            for raw_id, machine_id in zip(unknown, found):
+                if not raw_id:
+                    self._machine_ids[raw_id] = None
+                else:
+                    # Возвращаем как есть, если не смогли распарсить
+                    self._machine_ids[raw_id] = machine_id if isinstance(machine_id, str) else raw_id
         
-        return QRTransaction(
-            transaction_id=trans_id,
-            service=self.service,
-            datetime=dt.to_pydatetime() if hasattr(dt, 'to_pydatetime') else dt,
-            amount=amount,
-            machine_id=machine_id,
-            status=str(row.get(mapping.get('status', 'status'), 'success')),
-            raw_data=row.to_dict()
-        )
+        machine_ids = np.array([self._machine_ids[raw_id] for raw_id in uniques], dtype=object)
+        return pd.Series(machine_ids[codes], index=raw_ids.index)
     
     def _extract_machine_id(self, raw_id: str) -> Optional[str]:
         """Извлечение ID машины из строки"""
@@ -114,20 +214,9 @@ class QRTransactionLoader(BaseLoader):
         if not raw_id:
             return None
         
-        # Пытаемся найти числовой ID
-        import re
-        
-        # Паттерны для поиска ID машины
-        patterns = [
-            r'VM[_-]?(\d+)',
-            r'machine[_-]?(\d+)',
-            r'^(\d+)$',
-            r'_(\d+)_'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, raw_id, re.IGNORECASE)
-            if match:
-                return match.group(1)
+        if raw_id not in self._machine_ids:
+            match = MACHINE_ID_PATTERN.match(raw_id)
+            groups = [group for group in match.groups() if group is not None] if match else []
+            self._machine_ids[raw_id] = groups[0] if groups else raw_id
         
-        return raw_id  # Возвращаем как есть, если не смогли распарсить
\ No newline at end of file
+        return self._machine_ids[raw_id]
@@ -1,11 +1,12 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime
-from decimal import Decimal
-from typing import List
+from typing import List, Dict, Iterator, Optional
 from pathlib import Path
 import logging
 
 from ..models.audit_models import SaleRecord, PaymentMethod
+from ..models.record_batch import RecordBatch
 from .base_loader import BaseLoader
 
 logger = logging.getLogger(__name__)
@@ -13,72 +14,132 @@ logger = logging.getLogger(__name__)
 class SalesLoader(BaseLoader):
     """Загрузчик данных о продажах"""
     
+    RECORD_KIND = 'sales'
+    
     REQUIRED_COLUMNS = [
-        'machine_id', 'datetime', 'product_code', 
+        'machine_id', 'datetime', 'product_code',
         'product_name', 'amount', 'payment_method'
     ]
     
+    # Поля SaleRecord в порядке аргументов SaleRecord.from_epoch
+    RECORD_FIELDS = ('id', 'machine_id', 'timestamp', 'product_code', 'product_name',
+                     'amount_tiyin', 'payment_method', 'quantity', 'raw_row')
+    
+    PAYMENT_METHODS = {
+        'cash': PaymentMethod.CASH,
+        'наличные': PaymentMethod.CASH,
+        'card': PaymentMethod.CARD,
+        'карта': PaymentMethod.CARD,
+        'click': PaymentMethod.QR_CLICK,
+        'payme': PaymentMethod.QR_PAYME,
+        'uzum': PaymentMethod.QR_UZUM,
+        'vip': PaymentMethod.VIP,
+        'test': PaymentMethod.TEST,
+        'тест': PaymentMethod.TEST
+    }
+    
     def load(self) -> List[SaleRecord]:
         """Загрузка продаж из Excel файла"""
+        return list(self.stream())
+    
+    def stream(self, chunk_size: Optional[int] = None) -> Iterator[SaleRecord]:
+        """Потоковая загрузка продаж: файл читается порциями по chunk_size строк"""
         logger.info(f"Loading sales from {self.filepath}")
         
         try:
-            df = pd.read_excel(self.filepath)
-            self.validate_headers(df.columns.tolist(), self.REQUIRED_COLUMNS)
+            count = 0
+            for sales in self.iter_chunks(chunk_size):
+                count += len(sales)
+                yield from sales
             
-            sales = []
-            for idx, row in df.iterrows():
-                try:
-                    sale = self._parse_sale_record(row, idx)
-                    sales.append(sale)
-                except Exception as e:
-                    logger.error(f"Error parsing row {idx}: {e}")
-                    continue
-            
-            logger.info(f"Loaded {len(sales)} sales records")
-            return sales
+            logger.info(f"Loaded {count} sales records")
             
         except Exception as e:
             logger.error(f"Error loading sales: {e}")
             raise
     
-    def _parse_sale_record(self, row: pd.Series, idx: int) -> SaleRecord:
-        """Парсинг записи о продаже"""
-        # Определяем метод оплаты
-        payment_str = str(row['payment_method']).lower()
-        payment_method = self._map_payment_method(payment_str)
+    def iter_chunks(self, chunk_size: Optional[int] = None) -> Iterator[List[SaleRecord]]:
+        """Продажи порциями: одна порция строк Excel - один список записей"""
+        for df in self.read_excel_chunks(chunk_size):
+            self.validate_headers(df.columns.tolist(), self.REQUIRED_COLUMNS)
+            yield self._parse_frame(df)
+    
+    def iter_batches(self, chunk_size: Optional[int] = None) -> Iterator[RecordBatch]:
+        """Продажи порциями RecordBatch без создания объектов записей"""
+        for df in self.read_excel_chunks(chunk_size):
+            self.validate_headers(df.columns.tolist(), self.REQUIRED_COLUMNS)
+            columns = self._parse_columns(df)
+            yield RecordBatch.from_columns(
+                'sales',
+                columns.pop('machine_id'),
+                columns.pop('timestamp'),
+                columns.pop('amount_tiyin'),
+                columns.pop('payment_method'),
+                columns.pop('raw_row'),
+                **columns
+            )
+    
+    def _parse_frame(self, df: pd.DataFrame) -> List[SaleRecord]:
+        """Записи продаж порции строк (одним проходом по колонкам)"""
+        columns = self._parse_columns(df)
+        return [
+            SaleRecord.from_epoch(*values)
+            for values in zip(*(columns[name].tolist() for name in self.RECORD_FIELDS))
+        ]
+    
+    def _parse_columns(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Поколоночный разбор продаж
+        
+        Каждая колонка нормализуется целиком (уникальные значения сумм и
+        методов оплаты разбираются по одному разу). Возвращает колонки
+        значений полей SaleRecord (RECORD_FIELDS). Строки с неразбираемой
+        датой, суммой или количеством пропускаются, как и раньше.
+        """
+        if df.empty:
+            return {name: np.array([], dtype=object) for name in self.RECORD_FIELDS}
+        
+        machine_ids = df['machine_id'].astype(str)
+        datetimes = self._parse_datetime_column(df['datetime'])
+        amounts = self._parse_tiyin_column(df['amount'])
+        payment_methods = self._map_payment_methods(df['payment_method'])
         
-        # Парсим дату и время
-        if isinstance(row['datetime'], str):
-            dt = pd.to_datetime(row['datetime'])
+        if 'quantity' in df.columns:
+            quantities = pd.to_numeric(df['quantity'], errors='coerce')
         else:
-            dt = row['datetime']
+            quantities = pd.Series(1, index=df.index)
+        
+        valid = datetimes.notna() & amounts.notna() & quantities.notna()
+        for idx in df.index[~valid]:
+            logger.error(f"Error parsing row {idx}: invalid datetime, amount or quantity")
+        
+        df = df[valid]
+        machine_ids = machine_ids[valid]
+        timestamps = self._timestamp_column(pd.DatetimeIndex(datetimes[valid]))
         
-        return SaleRecord(
-            id=f"SALE_{idx}_{row['machine_id']}_{dt.timestamp()}",
-            machine_id=str(row['machine_id']),
-            datetime=dt.to_pydatetime(),
-            product_code=str(row['product_code']),
-            product_name=str(row['product_name']),
-            amount=Decimal(str(row['amount'])),
-            payment_method=payment_method,
-            quantity=int(row.get('quantity', 1)),
-            raw_data=row.to_dict()
+        # Тот же формат ID, что и SALE_{idx}_{machine_id}_{Timestamp.timestamp()}
+        ids = 'SALE_' + df.index.astype(str) + '_' + machine_ids + '_' + (timestamps / 1e6).astype(str)
+        
+        return {
+            'id': ids.to_numpy(dtype=object),
+            'machine_id': machine_ids.to_numpy(dtype=object),
+            'timestamp': timestamps,
+            'product_code': df['product_code'].astype(str).to_numpy(dtype=object),
+            'product_name': df['product_name'].astype(str).to_numpy(dtype=object),
+            'amount_tiyin': amounts[valid].to_numpy(dtype=np.int64),
+            'payment_method': payment_methods[valid].to_numpy(dtype=object),
+            'quantity': quantities[valid].to_numpy(dtype=np.int64),
+            'raw_row': df.index.to_numpy(dtype=np.int64)
+        }
+    
+    def _map_payment_methods(self, column: pd.Series) -> pd.Series:
+        """Методы оплаты: строка сопоставляется с enum один раз на уникальное значение"""
+        codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        methods = np.array(
+            [self._map_payment_method(str(value).lower()) for value in uniques],
+            dtype=object
         )
+        return pd.Series(methods[codes], index=column.index)
     
     def _map_payment_method(self, payment_str: str) -> PaymentMethod:
         """Маппинг строки на enum метода оплаты"""
-        mapping = {
-            'cash': PaymentMethod.CASH,
-            'наличные': PaymentMethod.CASH,
-            'card': PaymentMethod.CARD,
-            'карта': PaymentMethod.CARD,
-            'click': PaymentMethod.QR_CLICK,
-            'payme': PaymentMethod.QR_PAYME,
-            'uzum': PaymentMethod.QR_UZUM,
-            'vip': PaymentMethod.VIP,
-            'test': PaymentMethod.TEST,
-            'тест': PaymentMethod.TEST
-        }
-        
-        return mapping.get(payment_str, PaymentMethod.UNKNOWN)
\ No newline at end of file
+        return self.PAYMENT_METHODS.get(payment_str, PaymentMethod.UNKNOWN)
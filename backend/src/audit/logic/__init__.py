@@ -0,0 +1,15 @@
+from .reconciliation import ReconciliationEngine
+from .vectorized import VectorizedReconciliationEngine
+from .parallel import ParallelReconciliationEngine
+from .incremental import IncrementalReconciler
+from .ingredient_analyzer import IngredientAnalyzer
+from .recipe_matrix import RecipeMatrix
+
+__all__ = [
+    'ReconciliationEngine',
+    'VectorizedReconciliationEngine',
+    'ParallelReconciliationEngine',
+    'IncrementalReconciler',
+    'IngredientAnalyzer',
+    'RecipeMatrix',
+]
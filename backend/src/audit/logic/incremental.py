@@ -0,0 +1,344 @@
+from typing import List, Dict, Any, Optional, Iterable
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+import logging
+import pickle
+import shutil
+
+from ..models.audit_models import (
+    SaleRecord, FiscalReceipt, QRTransaction,
+    Discrepancy, ReconciliationResult, to_timestamp
+)
+from .reconciliation import ReconciliationEngine
+from .parallel import (
+    reconcile_shard, SALE_TEST, SALE_MISSING_RECEIPT,
+    SALE_MISSING_TRANSACTION, SALE_UNKNOWN_PAYMENT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class OpenRecord:
+    """Запись "открытого хвоста": результат сверки еще может измениться"""
+
+    __slots__ = ('record', 'flag', 'duplicate', 'context')
+
+    def __init__(self, record: Any, flag: Any = None, duplicate: bool = False, context: bool = False):
+        self.record = record
+        # Для продаж - вид несоответствия (или None), для чеков/транзакций - признак "без продажи"
+        self.flag = flag
+        self.duplicate = duplicate
+        # Запись до начала периода: только пара для записей периода, в итоги не входит
+        self.context = context
+
+
+class IncrementalReconciler:
+    """Инкрементальная сверка по временным окнам
+
+    Данные подаются окнами, упорядоченными по времени: advance() принимает
+    записи с datetime в [watermark, new_watermark). Запись считается
+    окончательной, когда все записи в пределах ее допуска по времени уже
+    получены (datetime < new_watermark - time_tolerance); ее несоответствия
+    и сводка фиксируются. Остальные записи образуют открытый хвост и
+    сверяются заново вместе со следующим окном.
+
+    В режиме по умолчанию совпадение монотонно (новые данные могут только
+    найти пару), поэтому статус записи хвоста - это "И" по несверенности
+    из прошлого и нового прохода, а стоимость шага - O(новые данные + хвост).
+
+    Записи в пределах time_tolerance до начала периода входят в первое
+    окно только как возможные пары (продажа в 00:00:03 находит QR
+    транзакцию в 23:59:58 предыдущего дня), сами они не сверяются и в
+    итоги не входят. Поэтому итог совпадает с полной сверкой записей
+    периода.
+
+    Контрольная точка (save) хранит отметку, итоги и открытый хвост;
+    окончательные несоответствия дописываются в журнал рядом с ней
+    (<контрольная точка>.discrepancies), поэтому размер контрольной точки
+    и время ее записи не растут с периодом.
+    """
+
+    # Суффикс файла журнала несоответствий
+    JOURNAL_SUFFIX = '.discrepancies'
+
+    def __init__(self,
+                 period_start: datetime,
+                 time_tolerance_seconds: int = 30,
+                 amount_tolerance: Decimal = Decimal('1')):
+        self.engine = ReconciliationEngine(time_tolerance_seconds, amount_tolerance)
+        self.period_start = period_start
+        self.watermark = period_start
+
+        self.open_sales: List[OpenRecord] = []
+        self.open_receipts: List[OpenRecord] = []
+        self.open_transactions: List[OpenRecord] = []
+
+        # Окончательные несоответствия, еще не записанные в журнал
+        self.discrepancies: List[Discrepancy] = []
+        self.totals: Optional[ReconciliationResult] = None
+
+        # Журнал несоответствий и его размер на момент записи контрольной точки
+        self.journal: Optional[Path] = None
+        self.journal_size = 0
+
+    def advance(self,
+                sales: Iterable[SaleRecord],
+                receipts: Iterable[FiscalReceipt],
+                qr_transactions: Iterable[QRTransaction],
+                watermark: datetime):
+        """Сверка нового окна [self.watermark, watermark)
+
+        Записи раньше текущей отметки считаются уже обработанными и
+        пропускаются (кроме пар первого окна в пределах допуска до начала
+        периода), записи не раньше новой отметки - ждут следующего окна.
+        Источники могут быть генераторами (потоковая загрузка): в памяти
+        остаются только записи окна.
+        """
+        if watermark < self.watermark:
+            raise ValueError(f"Watermark {watermark} is before current watermark {self.watermark}")
+
+        new_sales = self._window(sales, watermark)
+        new_receipts = self._window(receipts, watermark)
+        new_transactions = self._window(qr_transactions, watermark)
+
+        logger.info(f"Incremental window {self.watermark} - {watermark}: "
+                    f"{len(new_sales)} sales, {len(new_receipts)} receipts, "
+                    f"{len(new_transactions)} QR transactions, "
+                    f"{len(self.open_sales)} open sales in tail")
+
+        self._reconcile_window(new_sales, new_receipts, new_transactions)
+        self.watermark = watermark
+        self._finalize(watermark - self.engine.time_tolerance)
+
+    def result(self, period_end: datetime) -> ReconciliationResult:
+        """Результат сверки с начала периода (открытый хвост - по текущему статусу)"""
+        discrepancies, tail_summary = self._summarize(
+            self.open_sales, self.open_receipts, self.open_transactions, period_end
+        )
+
+        result = merge_results(self.totals, tail_summary) if self.totals else tail_summary
+        result.period_start = self.period_start
+        result.discrepancies = self._read_journal() + self.discrepancies + discrepancies
+
+        return result
+
+    def save(self, path: Path):
+        """Сохранение контрольной точки
+
+        Новые окончательные несоответствия дописываются в журнал одной
+        порцией, контрольная точка запоминает размер журнала: порции,
+        дописанные после нее (прерванное сохранение), при следующем
+        сохранении отбрасываются.
+        """
+        path = Path(path)
+        journal = path.with_name(path.name + self.JOURNAL_SUFFIX)
+        if self.journal is None:
+            journal.write_bytes(b'')
+        elif self.journal != journal:
+            shutil.copyfile(self.journal, journal)
+
+        with open(journal, 'r+b') as file:
+            file.truncate(self.journal_size)
+            file.seek(self.journal_size)
+            if self.discrepancies:
+                pickle.dump(self.discrepancies, file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.journal_size = file.tell()
+        self.journal = journal
+        self.discrepancies = []
+
+        with open(path, 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        logger.info(f"Reconciliation checkpoint saved to {path} (watermark {self.watermark}, "
+                    f"{len(self.open_sales)} open sales)")
+
+    @classmethod
+    def load(cls, path: Path) -> 'IncrementalReconciler':
+        """Загрузка контрольной точки"""
+        with open(path, 'rb') as file:
+            reconciler = pickle.load(file)
+
+        if not isinstance(reconciler, cls):
+            raise ValueError(f"Not a reconciliation checkpoint: {path}")
+
+        # Журнал лежит рядом с контрольной точкой (папку можно перенести)
+        path = Path(path)
+        reconciler.journal = path.with_name(path.name + cls.JOURNAL_SUFFIX)
+        if not reconciler.journal.exists() or reconciler.journal.stat().st_size < reconciler.journal_size:
+            raise ValueError(f"Discrepancy journal is missing or truncated: {reconciler.journal}")
+
+        logger.info(f"Reconciliation checkpoint loaded from {path} (watermark {reconciler.watermark})")
+        return reconciler
+
+    def _read_journal(self) -> List[Discrepancy]:
+        """Несоответствия, записанные в журнал сохраненными контрольными точками"""
+        discrepancies = []
+        if self.journal is None:
+            return discrepancies
+
+        with open(self.journal, 'rb') as file:
+            while file.tell() < self.journal_size:
+                discrepancies.extend(pickle.load(file))
+        return discrepancies
+
+    def _window(self, records: Iterable[Any], watermark: datetime) -> List[OpenRecord]:
+        """Записи окна [self.watermark, watermark)
+
+        Первое окно начинается на time_tolerance раньше начала периода:
+        записи до начала периода отмечаются как context.
+        """
+        period_start = to_timestamp(self.period_start)
+        start, end = to_timestamp(self.watermark), to_timestamp(watermark)
+        if start == period_start:
+            start -= self.engine.time_tolerance_us
+
+        window = []
+        skipped = 0
+        for record in records:
+            if start <= record.timestamp < end:
+                window.append(OpenRecord(record, context=record.timestamp < period_start))
+            else:
+                skipped += 1
+
+        if skipped:
+            logger.debug(f"Skipped {skipped} records outside of window")
+
+        return window
+
+    def _reconcile_window(self,
+                          sales: List[OpenRecord],
+                          receipts: List[OpenRecord],
+                          transactions: List[OpenRecord]):
+        """Совместная сверка открытого хвоста и нового окна"""
+        open_sales = self.open_sales + sales
+        open_receipts = self.open_receipts + receipts
+        open_transactions = self.open_transactions + transactions
+
+        shard = reconcile_shard(
+            self.engine.time_tolerance.total_seconds(),
+            self.engine.amount_tolerance,
+            [entry.record for entry in open_sales],
+            [entry.record for entry in open_receipts],
+            [entry.record for entry in open_transactions]
+        )
+
+        tail_size = len(self.open_sales)
+        sale_flags = dict(shard.sale_flags)
+        for position, entry in enumerate(open_sales):
+            flag = sale_flags.get(position)
+            # Записи хвоста, уже нашедшие пару, остаются сверенными
+            if position >= tail_size or entry.flag is not None:
+                entry.flag = flag
+
+        # Дубликаты возможны только внутри нового окна (ключ включает точное время)
+        for position in shard.duplicates:
+            if position >= tail_size:
+                open_sales[position].duplicate = True
+
+        self._update_orphans(open_receipts, len(self.open_receipts), shard.orphan_receipts)
+        self._update_orphans(open_transactions, len(self.open_transactions), shard.orphan_transactions)
+
+        self.open_sales = open_sales
+        self.open_receipts = open_receipts
+        self.open_transactions = open_transactions
+
+    def _update_orphans(self, entries: List[OpenRecord], tail_size: int, orphan_positions: List[int]):
+        """Обновление признака "без продажи" для чеков/транзакций"""
+        orphans = set(orphan_positions)
+        for position, entry in enumerate(entries):
+            orphan = position in orphans
+            entry.flag = orphan if position >= tail_size else (entry.flag and orphan)
+
+    def _finalize(self, boundary: datetime):
+        """Фиксация записей с datetime < boundary"""
+        final_sales, self.open_sales = self._split(self.open_sales, boundary)
+        final_receipts, self.open_receipts = self._split(self.open_receipts, boundary)
+        final_transactions, self.open_transactions = self._split(self.open_transactions, boundary)
+
+        discrepancies, summary = self._summarize(final_sales, final_receipts, final_transactions, boundary)
+
+        # Несоответствия копятся отдельно, чтобы слияние сводок не копировало их на каждом шаге
+        self.discrepancies.extend(discrepancies)
+        summary.discrepancies = []
+        self.totals = merge_results(self.totals, summary) if self.totals else summary
+
+    def _split(self, entries: List[OpenRecord], boundary: datetime):
+        """Разделение на окончательные записи и открытый хвост"""
+        boundary = to_timestamp(boundary)
+        final = [entry for entry in entries if entry.record.timestamp < boundary]
+        still_open = [entry for entry in entries if entry.record.timestamp >= boundary]
+        return final, still_open
+
+    def _summarize(self,
+                   sales: List[OpenRecord],
+                   receipts: List[OpenRecord],
+                   transactions: List[OpenRecord],
+                   period_end: datetime):
+        """Несоответствия и частичная сводка для набора записей (без записей context)"""
+        engine = self.engine
+        sales = [entry for entry in sales if not entry.context]
+        receipts = [entry for entry in receipts if not entry.context]
+        transactions = [entry for entry in transactions if not entry.context]
+        sale_factories = {
+            SALE_TEST: engine._test_sale_discrepancy,
+            SALE_MISSING_RECEIPT: engine._missing_receipt_discrepancy,
+            SALE_MISSING_TRANSACTION: engine._missing_transaction_discrepancy,
+            SALE_UNKNOWN_PAYMENT: engine._unknown_payment_discrepancy
+        }
+
+        discrepancies = [sale_factories[entry.flag](entry.record) for entry in sales if entry.flag]
+        discrepancies.extend(engine._orphan_receipt_discrepancy(entry.record) for entry in receipts if entry.flag)
+        discrepancies.extend(engine._orphan_transaction_discrepancy(entry.record)
+                             for entry in transactions if entry.flag)
+        discrepancies.extend(engine._duplicate_sale_discrepancy(entry.record) for entry in sales if entry.duplicate)
+
+        summary = engine._create_summary(
+            [entry.record for entry in sales],
+            [entry.record for entry in receipts],
+            [entry.record for entry in transactions],
+            discrepancies, self.period_start, period_end
+        )
+
+        return discrepancies, summary
+
+
+def merge_results(first: ReconciliationResult, second: ReconciliationResult) -> ReconciliationResult:
+    """Сложение двух результатов сверки (счетчики и сводки суммируются)"""
+    summary_by_machine: Dict[str, Dict[str, Any]] = {}
+    for summary in (first.summary_by_machine, second.summary_by_machine):
+        for machine_id, data in summary.items():
+            target = summary_by_machine.setdefault(machine_id, {
+                'total_sales': 0,
+                'total_amount': Decimal('0'),
+                'discrepancies': 0,
+                'payment_methods': {}
+            })
+            target['total_sales'] += data['total_sales']
+            target['total_amount'] += data['total_amount']
+            target['discrepancies'] += data['discrepancies']
+            for method, count in data['payment_methods'].items():
+                target['payment_methods'][method] = target['payment_methods'].get(method, 0) + count
+
+    summary_by_payment: Dict[str, Dict[str, Any]] = {}
+    for summary in (first.summary_by_payment, second.summary_by_payment):
+        for method, data in summary.items():
+            target = summary_by_payment.setdefault(method, {
+                'count': 0,
+                'amount': Decimal('0'),
+                'matched': 0,
+                'unmatched': 0
+            })
+            for key in target:
+                target[key] += data[key]
+
+    return ReconciliationResult(
+        period_start=min(first.period_start, second.period_start),
+        period_end=max(first.period_end, second.period_end),
+        total_sales=first.total_sales + second.total_sales,
+        total_receipts=first.total_receipts + second.total_receipts,
+        total_transactions=first.total_transactions + second.total_transactions,
+        matched_count=first.matched_count + second.matched_count,
+        discrepancies=first.discrepancies + second.discrepancies,
+        summary_by_machine=summary_by_machine,
+        summary_by_payment=summary_by_payment
+    )
@@ -1,21 +1,31 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Union
 from datetime import datetime
 from decimal import Decimal
 from collections import defaultdict
 import logging
 
+import numpy as np
+
 from ..models.audit_models import (
     SaleRecord, Recipe, InventoryMovement,
-    Discrepancy, DiscrepancyType
+    Discrepancy, DiscrepancyType, ConsumptionBucket,
+    to_timestamp, from_timestamp
 )
+from ..models.record_batch import RecordBatch
+from .recipe_matrix import RecipeMatrix, US_PER_DAY
 
 logger = logging.getLogger(__name__)
 
 class IngredientAnalyzer:
     """Анализатор расхода ингредиентов"""
     
+    # Разбивка рядов расхода: интервалы между пополнениями или дни
+    BUCKETS = ('refill', 'day')
+    
     def __init__(self, tolerance_percent: float = 5.0):
         self.tolerance_percent = tolerance_percent
+        # Последние скомпилированные рецепты: (словарь рецептов, матрица)
+        self._compiled: Optional[Tuple[Dict[str, Recipe], RecipeMatrix]] = None
     
     def analyze_consumption(self,
                            sales: List[SaleRecord],
@@ -35,30 +45,197 @@ class IngredientAnalyzer:
                                                   period_start, period_end)
         
         # 3. Сравниваем и находим отклонения
-        discrepancies = self._compare_consumption(theoretical, actual_refills, machine_id)
+        discrepancies = self._compare_consumption(theoretical, actual_refills, machine_id, period_end)
+        
+        return discrepancies
+    
+    def analyze_all(self,
+                    sales: Union[List[SaleRecord], RecordBatch],
+                    recipes: Dict[str, Recipe],
+                    inventory_movements: List[InventoryMovement],
+                    period_start: datetime,
+                    period_end: datetime) -> Dict[str, List[Discrepancy]]:
+        """Анализ расхода ингредиентов по всем машинам
+        
+        Продажи и пополнения группируются по машинам за один проход, а
+        теоретический расход всех машин - одно произведение матрицы
+        порций (машина x товар) на матрицу рецептов, поэтому время анализа
+        не зависит от числа машин. Результат совпадает с
+        analyze_consumption для каждой машины.
+        """
+        matrix = self.recipe_matrix(recipes)
+        theoretical = matrix.by_machine(sales)
+        refills = self._group_refills(inventory_movements, period_start, period_end)
+        logger.info(f"Analyzing ingredient consumption for {len(set(theoretical) | set(refills))} machines")
+        
+        results = {}
+        for machine_id in sorted(set(theoretical) | set(refills), key=str):
+            results[machine_id] = self._compare_consumption(
+                theoretical.get(machine_id, {}), refills.get(machine_id, {}), machine_id, period_end
+            )
+        
+        self._warn_unknown_products(matrix, sales)
+        return results
+    
+    def consumption_series(self,
+                           sales: Union[List[SaleRecord], RecordBatch],
+                           recipes: Dict[str, Recipe],
+                           inventory_movements: List[InventoryMovement],
+                           period_start: datetime,
+                           period_end: datetime,
+                           bucket: str = 'refill') -> List[ConsumptionBucket]:
+        """Ряды расхода по машинам и ингредиентам с разбивкой по интервалам
+        
+        bucket='refill' - интервалы между соседними пополнениями ингредиента:
+        пополнение восполняет расход с предыдущего пополнения (первый
+        интервал начинается с начала периода), поэтому утечка или хищение
+        видны в том интервале, где пополнено больше, чем продано. Интервал
+        после последнего пополнения не закрыт (closed=False) и не
+        сравнивается. bucket='day' - календарные дни периода.
+        
+        Интервал каждой продажи находится двоичным поиском по границам
+        интервалов ее машины, расход всех интервалов - произведение
+        матрицы интервал x товар на матрицу рецептов (память не зависит
+        от числа продаж), расход интервалов ингредиента - разность
+        накопленных значений на его границах.
+        """
+        if bucket not in self.BUCKETS:
+            raise ValueError(f"Unknown consumption bucket: {bucket}")
+        
+        matrix = self.recipe_matrix(recipes)
+        start, end = to_timestamp(period_start), to_timestamp(period_end)
+        refills = self._refill_events(inventory_movements, period_start, period_end)
+        first_day = start // US_PER_DAY
+        days = np.arange(first_day + 1, end // US_PER_DAY + 1, dtype=np.int64) * US_PER_DAY
+        
+        if bucket == 'refill':
+            # Границы машины - моменты пополнений всех ее ингредиентов;
+            # продажа в момент пополнения относится к интервалу до него
+            times = {}
+            for (machine_id, _), events in refills.items():
+                times.setdefault(machine_id, set()).update(timestamp for timestamp, _ in events)
+            boundaries = {machine_id: np.array(sorted(values), dtype=np.int64)
+                          for machine_id, values in times.items()}
+            cumulative = matrix.cumulative_at(sales, start, end, boundaries, side='left')
+        else:
+            # Продажа ровно в полночь относится к новому дню
+            boundaries = {}
+            cumulative = matrix.cumulative_at(sales, start, end, boundaries,
+                                              default_boundaries=days, side='right')
+        
+        keys = set(refills)
+        for machine_id, totals in cumulative.items():
+            keys.update((machine_id, matrix.ingredients[column]) for column in np.flatnonzero(totals[-1]).tolist())
+        
+        columns = {code: column for column, code in enumerate(matrix.ingredients)}
+        series = []
+        for machine_id, ingredient_code in sorted(keys, key=lambda key: (str(key[0]), key[1])):
+            events = refills.get((machine_id, ingredient_code), [])
+            
+            if bucket == 'refill':
+                edges = [start] + [timestamp for timestamp, _ in events] + [end]
+                machine_boundaries = boundaries.get(machine_id, np.array([], dtype=np.int64))
+                rows = np.searchsorted(machine_boundaries, edges[1:-1]) + 1
+                rows = [0] + rows.tolist() + [len(machine_boundaries) + 1]
+                refilled = [quantity for _, quantity in events] + [None]
+            else:
+                edges = [start] + days.tolist() + [end]
+                rows = list(range(len(edges)))
+                refilled = [Decimal('0')] * (len(edges) - 1)
+                for timestamp, quantity in events:
+                    refilled[timestamp // US_PER_DAY - first_day] += quantity
+            
+            totals = cumulative.get(machine_id)
+            column = columns.get(ingredient_code)
+            if totals is None or column is None:
+                used = [0] * (len(edges) - 1)
+            else:
+                used = np.diff(totals[rows, column]).tolist()
+            
+            for index, theoretical in enumerate(used):
+                closed = refilled[index] is not None
+                if not theoretical and not (closed and refilled[index]):
+                    continue
+                series.append(ConsumptionBucket(
+                    machine_id=machine_id,
+                    ingredient_code=ingredient_code,
+                    start=from_timestamp(edges[index]),
+                    end=from_timestamp(edges[index + 1]),
+                    theoretical=matrix.to_decimal(theoretical),
+                    refilled=refilled[index] if closed else Decimal('0'),
+                    closed=closed
+                ))
         
+        self._warn_unknown_products(matrix, sales)
+        return series
+    
+    def bucket_discrepancies(self, series: List[ConsumptionBucket]) -> List[Discrepancy]:
+        """Отклонения расхода в закрытых интервалах ряда (время - конец интервала)"""
+        discrepancies = []
+        for bucket in series:
+            if bucket.closed:
+                discrepancies.extend(self._compare_consumption(
+                    {bucket.ingredient_code: bucket.theoretical},
+                    {bucket.ingredient_code: bucket.refilled},
+                    bucket.machine_id,
+                    bucket.end
+                ))
         return discrepancies
     
+    def recipe_matrix(self, recipes: Dict[str, Recipe]) -> RecipeMatrix:
+        """Рецепты, скомпилированные в матрицу (компилируются один раз на словарь рецептов)"""
+        if self._compiled is None or self._compiled[0] is not recipes:
+            self._compiled = (recipes, RecipeMatrix.from_recipes(recipes))
+        return self._compiled[1]
+    
+    @staticmethod
+    def _warn_unknown_products(matrix: RecipeMatrix, sales: Union[List[SaleRecord], RecordBatch]):
+        for product_code, quantity in matrix.unknown_products(sales).items():
+            logger.warning(f"Recipe not found for product: {product_code} ({quantity} sold)")
+    
+    @staticmethod
+    def _group_refills(movements: List[InventoryMovement],
+                       period_start: datetime,
+                       period_end: datetime) -> Dict[str, Dict[str, Decimal]]:
+        """Пополнения за период по машинам и ингредиентам"""
+        refills = defaultdict(lambda: defaultdict(Decimal))
+        for movement in movements:
+            if (movement.movement_type == 'refill' and
+                period_start <= movement.datetime <= period_end):
+                refills[movement.machine_id][movement.ingredient_code] += movement.quantity
+        return {machine_id: dict(amounts) for machine_id, amounts in refills.items()}
+    
+    @staticmethod
+    def _refill_events(movements: List[InventoryMovement],
+                       period_start: datetime,
+                       period_end: datetime) -> Dict[Tuple[str, str], List[Tuple[int, Decimal]]]:
+        """Пополнения за период по машинам и ингредиентам: (время в микросекундах, количество) по времени
+        
+        Пополнения одного ингредиента в один момент суммируются.
+        """
+        events = defaultdict(lambda: defaultdict(Decimal))
+        for movement in movements:
+            if (movement.movement_type == 'refill' and
+                period_start <= movement.datetime <= period_end):
+                key = (movement.machine_id, movement.ingredient_code)
+                events[key][to_timestamp(movement.datetime)] += movement.quantity
+        return {key: sorted(amounts.items()) for key, amounts in events.items()}
+    
     def _calculate_theoretical_consumption(self,
                                          sales: List[SaleRecord],
                                          recipes: Dict[str, Recipe],
                                          machine_id: str) -> Dict[str, Decimal]:
         """Расчет теоретического расхода ингредиентов"""
-        consumption = defaultdict(Decimal)
+        matrix = self.recipe_matrix(recipes)
         
-        machine_sales = [s for s in sales if s.machine_id == machine_id]
-        
-        for sale in machine_sales:
-            recipe = recipes.get(sale.product_code)
-            if not recipe:
-                logger.warning(f"Recipe not found for product: {sale.product_code}")
-                continue
-            
-            # Умножаем количество каждого ингредиента на количество проданных напитков
-            for ingredient in recipe.ingredients:
-                consumption[ingredient.ingredient_code] += ingredient.quantity * sale.quantity
+        if isinstance(sales, RecordBatch):
+            machine_sales = sales.for_machine(machine_id)
+        else:
+            machine_sales = [s for s in sales if s.machine_id == machine_id]
         
-        return dict(consumption)
+        # Порции по товарам, умноженные на матрицу рецептов
+        self._warn_unknown_products(matrix, machine_sales)
+        return matrix.total(machine_sales)
     
     def _get_actual_refills(self,
                            movements: List[InventoryMovement],
@@ -79,8 +256,12 @@ class IngredientAnalyzer:
     def _compare_consumption(self,
                            theoretical: Dict[str, Decimal],
                            actual_refills: Dict[str, Decimal],
-                           machine_id: str) -> List[Discrepancy]:
-        """Сравнение теоретического и фактического расхода"""
+                           machine_id: str,
+                           at: datetime) -> List[Discrepancy]:
+        """Сравнение теоретического и фактического расхода
+        
+        at - время несоответствий: конец периода или интервала сравнения.
+        """
         discrepancies = []
         
         # Проверяем каждый ингредиент
@@ -96,7 +277,7 @@ class IngredientAnalyzer:
                     discrepancies.append(Discrepancy(
                         type=DiscrepancyType.EXCESS_CONSUMPTION,
                         machine_id=machine_id,
-                        datetime=datetime.now(),
+                        datetime=at,
                         description=f"Refill without sales for {ingredient_code}: {actual_amount}",
                         severity="medium"
                     ))
@@ -110,7 +291,7 @@ class IngredientAnalyzer:
                     discrepancies.append(Discrepancy(
                         type=DiscrepancyType.EXCESS_CONSUMPTION,
                         machine_id=machine_id,
-                        datetime=datetime.now(),
+                        datetime=at,
                         description=(f"Consumption variance for {ingredient_code}: "
                                    f"theoretical={theo_amount}, actual={actual_amount}, "
                                    f"variance={variance_percent:.1f}%"),
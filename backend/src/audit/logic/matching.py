@@ -0,0 +1,83 @@
+from bisect import bisect_left
+from typing import Any, Callable, Generic, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class TimeWindowIndex(Generic[T]):
+    """Отсортированный по времени индекс записей с поиском по окну
+
+    Время - целые микросекунды от эпохи (SaleRecord.timestamp и т.п.).
+    Записи сортируются один раз (стабильно, т.е. записи с одинаковым
+    временем сохраняют исходный порядок), после чего выборка окна
+    [start, end] выполняется через bisect за O(log n + k).
+
+    Для режима однозначной сверки записи можно "занимать" (claim):
+    занятые позиции пропускаются через таблицу переходов со сжатием
+    путей, поэтому повторные выборки окна не просматривают их заново.
+    """
+
+    __slots__ = ('times', 'items', '_skip')
+
+    def __init__(self, items: Iterable[T], key: Callable[[T], int]):
+        pairs = sorted(((key(item), item) for item in items), key=lambda pair: pair[0])
+        self.times: List[int] = [pair[0] for pair in pairs]
+        self.items: List[T] = [pair[1] for pair in pairs]
+        self._skip: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def window(self, start: int, end: int) -> Iterator[T]:
+        """Записи с временем в пределах [start, end] в порядке возрастания времени"""
+        times = self.times
+        items = self.items
+        position = bisect_left(times, start)
+        size = len(times)
+
+        while position < size and times[position] <= end:
+            yield items[position]
+            position += 1
+
+    def available(self, start: int, end: int) -> Iterator[Tuple[int, T]]:
+        """Незанятые записи окна [start, end] вместе с их позициями в индексе"""
+        times = self.times
+        position = self._next_available(bisect_left(times, start))
+
+        while position < len(times) and times[position] <= end:
+            yield position, self.items[position]
+            position = self._next_available(position + 1)
+
+    def claim(self, position: int) -> T:
+        """Пометить запись как использованную и вернуть ее"""
+        if self._skip is None:
+            self._skip = list(range(len(self.items) + 1))
+        self._skip[position] = position + 1
+        return self.items[position]
+
+    def _next_available(self, position: int) -> int:
+        """Первая незанятая позиция, начиная с position"""
+        skip = self._skip
+        if skip is None:
+            return position
+
+        root = position
+        while skip[root] != root:
+            root = skip[root]
+
+        # Сжатие пути
+        while skip[position] != root:
+            skip[position], position = root, skip[position]
+
+        return root
+
+
+def group_by_time(records: Iterable[T],
+                  group_key: Callable[[T], Any],
+                  time_key: Callable[[T], int]) -> dict:
+    """Группировка записей по ключу с построением TimeWindowIndex для каждой группы"""
+    groups: dict = {}
+    for record in records:
+        groups.setdefault(group_key(record), []).append(record)
+
+    return {key: TimeWindowIndex(group, time_key) for key, group in groups.items()}
@@ -0,0 +1,268 @@
+from typing import List, Dict, Tuple, Optional, Union
+from datetime import datetime
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+from ..models.audit_models import (
+    SaleRecord, FiscalReceipt, QRTransaction,
+    Discrepancy, DiscrepancyType, ReconciliationResult
+)
+from ..models.record_batch import RecordBatch, as_records
+from .reconciliation import ReconciliationEngine
+
+logger = logging.getLogger(__name__)
+
+# Виды несоответствий по продаже, возвращаемые из шарда
+SALE_TEST = 'test'
+SALE_MISSING_RECEIPT = 'missing_receipt'
+SALE_MISSING_TRANSACTION = 'missing_transaction'
+SALE_UNKNOWN_PAYMENT = 'unknown_payment'
+
+SALE_KINDS = {
+    DiscrepancyType.TEST_SALE: SALE_TEST,
+    DiscrepancyType.MISSING_RECEIPT: SALE_MISSING_RECEIPT,
+    DiscrepancyType.MISSING_TRANSACTION: SALE_MISSING_TRANSACTION,
+    DiscrepancyType.UNKNOWN_PAYMENT: SALE_UNKNOWN_PAYMENT
+}
+
+
+class ShardResult:
+    """Результат сверки шарда: позиции проблемных записей внутри шарда"""
+
+    __slots__ = ('sale_flags', 'orphan_receipts', 'orphan_transactions', 'duplicates')
+
+    def __init__(self,
+                 sale_flags: List[Tuple[int, str]],
+                 orphan_receipts: List[int],
+                 orphan_transactions: List[int],
+                 duplicates: List[int]):
+        self.sale_flags = sale_flags
+        self.orphan_receipts = orphan_receipts
+        self.orphan_transactions = orphan_transactions
+        self.duplicates = duplicates
+
+
+def reconcile_shard(time_tolerance_seconds: float,
+                    amount_tolerance: Decimal,
+                    sales: List[SaleRecord],
+                    receipts: List[FiscalReceipt],
+                    transactions: List[QRTransaction]) -> ShardResult:
+    """Сверка одного шарда (группы машин) в рабочем процессе
+
+    Возвращаются только позиции записей, а не объекты Discrepancy:
+    записи в рабочем процессе - копии, а итоговые несоответствия должны
+    ссылаться на исходные объекты.
+    """
+    engine = ReconciliationEngine(time_tolerance_seconds, amount_tolerance)
+
+    sale_positions = {id(sale): position for position, sale in enumerate(sales)}
+    receipt_positions = {id(receipt): position for position, receipt in enumerate(receipts)}
+    transaction_positions = {id(transaction): position for position, transaction in enumerate(transactions)}
+
+    sale_flags = [
+        (sale_positions[id(d.sale_record)], SALE_KINDS[d.type])
+        for d in engine._reconcile_sales(sales, receipts, transactions)
+    ]
+    orphan_receipts = [
+        receipt_positions[id(d.receipt)]
+        for d in engine._find_orphan_receipts(sales, receipts)
+    ]
+    orphan_transactions = [
+        transaction_positions[id(d.transaction)]
+        for d in engine._find_orphan_transactions(sales, transactions)
+    ]
+    duplicates = [
+        sale_positions[id(d.sale_record)]
+        for d in engine._find_duplicates(sales)
+    ]
+
+    return ShardResult(sale_flags, orphan_receipts, orphan_transactions, duplicates)
+
+
+class Shard:
+    """Группа машин с их продажами, чеками и QR транзакциями (и их позициями во входных списках)"""
+
+    __slots__ = ('sale_positions', 'receipt_positions', 'transaction_positions')
+
+    def __init__(self):
+        self.sale_positions: List[int] = []
+        self.receipt_positions: List[int] = []
+        self.transaction_positions: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.sale_positions) + len(self.receipt_positions) + len(self.transaction_positions)
+
+
+class ParallelReconciliationEngine(ReconciliationEngine):
+    """Параллельная сверка по машинам в пуле процессов
+
+    Все проверки reconcile_all разбиваются по machine_id. Исключение -
+    QR транзакции без ID машины: они подходят продаже любой машины,
+    поэтому сверяются отдельным глобальным проходом после шардов.
+    Порядок несоответствий совпадает с ReconciliationEngine.
+    """
+
+    # Количество шардов на один рабочий процесс (для балансировки нагрузки)
+    SHARDS_PER_WORKER = 4
+
+    def __init__(self,
+                 time_tolerance_seconds: int = 30,
+                 amount_tolerance: Decimal = Decimal('1'),
+                 consume_matches: bool = False,
+                 workers: Optional[int] = None):
+        if consume_matches:
+            raise ValueError("Consuming match mode is not supported by the parallel engine")
+        super().__init__(time_tolerance_seconds, amount_tolerance)
+        self.workers = workers or os.cpu_count() or 1
+
+    def reconcile_all(self,
+                      sales: Union[List[SaleRecord], RecordBatch],
+                      receipts: Union[List[FiscalReceipt], RecordBatch],
+                      qr_transactions: Union[List[QRTransaction], RecordBatch],
+                      period_start: datetime,
+                      period_end: datetime) -> ReconciliationResult:
+        """Полная сверка всех данных (пакеты RecordBatch разворачиваются в записи)"""
+        logger.info(f"Starting parallel reconciliation for period {period_start} to {period_end} "
+                     f"({self.workers} workers)")
+
+        sales, receipts, qr_transactions = (
+            as_records(sales), as_records(receipts), as_records(qr_transactions)
+        )
+
+        shards, global_transactions = self._partition(sales, receipts, qr_transactions)
+        shard_results = self._run_shards(shards, sales, receipts, qr_transactions)
+
+        discrepancies = self._merge(
+            sales, receipts, qr_transactions,
+            shards, shard_results, global_transactions
+        )
+
+        result = self._create_summary(
+            sales, receipts, qr_transactions,
+            discrepancies, period_start, period_end
+        )
+
+        logger.info(f"Reconciliation completed. Found {len(discrepancies)} discrepancies")
+
+        return result
+
+    def _partition(self,
+                   sales: List[SaleRecord],
+                   receipts: List[FiscalReceipt],
+                   qr_transactions: List[QRTransaction]) -> Tuple[List[Shard], List[int]]:
+        """Разбиение записей на шарды по машинам
+
+        Машины распределяются по шардам жадно (самые загруженные - в
+        наименее заполненный шард). Возвращает шарды и позиции QR
+        транзакций без ID машины.
+        """
+        by_machine: Dict[str, Shard] = {}
+
+        for position, sale in enumerate(sales):
+            by_machine.setdefault(sale.machine_id, Shard()).sale_positions.append(position)
+        for position, receipt in enumerate(receipts):
+            by_machine.setdefault(receipt.machine_id, Shard()).receipt_positions.append(position)
+
+        global_transactions = []
+        for position, transaction in enumerate(qr_transactions):
+            if transaction.machine_id:
+                by_machine.setdefault(transaction.machine_id, Shard()).transaction_positions.append(position)
+            else:
+                global_transactions.append(position)
+
+        shard_count = max(1, min(len(by_machine), self.workers * self.SHARDS_PER_WORKER))
+        shards = [Shard() for _ in range(shard_count)]
+
+        for machine_shard in sorted(by_machine.values(), key=len, reverse=True):
+            target = min(shards, key=len)
+            target.sale_positions.extend(machine_shard.sale_positions)
+            target.receipt_positions.extend(machine_shard.receipt_positions)
+            target.transaction_positions.extend(machine_shard.transaction_positions)
+
+        # Внутри шарда сохраняем исходный порядок записей
+        for shard in shards:
+            shard.sale_positions.sort()
+            shard.receipt_positions.sort()
+            shard.transaction_positions.sort()
+
+        return [shard for shard in shards if len(shard)], global_transactions
+
+    def _run_shards(self,
+                    shards: List[Shard],
+                    sales: List[SaleRecord],
+                    receipts: List[FiscalReceipt],
+                    qr_transactions: List[QRTransaction]) -> List[ShardResult]:
+        """Сверка шардов в пуле процессов"""
+        tolerance_seconds = self.time_tolerance.total_seconds()
+        tasks = [
+            (
+                tolerance_seconds,
+                self.amount_tolerance,
+                [sales[p] for p in shard.sale_positions],
+                [receipts[p] for p in shard.receipt_positions],
+                [qr_transactions[p] for p in shard.transaction_positions]
+            )
+            for shard in shards
+        ]
+
+        if self.workers == 1 or len(tasks) <= 1:
+            return [reconcile_shard(*task) for task in tasks]
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks))) as executor:
+            futures = [executor.submit(reconcile_shard, *task) for task in tasks]
+            return [future.result() for future in futures]
+
+    def _merge(self,
+               sales: List[SaleRecord],
+               receipts: List[FiscalReceipt],
+               qr_transactions: List[QRTransaction],
+               shards: List[Shard],
+               shard_results: List[ShardResult],
+               global_transactions: List[int]) -> List[Discrepancy]:
+        """Объединение результатов шардов и глобальный проход по QR без машины"""
+        sale_flags: Dict[int, str] = {}
+        orphan_receipts: List[int] = []
+        orphan_transactions: List[int] = []
+        duplicates: List[int] = []
+
+        for shard, shard_result in zip(shards, shard_results):
+            for local, kind in shard_result.sale_flags:
+                sale_flags[shard.sale_positions[local]] = kind
+            orphan_receipts.extend(shard.receipt_positions[local] for local in shard_result.orphan_receipts)
+            orphan_transactions.extend(shard.transaction_positions[local]
+                                       for local in shard_result.orphan_transactions)
+            duplicates.extend(shard.sale_positions[local] for local in shard_result.duplicates)
+
+        # Глобальный проход: транзакции без машины подходят продажам любой машины
+        if global_transactions:
+            machine_less = [qr_transactions[p] for p in global_transactions]
+            machine_less_index = self._index_qr_by_time(machine_less)
+
+            for position, kind in list(sale_flags.items()):
+                if kind == SALE_MISSING_TRANSACTION and self._find_qr_match(sales[position], machine_less_index):
+                    del sale_flags[position]
+
+            # Транзакции без продажи: сопоставимы только QR продажи
+            qr_sales = [sale for sale in sales if sale.payment_method in self.QR_SERVICES]
+            sales_by_amount = self._index_sales_by_amount_and_time(qr_sales)
+            orphan_transactions.extend(
+                position for position in global_transactions
+                if not self._find_sale_for_transaction(qr_transactions[position], sales_by_amount)
+            )
+
+        sale_factories = {
+            SALE_TEST: self._test_sale_discrepancy,
+            SALE_MISSING_RECEIPT: self._missing_receipt_discrepancy,
+            SALE_MISSING_TRANSACTION: self._missing_transaction_discrepancy,
+            SALE_UNKNOWN_PAYMENT: self._unknown_payment_discrepancy
+        }
+
+        discrepancies = [sale_factories[sale_flags[p]](sales[p]) for p in sorted(sale_flags)]
+        discrepancies.extend(self._orphan_receipt_discrepancy(receipts[p]) for p in sorted(orphan_receipts))
+        discrepancies.extend(self._orphan_transaction_discrepancy(qr_transactions[p])
+                             for p in sorted(orphan_transactions))
+        discrepancies.extend(self._duplicate_sale_discrepancy(sales[p]) for p in sorted(duplicates))
+
+        return discrepancies
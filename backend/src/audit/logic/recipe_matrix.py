@@ -0,0 +1,229 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+from datetime import date, timedelta
+from decimal import Decimal
+import logging
+
+import numpy as np
+import pandas as pd
+
+from ..models.audit_models import SaleRecord, Recipe, EPOCH
+from ..models.record_batch import RecordBatch
+
+logger = logging.getLogger(__name__)
+
+# Микросекунд в сутках
+US_PER_DAY = 86400 * 1000000
+
+
+class RecipeMatrix:
+    """Скомпилированные рецепты: матрица товар x ингредиент
+
+    matrix[p, i] - количество ингредиента i на одну порцию товара p в
+    целых единицах 10^-scale (scale - наибольшее число знаков после
+    запятой в рецептах), поэтому расчет точный. Теоретический расход
+    для любого набора продаж - произведение вектора количества проданных
+    порций по товарам на матрицу; для групп продаж (машины, дни) -
+    произведение матрицы групп на матрицу рецептов.
+    """
+
+    def __init__(self, products: List[str], ingredients: List[str], matrix: np.ndarray, scale: int):
+        self.products = products
+        self.ingredients = ingredients
+        self.matrix = matrix
+        self.scale = scale
+        self._product_index = pd.Index(products)
+
+    @classmethod
+    def from_recipes(cls, recipes: Dict[str, Recipe]) -> 'RecipeMatrix':
+        """Матрица из рецептов RecipeLoader (товар -> Recipe)"""
+        products = list(recipes)
+        ingredients = sorted({
+            ingredient.ingredient_code
+            for recipe in recipes.values()
+            for ingredient in recipe.ingredients
+        })
+        scale = max(
+            (max(0, -ingredient.quantity.as_tuple().exponent)
+             for recipe in recipes.values() for ingredient in recipe.ingredients),
+            default=0
+        )
+
+        column = {code: position for position, code in enumerate(ingredients)}
+        matrix = np.zeros((len(products), len(ingredients)), dtype=np.int64)
+        for row, product_code in enumerate(products):
+            for ingredient in recipes[product_code].ingredients:
+                matrix[row, column[ingredient.ingredient_code]] += int(ingredient.quantity.scaleb(scale))
+
+        return cls(products, ingredients, matrix, scale)
+
+    def product_counts(self, sales: Union[List[SaleRecord], RecordBatch]) -> np.ndarray:
+        """Количество проданных порций по товарам (вектор в порядке products)"""
+        _, product_codes, quantities, _ = self._sale_columns(sales)
+        positions = self._product_index.get_indexer(product_codes)
+        known = positions >= 0
+        return np.bincount(positions[known], weights=quantities[known],
+                           minlength=len(self.products)).astype(np.int64)
+
+    def consumption(self, counts: np.ndarray) -> np.ndarray:
+        """Расход ингредиентов по вектору (или матрице групп x товар) порций, в единицах 10^-scale"""
+        return counts @ self.matrix
+
+    def cumulative_at(self,
+                      sales: Union[List[SaleRecord], RecordBatch],
+                      start: int,
+                      end: int,
+                      boundaries: Dict[Optional[str], np.ndarray],
+                      default_boundaries: Optional[np.ndarray] = None,
+                      side: str = 'left') -> Dict[Optional[str], np.ndarray]:
+        """Накопленный теоретический расход машин на границах интервалов
+
+        start, end - период (микросекунды, включительно); boundaries -
+        отсортированные границы интервалов внутри периода по машинам
+        (default_boundaries - для машин без своих границ). Продажа в
+        момент границы относится к интервалу до нее (side='left') или
+        после (side='right'), как в np.searchsorted.
+
+        Для каждой машины с продажами - матрица (число границ + 2) x
+        ингредиент: строка 0 - нули (начало периода), строка j - расход
+        продаж до j-й границы, последняя - расход за весь период.
+        Каждая продажа относится к одному интервалу своей машины, расход
+        интервалов - произведение матрицы интервал x товар на матрицу
+        рецептов, поэтому память зависит от числа интервалов, а не продаж.
+        """
+        empty = np.array([], dtype=np.int64)
+        if default_boundaries is None:
+            default_boundaries = empty
+
+        machine_ids, product_codes, quantities, timestamps = self._sale_columns(sales)
+        positions = self._product_index.get_indexer(product_codes)
+        selected = (positions >= 0) & (timestamps >= start) & (timestamps <= end)
+        machine_codes, machines = _factorize(machine_ids[selected])
+        positions, quantities, timestamps = positions[selected], quantities[selected], timestamps[selected]
+
+        # Интервалы всех машин нумеруются подряд: машина - отрезок [offset, offset + size)
+        order = np.argsort(machine_codes, kind='stable')
+        bounds = np.searchsorted(machine_codes[order], np.arange(len(machines) + 1)).tolist()
+        intervals = np.empty(len(order), dtype=np.int64)
+        segments = []
+        offset = 0
+        for code, machine_id in enumerate(machines.tolist()):
+            rows = order[bounds[code]:bounds[code + 1]]
+            machine_boundaries = boundaries.get(machine_id, default_boundaries)
+            intervals[rows] = offset + np.searchsorted(machine_boundaries, timestamps[rows], side=side)
+            segments.append((machine_id, offset, len(machine_boundaries) + 1))
+            offset += len(machine_boundaries) + 1
+
+        counts = np.zeros((offset, len(self.products)), dtype=np.int64)
+        np.add.at(counts, (intervals, positions), quantities)
+        consumption = self.consumption(counts)
+
+        cumulative = {}
+        for machine_id, first, size in segments:
+            totals = np.zeros((size + 1, len(self.ingredients)), dtype=np.int64)
+            np.cumsum(consumption[first:first + size], axis=0, out=totals[1:])
+            cumulative[machine_id] = totals
+        return cumulative
+
+    def total(self, sales: Union[List[SaleRecord], RecordBatch]) -> Dict[str, Decimal]:
+        """Теоретический расход ингредиентов для набора продаж"""
+        return self.to_amounts(self.consumption(self.product_counts(sales)))
+
+    def by_machine(self, sales: Union[List[SaleRecord], RecordBatch]) -> Dict[Optional[str], Dict[str, Decimal]]:
+        """Теоретический расход по машинам"""
+        machine_ids, product_codes, quantities, _ = self._sale_columns(sales)
+        group_codes, machines = _factorize(machine_ids)
+        return self._grouped(group_codes, machines.tolist(), product_codes, quantities)
+
+    def by_day(self, sales: Union[List[SaleRecord], RecordBatch]) -> Dict[Tuple[Optional[str], date], Dict[str, Decimal]]:
+        """Теоретический расход по машинам и дням"""
+        machine_ids, product_codes, quantities, timestamps = self._sale_columns(sales)
+        machine_codes, machines = _factorize(machine_ids)
+        days = timestamps // US_PER_DAY
+        first_day = int(days.min()) if len(days) else 0
+        day_count = int(days.max()) - first_day + 1 if len(days) else 1
+
+        # Группа - пара (машина, день), закодированная одним целым числом
+        group_codes, groups = pd.factorize(machine_codes.astype(np.int64) * day_count + (days - first_day))
+        keys = [
+            (machines[group // day_count], (EPOCH + timedelta(days=first_day + group % day_count)).date())
+            for group in groups.tolist()
+        ]
+        return self._grouped(group_codes, keys, product_codes, quantities)
+
+    def by_hopper(self,
+                  sales: Union[List[SaleRecord], RecordBatch],
+                  hoppers: Dict[Tuple[str, str], Hashable]) -> Dict[Hashable, Decimal]:
+        """Теоретический расход по бункерам
+
+        hoppers - бункер для пары (машина, ингредиент); расход
+        ингредиентов без бункера не учитывается.
+        """
+        consumption = {}
+        for machine_id, amounts in self.by_machine(sales).items():
+            for ingredient_code, amount in amounts.items():
+                hopper = hoppers.get((machine_id, ingredient_code))
+                if hopper is not None:
+                    consumption[hopper] = consumption.get(hopper, Decimal('0')) + amount
+        return consumption
+
+    def unknown_products(self, sales: Union[List[SaleRecord], RecordBatch]) -> Dict[Any, int]:
+        """Товары без рецепта и число проданных порций"""
+        _, product_codes, quantities, _ = self._sale_columns(sales)
+        unknown = self._product_index.get_indexer(product_codes) < 0
+        if not unknown.any():
+            return {}
+        totals = pd.Series(quantities[unknown]).groupby(product_codes[unknown], dropna=False).sum()
+        return {None if pd.isna(code) else code: int(quantity) for code, quantity in totals.items()}
+
+    def to_amounts(self, vector: np.ndarray) -> Dict[str, Decimal]:
+        """Ненулевой расход ингредиентов в Decimal"""
+        return {
+            self.ingredients[position]: self.to_decimal(vector[position])
+            for position in np.flatnonzero(vector).tolist()
+        }
+
+    def to_decimal(self, value: int) -> Decimal:
+        """Количество ингредиента из единиц 10^-scale в Decimal"""
+        return Decimal(int(value)).scaleb(-self.scale)
+
+    def _grouped(self,
+                 group_codes: np.ndarray,
+                 keys: List[Any],
+                 product_codes: np.ndarray,
+                 quantities: np.ndarray) -> Dict[Any, Dict[str, Decimal]]:
+        """Расход по группам продаж: матрица групп x товар, умноженная на матрицу рецептов"""
+        positions = self._product_index.get_indexer(product_codes)
+        known = positions >= 0
+
+        counts = np.zeros((len(keys), len(self.products)), dtype=np.int64)
+        np.add.at(counts, (group_codes[known], positions[known]), quantities[known])
+        consumption = self.consumption(counts)
+
+        return {key: self.to_amounts(consumption[position]) for position, key in enumerate(keys)}
+
+    @staticmethod
+    def _sale_columns(sales: Union[Sequence[SaleRecord], RecordBatch]) -> Tuple[np.ndarray, ...]:
+        """Колонки продаж: машины, товары, количество порций и время (микросекунды)"""
+        if isinstance(sales, RecordBatch):
+            return (
+                sales.machine_ids,
+                np.asarray(sales.fields['product_code'], dtype=object),
+                np.asarray(sales.fields['quantity'], dtype=np.int64),
+                sales.timestamps
+            )
+
+        size = len(sales)
+        return (
+            np.fromiter((sale.machine_id for sale in sales), dtype=object, count=size),
+            np.fromiter((sale.product_code for sale in sales), dtype=object, count=size),
+            np.fromiter((sale.quantity for sale in sales), dtype=np.int64, count=size),
+            np.fromiter((sale.timestamp for sale in sales), dtype=np.int64, count=size)
+        )
+
+
+def _factorize(machine_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Коды машин и их ID; машина не указана (None) - отдельная категория"""
+    codes, machines = pd.factorize(machine_ids, use_na_sentinel=False)
+    machines = np.asarray(machines, dtype=object)
+    machines[pd.isna(machines)] = None
+    return codes, machines
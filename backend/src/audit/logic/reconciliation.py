@@ -1,4 +1,4 @@
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Callable, Union
 from datetime import datetime, timedelta
 from decimal import Decimal
 from collections import defaultdict
@@ -7,42 +7,67 @@ import logging
 from ..models.audit_models import (
     SaleRecord, FiscalReceipt, QRTransaction,
     Discrepancy, DiscrepancyType, PaymentMethod,
-    ReconciliationResult
+    ReconciliationResult, MICROSECOND, to_tiyin, from_tiyin
 )
+from ..models.record_batch import RecordBatch, as_records
+from .matching import TimeWindowIndex, group_by_time
 
 logger = logging.getLogger(__name__)
 
 class ReconciliationEngine:
     """Движок сверки данных"""
     
+    # Платежный сервис для каждого QR метода оплаты
+    QR_SERVICES = {
+        PaymentMethod.QR_CLICK: 'click',
+        PaymentMethod.QR_PAYME: 'payme',
+        PaymentMethod.QR_UZUM: 'uzum'
+    }
+    
     def __init__(self, 
                  time_tolerance_seconds: int = 30,
-                 amount_tolerance: Decimal = Decimal('1')):
+                 amount_tolerance: Decimal = Decimal('1'),
+                 consume_matches: bool = False):
         self.time_tolerance = timedelta(seconds=time_tolerance_seconds)
         self.amount_tolerance = amount_tolerance
+        # Допуски в единицах записей: микросекунды и тийины
+        self.time_tolerance_us = self.time_tolerance // MICROSECOND
+        self.amount_tolerance_tiyin = to_tiyin(amount_tolerance)
+        # Однозначная сверка: каждый чек/транзакция закрывает не более одной продажи
+        self.consume_matches = consume_matches
+        # Если задан список, в него записываются найденные пары (продажа, чек/транзакция)
+        self.matches: Optional[List[Tuple[SaleRecord, object]]] = None
     
     def reconcile_all(self,
-                     sales: List[SaleRecord],
-                     receipts: List[FiscalReceipt],
-                     qr_transactions: List[QRTransaction],
+                     sales: Union[List[SaleRecord], RecordBatch],
+                     receipts: Union[List[FiscalReceipt], RecordBatch],
+                     qr_transactions: Union[List[QRTransaction], RecordBatch],
                      period_start: datetime,
                      period_end: datetime) -> ReconciliationResult:
-        """Полная сверка всех данных"""
+        """Полная сверка всех данных (пакеты RecordBatch разворачиваются в записи)"""
         logger.info(f"Starting reconciliation for period {period_start} to {period_end}")
         
-        discrepancies = []
-        
-        # 1. Сверяем продажи с чеками и транзакциями
-        sales_discrepancies = self._reconcile_sales(sales, receipts, qr_transactions)
-        discrepancies.extend(sales_discrepancies)
+        sales, receipts, qr_transactions = (
+            as_records(sales), as_records(receipts), as_records(qr_transactions)
+        )
         
-        # 2. Ищем чеки без продаж
-        orphan_receipts = self._find_orphan_receipts(sales, receipts)
-        discrepancies.extend(orphan_receipts)
+        discrepancies = []
         
-        # 3. Ищем транзакции без продаж
-        orphan_transactions = self._find_orphan_transactions(sales, qr_transactions)
-        discrepancies.extend(orphan_transactions)
+        if self.consume_matches:
+            # 1-3. Однозначная сверка и поиск "сирот" за один проход
+            discrepancies.extend(self._reconcile_consuming(sales, receipts, qr_transactions))
+        else:
+            # 1. Сверяем продажи с чеками и транзакциями
+            sales_discrepancies = self._reconcile_sales(sales, receipts, qr_transactions)
+            discrepancies.extend(sales_discrepancies)
+            
+            # 2. Ищем чеки без продаж
+            orphan_receipts = self._find_orphan_receipts(sales, receipts)
+            discrepancies.extend(orphan_receipts)
+            
+            # 3. Ищем транзакции без продаж
+            orphan_transactions = self._find_orphan_transactions(sales, qr_transactions)
+            discrepancies.extend(orphan_transactions)
         
         # 4. Ищем дубликаты
         duplicates = self._find_duplicates(sales)
@@ -63,118 +88,184 @@ class ReconciliationEngine:
                         receipts: List[FiscalReceipt],
                         qr_transactions: List[QRTransaction]) -> List[Discrepancy]:
         """Сверка каждой продажи с чеками/транзакциями"""
-        discrepancies = []
-        
         # Индексируем чеки и транзакции для быстрого поиска
         receipts_by_machine = self._index_by_machine_and_time(receipts)
         qr_by_time = self._index_qr_by_time(qr_transactions)
         
+        return self._match_sales(
+            sales,
+            lambda sale: self._find_receipt_match(sale, receipts_by_machine),
+            lambda sale: self._find_qr_match(sale, qr_by_time)
+        )
+    
+    def _reconcile_consuming(self,
+                            sales: List[SaleRecord],
+                            receipts: List[FiscalReceipt],
+                            qr_transactions: List[QRTransaction]) -> List[Discrepancy]:
+        """Однозначная сверка: каждый чек/транзакция используется не более одного раза
+        
+        Продаже назначается ближайший по времени незанятый чек/транзакция
+        в пределах допусков. Все, что осталось незанятым после прохода по
+        продажам, считается чеками/транзакциями без продаж.
+        """
+        receipts_by_machine = self._index_by_machine_and_time(receipts)
+        qr_by_service = self._index_qr_by_service_and_time(qr_transactions)
+        claimed = set()
+        
+        def claim_receipt(sale: SaleRecord) -> Optional[FiscalReceipt]:
+            receipt = self._claim_receipt_match(sale, receipts_by_machine)
+            if receipt is not None:
+                claimed.add(id(receipt))
+            return receipt
+        
+        def claim_transaction(sale: SaleRecord) -> Optional[QRTransaction]:
+            transaction = self._claim_qr_match(sale, qr_by_service)
+            if transaction is not None:
+                claimed.add(id(transaction))
+            return transaction
+        
+        discrepancies = self._match_sales(sales, claim_receipt, claim_transaction)
+        
+        discrepancies.extend(
+            self._orphan_receipt_discrepancy(receipt)
+            for receipt in receipts if id(receipt) not in claimed
+        )
+        discrepancies.extend(
+            self._orphan_transaction_discrepancy(transaction)
+            for transaction in qr_transactions if id(transaction) not in claimed
+        )
+        
+        return discrepancies
+    
+    def _match_sales(self,
+                    sales: List[SaleRecord],
+                    find_receipt: Callable[[SaleRecord], Optional[FiscalReceipt]],
+                    find_transaction: Callable[[SaleRecord], Optional[QRTransaction]]) -> List[Discrepancy]:
+        """Проход по продажам с поиском чека/транзакции для каждой"""
+        discrepancies = []
+        
         for sale in sales:
             # Пропускаем тестовые продажи
             if sale.payment_method == PaymentMethod.TEST:
-                discrepancies.append(Discrepancy(
-                    type=DiscrepancyType.TEST_SALE,
-                    machine_id=sale.machine_id,
-                    datetime=sale.datetime,
-                    description=f"Test sale: {sale.product_name} for {sale.amount}",
-                    sale_record=sale,
-                    severity="low"
-                ))
+                discrepancies.append(self._test_sale_discrepancy(sale))
                 continue
             
             # Ищем соответствие в зависимости от метода оплаты
             if sale.payment_method in [PaymentMethod.CASH, PaymentMethod.CARD]:
-                match = self._find_receipt_match(sale, receipts_by_machine)
+                match = find_receipt(sale)
                 if not match:
-                    discrepancies.append(Discrepancy(
-                        type=DiscrepancyType.MISSING_RECEIPT,
-                        machine_id=sale.machine_id,
-                        datetime=sale.datetime,
-                        description=f"No fiscal receipt found for {sale.payment_method.value} sale",
-                        sale_record=sale,
-                        severity="high"
-                    ))
+                    discrepancies.append(self._missing_receipt_discrepancy(sale))
+                elif self.matches is not None:
+                    self.matches.append((sale, match))
             
             elif sale.payment_method in [PaymentMethod.QR_CLICK, PaymentMethod.QR_PAYME, PaymentMethod.QR_UZUM]:
-                match = self._find_qr_match(sale, qr_by_time)
+                match = find_transaction(sale)
                 if not match:
-                    discrepancies.append(Discrepancy(
-                        type=DiscrepancyType.MISSING_TRANSACTION,
-                        machine_id=sale.machine_id,
-                        datetime=sale.datetime,
-                        description=f"No QR transaction found for {sale.payment_method.value} sale",
-                        sale_record=sale,
-                        severity="high"
-                    ))
+                    discrepancies.append(self._missing_transaction_discrepancy(sale))
+                elif self.matches is not None:
+                    self.matches.append((sale, match))
             
             elif sale.payment_method == PaymentMethod.VIP:
                 # VIP продажи могут не иметь чеков
                 logger.info(f"VIP sale: {sale.id}")
             
             else:
-                discrepancies.append(Discrepancy(
-                    type=DiscrepancyType.UNKNOWN_PAYMENT,
-                    machine_id=sale.machine_id,
-                    datetime=sale.datetime,
-                    description=f"Unknown payment method: {sale.payment_method.value}",
-                    sale_record=sale,
-                    severity="medium"
-                ))
+                discrepancies.append(self._unknown_payment_discrepancy(sale))
         
         return discrepancies
     
     def _find_receipt_match(self, 
                            sale: SaleRecord, 
-                           receipts_index: Dict) -> Optional[FiscalReceipt]:
+                           receipts_index: Dict[str, TimeWindowIndex]) -> Optional[FiscalReceipt]:
         """Поиск соответствующего чека для продажи"""
-        machine_receipts = receipts_index.get(sale.machine_id, {})
+        machine_receipts = receipts_index.get(sale.machine_id)
+        if not machine_receipts:
+            return None
         
         # Ищем в пределах временного окна
-        min_time = sale.datetime - self.time_tolerance
-        max_time = sale.datetime + self.time_tolerance
-        
-        for dt in sorted(machine_receipts.keys()):
-            if min_time <= dt <= max_time:
-                for receipt in machine_receipts[dt]:
-                    # Проверяем сумму
-                    if abs(receipt.amount - sale.amount) <= self.amount_tolerance:
-                        # Проверяем метод оплаты
-                        if self._payment_methods_match(sale.payment_method, receipt.payment_method):
-                            return receipt
+        min_time = sale.timestamp - self.time_tolerance_us
+        max_time = sale.timestamp + self.time_tolerance_us
+        
+        for receipt in machine_receipts.window(min_time, max_time):
+            # Проверяем сумму
+            if abs(receipt.amount_tiyin - sale.amount_tiyin) <= self.amount_tolerance_tiyin:
+                # Проверяем метод оплаты
+                if self._payment_methods_match(sale.payment_method, receipt.payment_method):
+                    return receipt
         
         return None
     
     def _find_qr_match(self,
                       sale: SaleRecord,
-                      qr_index: Dict) -> Optional[QRTransaction]:
+                      qr_index: TimeWindowIndex) -> Optional[QRTransaction]:
         """Поиск соответствующей QR транзакции"""
         # Определяем сервис по методу оплаты
-        service_map = {
-            PaymentMethod.QR_CLICK: 'click',
-            PaymentMethod.QR_PAYME: 'payme',
-            PaymentMethod.QR_UZUM: 'uzum'
-        }
-        
-        service = service_map.get(sale.payment_method)
+        service = self.QR_SERVICES.get(sale.payment_method)
         if not service:
             return None
         
         # Ищем в пределах временного окна
-        min_time = sale.datetime - self.time_tolerance
-        max_time = sale.datetime + self.time_tolerance
-        
-        for dt in sorted(qr_index.keys()):
-            if min_time <= dt <= max_time:
-                for transaction in qr_index[dt]:
-                    if transaction.service == service:
-                        # Проверяем сумму
-                        if abs(transaction.amount - sale.amount) <= self.amount_tolerance:
-                            # Проверяем машину если есть
-                            if not transaction.machine_id or transaction.machine_id == sale.machine_id:
-                                return transaction
+        min_time = sale.timestamp - self.time_tolerance_us
+        max_time = sale.timestamp + self.time_tolerance_us
+        
+        for transaction in qr_index.window(min_time, max_time):
+            if transaction.service == service:
+                # Проверяем сумму
+                if abs(transaction.amount_tiyin - sale.amount_tiyin) <= self.amount_tolerance_tiyin:
+                    # Проверяем машину если есть
+                    if not transaction.machine_id or transaction.machine_id == sale.machine_id:
+                        return transaction
         
         return None
     
+    def _claim_receipt_match(self,
+                            sale: SaleRecord,
+                            receipts_index: Dict[str, TimeWindowIndex]) -> Optional[FiscalReceipt]:
+        """Поиск и резервирование ближайшего по времени свободного чека"""
+        machine_receipts = receipts_index.get(sale.machine_id)
+        if not machine_receipts:
+            return None
+        
+        return self._claim_nearest(
+            machine_receipts, sale,
+            lambda receipt: (abs(receipt.amount_tiyin - sale.amount_tiyin) <= self.amount_tolerance_tiyin and
+                             self._payment_methods_match(sale.payment_method, receipt.payment_method))
+        )
+    
+    def _claim_qr_match(self,
+                       sale: SaleRecord,
+                       qr_index: Dict[str, TimeWindowIndex]) -> Optional[QRTransaction]:
+        """Поиск и резервирование ближайшей по времени свободной QR транзакции"""
+        service = self.QR_SERVICES.get(sale.payment_method)
+        service_transactions = qr_index.get(service) if service else None
+        if not service_transactions:
+            return None
+        
+        return self._claim_nearest(
+            service_transactions, sale,
+            lambda transaction: (abs(transaction.amount_tiyin - sale.amount_tiyin) <= self.amount_tolerance_tiyin and
+                                 (not transaction.machine_id or transaction.machine_id == sale.machine_id))
+        )
+    
+    def _claim_nearest(self, index: TimeWindowIndex, sale: SaleRecord, accept: Callable) -> Optional[object]:
+        """Резервирование ближайшей по времени свободной записи окна, прошедшей проверку"""
+        min_time = sale.timestamp - self.time_tolerance_us
+        max_time = sale.timestamp + self.time_tolerance_us
+        
+        best_position = None
+        best_gap = None
+        
+        for position, candidate in index.available(min_time, max_time):
+            if accept(candidate):
+                gap = abs(index.times[position] - sale.timestamp)
+                if best_gap is None or gap < best_gap:
+                    best_position, best_gap = position, gap
+        
+        if best_position is None:
+            return None
+        
+        return index.claim(best_position)
+    
     def _payment_methods_match(self, sale_method: PaymentMethod, receipt_method: PaymentMethod) -> bool:
         """Проверка соответствия методов оплаты"""
         # Прямое совпадение
@@ -197,14 +288,7 @@ class ReconciliationEngine:
         
         for receipt in receipts:
             if not self._find_sale_for_receipt(receipt, sales_index):
-                discrepancies.append(Discrepancy(
-                    type=DiscrepancyType.MISSING_RECEIPT,
-                    machine_id=receipt.machine_id,
-                    datetime=receipt.datetime,
-                    description=f"Fiscal receipt without sale: {receipt.receipt_number}",
-                    receipt=receipt,
-                    severity="medium"
-                ))
+                discrepancies.append(self._orphan_receipt_discrepancy(receipt))
         
         return discrepancies
     
@@ -217,17 +301,87 @@ class ReconciliationEngine:
         
         for transaction in transactions:
             if not self._find_sale_for_transaction(transaction, sales_by_amount):
-                discrepancies.append(Discrepancy(
-                    type=DiscrepancyType.MISSING_TRANSACTION,
-                    machine_id=transaction.machine_id or "UNKNOWN",
-                    datetime=transaction.datetime,
-                    description=f"{transaction.service} transaction without sale: {transaction.transaction_id}",
-                    transaction=transaction,
-                    severity="medium"
-                ))
+                discrepancies.append(self._orphan_transaction_discrepancy(transaction))
         
         return discrepancies
     
+    def _test_sale_discrepancy(self, sale: SaleRecord) -> Discrepancy:
+        """Несоответствие: тестовая продажа"""
+        return Discrepancy(
+            type=DiscrepancyType.TEST_SALE,
+            machine_id=sale.machine_id,
+            datetime=sale.datetime,
+            description=f"Test sale: {sale.product_name} for {sale.amount}",
+            sale_record=sale,
+            severity="low"
+        )
+    
+    def _missing_receipt_discrepancy(self, sale: SaleRecord) -> Discrepancy:
+        """Несоответствие: продажа без фискального чека"""
+        return Discrepancy(
+            type=DiscrepancyType.MISSING_RECEIPT,
+            machine_id=sale.machine_id,
+            datetime=sale.datetime,
+            description=f"No fiscal receipt found for {sale.payment_method.value} sale",
+            sale_record=sale,
+            severity="high"
+        )
+    
+    def _missing_transaction_discrepancy(self, sale: SaleRecord) -> Discrepancy:
+        """Несоответствие: продажа без QR транзакции"""
+        return Discrepancy(
+            type=DiscrepancyType.MISSING_TRANSACTION,
+            machine_id=sale.machine_id,
+            datetime=sale.datetime,
+            description=f"No QR transaction found for {sale.payment_method.value} sale",
+            sale_record=sale,
+            severity="high"
+        )
+    
+    def _unknown_payment_discrepancy(self, sale: SaleRecord) -> Discrepancy:
+        """Несоответствие: неизвестный метод оплаты"""
+        return Discrepancy(
+            type=DiscrepancyType.UNKNOWN_PAYMENT,
+            machine_id=sale.machine_id,
+            datetime=sale.datetime,
+            description=f"Unknown payment method: {sale.payment_method.value}",
+            sale_record=sale,
+            severity="medium"
+        )
+    
+    def _duplicate_sale_discrepancy(self, sale: SaleRecord) -> Discrepancy:
+        """Несоответствие: дублирующая продажа"""
+        return Discrepancy(
+            type=DiscrepancyType.DUPLICATE_SALE,
+            machine_id=sale.machine_id,
+            datetime=sale.datetime,
+            description=f"Duplicate sale: {sale.product_name} for {sale.amount}",
+            sale_record=sale,
+            severity="high"
+        )
+    
+    def _orphan_receipt_discrepancy(self, receipt: FiscalReceipt) -> Discrepancy:
+        """Несоответствие: чек без продажи"""
+        return Discrepancy(
+            type=DiscrepancyType.MISSING_RECEIPT,
+            machine_id=receipt.machine_id,
+            datetime=receipt.datetime,
+            description=f"Fiscal receipt without sale: {receipt.receipt_number}",
+            receipt=receipt,
+            severity="medium"
+        )
+    
+    def _orphan_transaction_discrepancy(self, transaction: QRTransaction) -> Discrepancy:
+        """Несоответствие: транзакция без продажи"""
+        return Discrepancy(
+            type=DiscrepancyType.MISSING_TRANSACTION,
+            machine_id=transaction.machine_id or "UNKNOWN",
+            datetime=transaction.datetime,
+            description=f"{transaction.service} transaction without sale: {transaction.transaction_id}",
+            transaction=transaction,
+            severity="medium"
+        )
+    
     def _find_duplicates(self, sales: List[SaleRecord]) -> List[Discrepancy]:
         """Поиск дублирующих продаж"""
         discrepancies = []
@@ -235,102 +389,80 @@ class ReconciliationEngine:
         
         for sale in sales:
             # Ключ для определения дубликата
-            key = (sale.machine_id, sale.datetime, sale.amount, sale.product_code)
+            key = (sale.machine_id, sale.timestamp, sale.amount_tiyin, sale.product_code)
             
             if key in seen:
-                discrepancies.append(Discrepancy(
-                    type=DiscrepancyType.DUPLICATE_SALE,
-                    machine_id=sale.machine_id,
-                    datetime=sale.datetime,
-                    description=f"Duplicate sale: {sale.product_name} for {sale.amount}",
-                    sale_record=sale,
-                    severity="high"
-                ))
+                discrepancies.append(self._duplicate_sale_discrepancy(sale))
             else:
                 seen.add(key)
         
         return discrepancies
     
     def _index_by_machine_and_time(self, 
-                                   receipts: List[FiscalReceipt]) -> Dict[str, Dict[datetime, List[FiscalReceipt]]]:
+                                   receipts: List[FiscalReceipt]) -> Dict[str, TimeWindowIndex]:
         """Индексация чеков по машине и времени"""
-        index = defaultdict(lambda: defaultdict(list))
-        
-        for receipt in receipts:
-            index[receipt.machine_id][receipt.datetime].append(receipt)
-        
-        return dict(index)
+        return group_by_time(receipts, lambda r: r.machine_id, lambda r: r.timestamp)
     
     def _index_qr_by_time(self, 
-                         transactions: List[QRTransaction]) -> Dict[datetime, List[QRTransaction]]:
+                         transactions: List[QRTransaction]) -> TimeWindowIndex:
         """Индексация QR транзакций по времени"""
-        index = defaultdict(list)
-        
-        for transaction in transactions:
-            index[transaction.datetime].append(transaction)
-        
-        return dict(index)
+        return TimeWindowIndex(transactions, lambda t: t.timestamp)
+    
+    def _index_qr_by_service_and_time(self,
+                                     transactions: List[QRTransaction]) -> Dict[str, TimeWindowIndex]:
+        """Индексация QR транзакций по сервису и времени"""
+        return group_by_time(transactions, lambda t: t.service, lambda t: t.timestamp)
     
     def _index_sales_by_machine_and_time(self,
-                                        sales: List[SaleRecord]) -> Dict[str, Dict[datetime, List[SaleRecord]]]:
+                                        sales: List[SaleRecord]) -> Dict[str, TimeWindowIndex]:
         """Индексация продаж по машине и времени"""
-        index = defaultdict(lambda: defaultdict(list))
-        
-        for sale in sales:
-            index[sale.machine_id][sale.datetime].append(sale)
-        
-        return dict(index)
+        return group_by_time(sales, lambda s: s.machine_id, lambda s: s.timestamp)
     
     def _index_sales_by_amount_and_time(self,
-                                       sales: List[SaleRecord]) -> Dict[Decimal, Dict[datetime, List[SaleRecord]]]:
-        """Индексация продаж по сумме и времени"""
-        index = defaultdict(lambda: defaultdict(list))
-        
-        for sale in sales:
-            index[sale.amount][sale.datetime].append(sale)
-        
-        return dict(index)
+                                       sales: List[SaleRecord]) -> Dict[int, TimeWindowIndex]:
+        """Индексация продаж по сумме (в тийинах) и времени"""
+        return group_by_time(sales, lambda s: s.amount_tiyin, lambda s: s.timestamp)
     
     def _find_sale_for_receipt(self,
                               receipt: FiscalReceipt,
-                              sales_index: Dict) -> Optional[SaleRecord]:
+                              sales_index: Dict[str, TimeWindowIndex]) -> Optional[SaleRecord]:
         """Поиск продажи для чека"""
-        machine_sales = sales_index.get(receipt.machine_id, {})
+        machine_sales = sales_index.get(receipt.machine_id)
+        if not machine_sales:
+            return None
         
-        min_time = receipt.datetime - self.time_tolerance
-        max_time = receipt.datetime + self.time_tolerance
+        min_time = receipt.timestamp - self.time_tolerance_us
+        max_time = receipt.timestamp + self.time_tolerance_us
         
-        for dt in sorted(machine_sales.keys()):
-            if min_time <= dt <= max_time:
-                for sale in machine_sales[dt]:
-                    if abs(sale.amount - receipt.amount) <= self.amount_tolerance:
-                        return sale
+        for sale in machine_sales.window(min_time, max_time):
+            if abs(sale.amount_tiyin - receipt.amount_tiyin) <= self.amount_tolerance_tiyin:
+                return sale
         
         return None
     
     def _find_sale_for_transaction(self,
                                   transaction: QRTransaction,
-                                  sales_index: Dict) -> Optional[SaleRecord]:
+                                  sales_index: Dict[int, TimeWindowIndex]) -> Optional[SaleRecord]:
         """Поиск продажи для транзакции"""
-        amount_sales = sales_index.get(transaction.amount, {})
-        
-        min_time = transaction.datetime - self.time_tolerance
-        max_time = transaction.datetime + self.time_tolerance
-        
-        for dt in sorted(amount_sales.keys()):
-            if min_time <= dt <= max_time:
-                for sale in amount_sales[dt]:
-                    # Проверяем соответствие метода оплаты
-                    expected_method = {
-                        'click': PaymentMethod.QR_CLICK,
-                        'payme': PaymentMethod.QR_PAYME,
-                        'uzum': PaymentMethod.QR_UZUM
-                    }.get(transaction.service)
-                    
-                    if sale.payment_method == expected_method:
-                        # Проверяем машину если указана
-                        if not transaction.machine_id or transaction.machine_id == sale.machine_id:
-                            return sale
+        amount_sales = sales_index.get(transaction.amount_tiyin)
+        if not amount_sales:
+            return None
+        
+        # Проверяем соответствие метода оплаты
+        expected_method = {
+            'click': PaymentMethod.QR_CLICK,
+            'payme': PaymentMethod.QR_PAYME,
+            'uzum': PaymentMethod.QR_UZUM
+        }.get(transaction.service)
+        
+        min_time = transaction.timestamp - self.time_tolerance_us
+        max_time = transaction.timestamp + self.time_tolerance_us
+        
+        for sale in amount_sales.window(min_time, max_time):
+            if sale.payment_method == expected_method:
+                # Проверяем машину если указана
+                if not transaction.machine_id or transaction.machine_id == sale.machine_id:
+                    return sale
         
         return None
     
@@ -342,51 +474,64 @@ class ReconciliationEngine:
                        period_start: datetime,
                        period_end: datetime) -> ReconciliationResult:
         """Создание сводного отчета"""
+        unmatched_types = (DiscrepancyType.MISSING_RECEIPT, DiscrepancyType.MISSING_TRANSACTION)
+        
+        # Один проход по несоответствиям: число "несверенных" и идентификаторы
+        # продаж без чека/транзакции (по identity, без сравнения полей записей)
+        unmatched_count = 0
+        unmatched_sale_ids = set()
+        
+        for discrepancy in discrepancies:
+            if discrepancy.type in unmatched_types:
+                unmatched_count += 1
+                if discrepancy.sale_record is not None:
+                    unmatched_sale_ids.add(id(discrepancy.sale_record))
+        
         # Подсчет совпадений
-        matched_count = len(sales) - len([d for d in discrepancies 
-                                         if d.type in [DiscrepancyType.MISSING_RECEIPT, 
-                                                      DiscrepancyType.MISSING_TRANSACTION]])
+        matched_count = len(sales) - unmatched_count
         
         # Сводка по машинам
+        # Суммы копятся в тийинах и переводятся в Decimal в конце
         summary_by_machine = defaultdict(lambda: {
             'total_sales': 0,
-            'total_amount': Decimal('0'),
+            'total_amount': 0,
             'discrepancies': 0,
             'payment_methods': defaultdict(int)
         })
         
-        for sale in sales:
-            summary_by_machine[sale.machine_id]['total_sales'] += 1
-            summary_by_machine[sale.machine_id]['total_amount'] += sale.amount
-            summary_by_machine[sale.machine_id]['payment_methods'][sale.payment_method.value] += 1
-        
-        for discrepancy in discrepancies:
-            summary_by_machine[discrepancy.machine_id]['discrepancies'] += 1
-        
         # Сводка по методам оплаты
         summary_by_payment = defaultdict(lambda: {
             'count': 0,
-            'amount': Decimal('0'),
+            'amount': 0,
             'matched': 0,
             'unmatched': 0
         })
         
         for sale in sales:
             payment_key = sale.payment_method.value
-            summary_by_payment[payment_key]['count'] += 1
-            summary_by_payment[payment_key]['amount'] += sale.amount
             
-            # Проверяем, есть ли несоответствие для этой продажи
-            has_discrepancy = any(
-                d.sale_record == sale and 
-                d.type in [DiscrepancyType.MISSING_RECEIPT, DiscrepancyType.MISSING_TRANSACTION]
-                for d in discrepancies
-            )
+            machine_summary = summary_by_machine[sale.machine_id]
+            machine_summary['total_sales'] += 1
+            machine_summary['total_amount'] += sale.amount_tiyin
+            machine_summary['payment_methods'][payment_key] += 1
             
-            if has_discrepancy:
-                summary_by_payment[payment_key]['unmatched'] += 1
+            payment_summary = summary_by_payment[payment_key]
+            payment_summary['count'] += 1
+            payment_summary['amount'] += sale.amount_tiyin
+            
+            if id(sale) in unmatched_sale_ids:
+                payment_summary['unmatched'] += 1
             else:
-                summary_by_payment[payment_key]['matched'] += 1
+                payment_summary['matched'] += 1
+        
+        for discrepancy in discrepancies:
+            summary_by_machine[discrepancy.machine_id]['discrepancies'] += 1
+        
+        # После несоответствий: машины, известные только по ним, тоже получают Decimal
+        for machine_summary in summary_by_machine.values():
+            machine_summary['total_amount'] = from_tiyin(machine_summary['total_amount'])
+        for payment_summary in summary_by_payment.values():
+            payment_summary['amount'] = from_tiyin(payment_summary['amount'])
         
         return ReconciliationResult(
             period_start=period_start,
@@ -0,0 +1,379 @@
+from typing import List, Sequence, Tuple, Union
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+import logging
+
+import numpy as np
+import pandas as pd
+
+from ..models.audit_models import (
+    SaleRecord, FiscalReceipt, QRTransaction,
+    Discrepancy, DiscrepancyType, PaymentMethod, ReconciliationResult, from_tiyin
+)
+from ..models.record_batch import RecordBatch, PAYMENT_METHODS
+from .reconciliation import ReconciliationEngine
+
+logger = logging.getLogger(__name__)
+
+# Группа метода оплаты чека, с которой может сойтись продажа:
+# продажа "card" принимает чеки "card" и "unknown", продажа "cash" - только "cash"
+RECEIPT_METHOD_GROUPS = {
+    PaymentMethod.CASH: 'cash',
+    PaymentMethod.CARD: 'card',
+    PaymentMethod.UNKNOWN: 'card'
+}
+# То же по кодам методов оплаты RecordBatch
+RECEIPT_METHOD_GROUP_CODES = np.array(
+    [RECEIPT_METHOD_GROUPS.get(method) for method in PAYMENT_METHODS], dtype=object
+)
+
+# Виды несоответствий, уменьшающие число сверенных продаж
+UNMATCHED_TYPES = (DiscrepancyType.MISSING_RECEIPT, DiscrepancyType.MISSING_TRANSACTION)
+
+
+class VectorizedReconciliationEngine(ReconciliationEngine):
+    """Векторизованный движок сверки на pandas/NumPy
+
+    Записи переводятся в колоночные DataFrame (суммы - int64 в тийинах,
+    время - datetime64), поиск пар выполняется через merge_asof по
+    машине/методу/сумме с допуском по времени. Результат совпадает с
+    ReconciliationEngine в режиме по умолчанию.
+    """
+
+    def __init__(self,
+                 time_tolerance_seconds: int = 30,
+                 amount_tolerance: Decimal = Decimal('1'),
+                 consume_matches: bool = False):
+        if consume_matches:
+            raise ValueError("Consuming match mode is not supported by the vectorized engine")
+        super().__init__(time_tolerance_seconds, amount_tolerance)
+        self.time_tolerance_td = pd.Timedelta(self.time_tolerance)
+
+    def reconcile_all(self,
+                      sales: Union[List[SaleRecord], RecordBatch],
+                      receipts: Union[List[FiscalReceipt], RecordBatch],
+                      qr_transactions: Union[List[QRTransaction], RecordBatch],
+                      period_start: datetime,
+                      period_end: datetime) -> ReconciliationResult:
+        """Полная сверка всех данных
+
+        Источники - списки записей или RecordBatch; из пакетов колонки
+        берутся напрямую, объекты записей создаются только для
+        несоответствий.
+        """
+        logger.info(f"Starting vectorized reconciliation for period {period_start} to {period_end}")
+
+        sales_df = self._sales_frame(sales)
+        receipts_df = self._receipts_frame(receipts)
+        qr_df = self._qr_frame(qr_transactions)
+
+        discrepancies, unmatched = self._discrepancies_from_frames(
+            sales, receipts, qr_transactions, sales_df, receipts_df, qr_df
+        )
+
+        result = self._summary_from_frame(
+            sales_df, unmatched, len(receipts), len(qr_transactions),
+            discrepancies, period_start, period_end
+        )
+
+        logger.info(f"Reconciliation completed. Found {len(discrepancies)} discrepancies")
+
+        return result
+
+    def _discrepancies_from_frames(self,
+                                   sales: Sequence[SaleRecord],
+                                   receipts: Sequence[FiscalReceipt],
+                                   qr_transactions: Sequence[QRTransaction],
+                                   sales_df: pd.DataFrame,
+                                   receipts_df: pd.DataFrame,
+                                   qr_df: pd.DataFrame) -> Tuple[List[Discrepancy], np.ndarray]:
+        """Сверка на колоночных данных и материализация несоответствий
+
+        Строки DataFrame соответствуют записям списков (или пакетов
+        RecordBatch) по позиции. Объекты Discrepancy создаются только для
+        проблемных строк. Возвращает несоответствия и маску продаж без
+        чека/транзакции.
+        """
+        method = sales_df['payment_method'].to_numpy()
+        is_test = method == PaymentMethod.TEST.value
+        is_receipt_sale = np.isin(method, [PaymentMethod.CASH.value, PaymentMethod.CARD.value])
+        is_qr_sale = sales_df['service'].notna().to_numpy()
+        is_vip = method == PaymentMethod.VIP.value
+
+        # 1. Продажи -> чеки/транзакции
+        receipt_found = self._sales_with_receipts(sales_df[is_receipt_sale], receipts_df)
+        qr_found = self._sales_with_transactions(sales_df[is_qr_sale], qr_df)
+
+        missing_receipt = np.zeros(len(sales_df), dtype=bool)
+        missing_receipt[np.flatnonzero(is_receipt_sale)[~receipt_found]] = True
+        missing_transaction = np.zeros(len(sales_df), dtype=bool)
+        missing_transaction[np.flatnonzero(is_qr_sale)[~qr_found]] = True
+        unknown_payment = ~(is_test | is_receipt_sale | is_qr_sale | is_vip)
+
+        if is_vip.any():
+            logger.info(f"VIP sales: {int(is_vip.sum())}")
+
+        discrepancies = []
+        flagged = is_test | missing_receipt | missing_transaction | unknown_payment
+        for position in np.flatnonzero(flagged):
+            sale = sales[position]
+            if is_test[position]:
+                discrepancies.append(self._test_sale_discrepancy(sale))
+            elif missing_receipt[position]:
+                discrepancies.append(self._missing_receipt_discrepancy(sale))
+            elif missing_transaction[position]:
+                discrepancies.append(self._missing_transaction_discrepancy(sale))
+            else:
+                discrepancies.append(self._unknown_payment_discrepancy(sale))
+
+        # 2. Чеки без продаж
+        receipt_has_sale = self._receipts_with_sales(receipts_df, sales_df)
+        for position in np.flatnonzero(~receipt_has_sale):
+            discrepancies.append(self._orphan_receipt_discrepancy(receipts[position]))
+
+        # 3. Транзакции без продаж
+        transaction_has_sale = self._transactions_with_sales(qr_df, sales_df[is_qr_sale])
+        for position in np.flatnonzero(~transaction_has_sale):
+            discrepancies.append(self._orphan_transaction_discrepancy(qr_transactions[position]))
+
+        # 4. Дубликаты
+        duplicated = sales_df.duplicated(['machine_id', 'datetime', 'amount', 'product_code']).to_numpy()
+        for position in np.flatnonzero(duplicated):
+            discrepancies.append(self._duplicate_sale_discrepancy(sales[position]))
+
+        return discrepancies, missing_receipt | missing_transaction
+
+    def _summary_from_frame(self,
+                            sales_df: pd.DataFrame,
+                            unmatched: np.ndarray,
+                            total_receipts: int,
+                            total_transactions: int,
+                            discrepancies: List[Discrepancy],
+                            period_start: datetime,
+                            period_end: datetime) -> ReconciliationResult:
+        """Сводный отчет по колоночным продажам
+
+        Совпадает с ReconciliationEngine._create_summary (включая порядок
+        машин и методов оплаты - по первому появлению и matched_count,
+        уменьшаемый всеми несоответствиями "нет чека/транзакции"), но не
+        требует объектов записей.
+        """
+        summary_by_machine = defaultdict(lambda: {
+            'total_sales': 0,
+            'total_amount': Decimal('0'),
+            'discrepancies': 0,
+            'payment_methods': defaultdict(int)
+        })
+        summary_by_payment = {}
+
+        if len(sales_df):
+            by_machine = sales_df.groupby('machine_id', sort=False)['amount'].agg(['size', 'sum'])
+            for machine_id, count, amount in zip(by_machine.index, by_machine['size'].tolist(),
+                                                 by_machine['sum'].tolist()):
+                machine_summary = summary_by_machine[machine_id]
+                machine_summary['total_sales'] = count
+                machine_summary['total_amount'] = from_tiyin(amount)
+
+            by_method = sales_df.groupby(['machine_id', 'payment_method'], sort=False).size()
+            for (machine_id, method), count in zip(by_method.index, by_method.tolist()):
+                summary_by_machine[machine_id]['payment_methods'][method] = count
+
+            payments = pd.DataFrame({
+                'payment_method': sales_df['payment_method'].to_numpy(),
+                'amount': sales_df['amount'].to_numpy(),
+                'unmatched': unmatched.astype(np.int64)
+            }).groupby('payment_method', sort=False).agg(
+                count=('amount', 'size'), amount=('amount', 'sum'), unmatched=('unmatched', 'sum')
+            )
+            for method, count, amount, unmatched_count in zip(
+                payments.index, payments['count'].tolist(),
+                payments['amount'].tolist(), payments['unmatched'].tolist()
+            ):
+                summary_by_payment[method] = {
+                    'count': count,
+                    'amount': from_tiyin(amount),
+                    'matched': count - unmatched_count,
+                    'unmatched': unmatched_count
+                }
+
+        for discrepancy in discrepancies:
+            summary_by_machine[discrepancy.machine_id]['discrepancies'] += 1
+
+        return ReconciliationResult(
+            period_start=period_start,
+            period_end=period_end,
+            total_sales=len(sales_df),
+            total_receipts=total_receipts,
+            total_transactions=total_transactions,
+            matched_count=len(sales_df) - sum(
+                1 for discrepancy in discrepancies if discrepancy.type in UNMATCHED_TYPES
+            ),
+            discrepancies=discrepancies,
+            summary_by_machine=dict(summary_by_machine),
+            summary_by_payment=summary_by_payment
+        )
+
+    def _sales_with_receipts(self, sales_df: pd.DataFrame, receipts_df: pd.DataFrame) -> np.ndarray:
+        """Есть ли у продажи (наличные/карта) подходящий чек"""
+        left = sales_df.assign(method_group=sales_df['payment_method'])
+        right = receipts_df[receipts_df['method_group'].notna()]
+
+        return self._match_exists(left, right, ['machine_id', 'method_group'], self.amount_tolerance_tiyin)
+
+    def _sales_with_transactions(self, sales_df: pd.DataFrame, qr_df: pd.DataFrame) -> np.ndarray:
+        """Есть ли у QR продажи подходящая транзакция"""
+        with_machine = qr_df['machine_id'].ne('').to_numpy()
+
+        found = self._match_exists(sales_df, qr_df[with_machine], ['machine_id', 'service'],
+                                   self.amount_tolerance_tiyin)
+        # Транзакции без ID машины подходят любой машине
+        found |= self._match_exists(sales_df, qr_df[~with_machine], ['service'],
+                                    self.amount_tolerance_tiyin)
+        return found
+
+    def _receipts_with_sales(self, receipts_df: pd.DataFrame, sales_df: pd.DataFrame) -> np.ndarray:
+        """Есть ли у чека продажа (любой метод оплаты) той же машины"""
+        return self._match_exists(receipts_df, sales_df, ['machine_id'], self.amount_tolerance_tiyin)
+
+    def _transactions_with_sales(self, qr_df: pd.DataFrame, qr_sales_df: pd.DataFrame) -> np.ndarray:
+        """Есть ли у транзакции продажа (точное совпадение суммы, как в базовом движке)"""
+        with_machine = qr_df['machine_id'].ne('').to_numpy()
+        found = np.zeros(len(qr_df), dtype=bool)
+
+        found[with_machine] = self._match_exists(qr_df[with_machine], qr_sales_df,
+                                                 ['machine_id', 'service'], 0)
+        found[~with_machine] = self._match_exists(qr_df[~with_machine], qr_sales_df,
+                                                  ['service'], 0)
+        return found
+
+    def _match_exists(self,
+                      left: pd.DataFrame,
+                      right: pd.DataFrame,
+                      by: List[str],
+                      amount_tolerance: int) -> np.ndarray:
+        """Для каждой строки left: есть ли строка right с теми же ключами by,
+        суммой в пределах amount_tolerance и временем в пределах time_tolerance
+
+        Допуск по сумме раскрывается в точные ключи: каждая строка left
+        размножается по различным суммам right из [amount - tol, amount + tol]
+        (их единицы - это цены меню), после чего merge_asof по времени
+        с direction='nearest' дает ответ на вопрос существования.
+        """
+        found = np.zeros(len(left), dtype=bool)
+        if left.empty or right.empty:
+            return found
+
+        right_amounts = np.unique(right['amount'].to_numpy())
+        left_amounts = left['amount'].to_numpy()
+        lower = np.searchsorted(right_amounts, left_amounts - amount_tolerance, side='left')
+        upper = np.searchsorted(right_amounts, left_amounts + amount_tolerance, side='right')
+        counts = upper - lower
+        if not counts.any():
+            return found
+
+        rows = np.repeat(np.arange(len(left)), counts)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = right_amounts[np.repeat(lower, counts) + offsets]
+
+        # Ключи by + сумма кодируются одним int64, чтобы merge_asof шел по быстрому пути
+        left_key, right_key = self._group_codes(
+            [left[column].to_numpy()[rows] for column in by] + [candidates],
+            [right[column].to_numpy() for column in by] + [right['amount'].to_numpy()]
+        )
+
+        expanded = pd.DataFrame({
+            'datetime': left['datetime'].to_numpy()[rows],
+            '_key': left_key,
+            '_row': rows
+        }).sort_values('datetime', kind='stable')
+
+        targets = pd.DataFrame({
+            'datetime': right['datetime'].to_numpy(),
+            '_key': right_key,
+            '_hit': True
+        }).sort_values('datetime', kind='stable')
+
+        merged = pd.merge_asof(
+            expanded, targets,
+            on='datetime', by='_key',
+            tolerance=self.time_tolerance_td,
+            direction='nearest'
+        )
+
+        found[merged.loc[merged['_hit'].notna(), '_row'].to_numpy()] = True
+        return found
+
+    @staticmethod
+    def _group_codes(left_columns: List[np.ndarray],
+                     right_columns: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Общие для left и right int64 коды составного ключа"""
+        size = len(left_columns[0])
+        codes = np.zeros(size + len(right_columns[0]), dtype=np.int64)
+
+        for left_values, right_values in zip(left_columns, right_columns):
+            column_codes, uniques = pd.factorize(np.concatenate([left_values, right_values]))
+            codes = codes * (len(uniques) + 1) + column_codes
+
+        return codes[:size], codes[size:]
+
+    @staticmethod
+    def _datetime_column(timestamps: Sequence[int]) -> np.ndarray:
+        """datetime64[ns] из микросекунд от эпохи"""
+        return (np.array(timestamps, dtype=np.int64) * 1000).view('datetime64[ns]')
+
+    def _sales_frame(self, sales: Union[Sequence[SaleRecord], RecordBatch]) -> pd.DataFrame:
+        """Колоночное представление продаж"""
+        if isinstance(sales, RecordBatch):
+            frame = pd.DataFrame({
+                'machine_id': sales.machine_ids,
+                'datetime': self._datetime_column(sales.timestamps),
+                'amount': sales.amounts,
+                'payment_method': sales.payment_values,
+                'product_code': sales.fields['product_code']
+            })
+        else:
+            frame = pd.DataFrame({
+                'machine_id': [sale.machine_id for sale in sales],
+                'datetime': self._datetime_column([sale.timestamp for sale in sales]),
+                'amount': np.array([sale.amount_tiyin for sale in sales], dtype=np.int64),
+                'payment_method': [sale.payment_method.value for sale in sales],
+                'product_code': [sale.product_code for sale in sales]
+            })
+        frame['service'] = frame['payment_method'].map(
+            {method.value: service for method, service in self.QR_SERVICES.items()}
+        )
+        return frame
+
+    def _receipts_frame(self, receipts: Union[Sequence[FiscalReceipt], RecordBatch]) -> pd.DataFrame:
+        """Колоночное представление чеков"""
+        if isinstance(receipts, RecordBatch):
+            return pd.DataFrame({
+                'machine_id': receipts.machine_ids,
+                'datetime': self._datetime_column(receipts.timestamps),
+                'amount': receipts.amounts,
+                'method_group': RECEIPT_METHOD_GROUP_CODES[receipts.payment_codes]
+            })
+        return pd.DataFrame({
+            'machine_id': [receipt.machine_id for receipt in receipts],
+            'datetime': self._datetime_column([receipt.timestamp for receipt in receipts]),
+            'amount': np.array([receipt.amount_tiyin for receipt in receipts], dtype=np.int64),
+            'method_group': [RECEIPT_METHOD_GROUPS.get(receipt.payment_method) for receipt in receipts]
+        })
+
+    def _qr_frame(self, transactions: Union[Sequence[QRTransaction], RecordBatch]) -> pd.DataFrame:
+        """Колоночное представление QR транзакций (пустой machine_id - машина не указана)"""
+        if isinstance(transactions, RecordBatch):
+            machines = np.array([machine or '' for machine in transactions.machines.tolist()], dtype=object)
+            return pd.DataFrame({
+                'machine_id': machines[transactions.machine_codes],
+                'service': transactions.fields['service'],
+                'datetime': self._datetime_column(transactions.timestamps),
+                'amount': transactions.amounts
+            })
+        return pd.DataFrame({
+            'machine_id': [transaction.machine_id or '' for transaction in transactions],
+            'service': [transaction.service for transaction in transactions],
+            'datetime': self._datetime_column([transaction.timestamp for transaction in transactions]),
+            'amount': np.array([transaction.amount_tiyin for transaction in transactions], dtype=np.int64)
+        })
@@ -4,18 +4,32 @@ VendBot Audit Module - Сверка отчетности вендинговых
 """
 
 import argparse
+import asyncio
 import logging
 from pathlib import Path
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Optional, List, Tuple, Callable, Sequence
 import sys
+import time
+from functools import partial
+from itertools import chain
 
 from .loaders import (
-    SalesLoader, FiscalReceiptLoader, QRTransactionLoader,
-    RecipeLoader
+    BaseLoader, SalesLoader, FiscalReceiptLoader, QRTransactionLoader,
+    RecipeLoader, InventoryLoader, LoaderCache, LoadTask, load_files
 )
-from .logic import ReconciliationEngine
-from .reports import ExcelReporter
+from .logic import (
+    ReconciliationEngine, VectorizedReconciliationEngine,
+    ParallelReconciliationEngine, IncrementalReconciler, IngredientAnalyzer
+)
+from .models.audit_models import ReconciliationResult
+from .reports import (
+    BaseReporter, ExcelReporter, StreamingExcelReporter, SummaryExcelReporter,
+    CsvReporter, ParquetReporter, ParallelExcelReporter
+)
+from .storage import AuditStateStore, ColumnarStore, PostgresResultStore
+from .storage.postgres_store import run_id_for_period
+from .utils.period import parse_period
 
 # Настройка логирования
 logging.basicConfig(
@@ -33,103 +47,336 @@ logger = logging.getLogger(__name__)
 class AuditRunner:
     """Основной класс для запуска аудита"""
     
-    def __init__(self, data_folder: Path, output_folder: Path):
+    # Доступные движки сверки
+    ENGINES = {
+        'python': ReconciliationEngine,
+        'vectorized': VectorizedReconciliationEngine,
+        'parallel': ParallelReconciliationEngine
+    }
+    
+    # Форматы отчетов
+    REPORT_FORMATS = {
+        'xlsx': ExcelReporter,
+        'xlsx-stream': StreamingExcelReporter,
+        'xlsx-summary': SummaryExcelReporter,
+        'xlsx-parallel': ParallelExcelReporter,
+        'csv': CsvReporter,
+        'parquet': ParquetReporter
+    }
+    
+    # Справочные данные: загружаются целиком, минуя хранилища и потоковое чтение
+    REFERENCE_KEYS = ('recipes', 'inventory_movements')
+    
+    def __init__(self,
+                 data_folder: Path,
+                 output_folder: Path,
+                 engine: str = 'python',
+                 workers: Optional[int] = None,
+                 checkpoint: Optional[Path] = None,
+                 store_path: Optional[Path] = None,
+                 cache_folder: Optional[Path] = None,
+                 columnar_path: Optional[Path] = None,
+                 report_formats: Sequence[str] = ('xlsx',),
+                 database_url: Optional[str] = None,
+                 run_id: Optional[str] = None):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown reconciliation engine: {engine}")
+        report_files = {}
+        for report_format in report_formats:
+            if report_format not in self.REPORT_FORMATS:
+                raise ValueError(f"Unknown report format: {report_format}")
+            # Форматы с одинаковыми именем и расширением файла перезаписали бы отчеты друг друга
+            reporter_class = self.REPORT_FORMATS[report_format]
+            report_file = (reporter_class.FILE_PREFIX, getattr(reporter_class, 'EXTENSION', 'xlsx'))
+            if report_file in report_files:
+                raise ValueError(f"Report formats {report_files[report_file]} and {report_format} "
+                                 f"write the same file {report_file[0]}_<period>.{report_file[1]}")
+            report_files[report_file] = report_format
+        if store_path:
+            # Пары для match_links собирает только построчный движок
+            if engine != 'python':
+                raise ValueError(f"The state store records match links and requires the python engine, "
+                                 f"not {engine}")
+            if checkpoint or columnar_path:
+                raise ValueError("The state store cannot be combined with a checkpoint or the columnar store")
+        
         self.data_folder = data_folder
         self.output_folder = output_folder
+        self.engine = engine
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.store_path = store_path
+        self.cache = LoaderCache(cache_folder) if cache_folder else None
+        self.columnar_path = columnar_path
+        # Генераторы создаются заранее: недостающая зависимость формата видна до сверки
+        self.reporters = [self._create_reporter(report_format) for report_format in report_formats]
+        self.result_store = PostgresResultStore(database_url) if database_url else None
+        self.run_id = run_id
         self.output_folder.mkdir(exist_ok=True)
     
     def run(self, period_start: datetime, period_end: datetime):
         """Запуск процесса аудита"""
-        logger.info("=" * 80)
-        logger.info(f"Starting VendBot Audit for period {period_start.date()} to {period_end.date()}")
-        logger.info("=" * 80)
-        
         try:
-            # 1. Загрузка данных
-            logger.info("Step 1: Loading data files...")
-            data = self._load_all_data()
+            result, _ = self.audit(period_start, period_end)
             
-            # 2. Сверка
-            logger.info("Step 2: Running reconciliation...")
-            engine = ReconciliationEngine()
-            result = engine.reconcile_all(
-                sales=data['sales'],
-                receipts=data['receipts'],
-                qr_transactions=data['qr_transactions'],
-                period_start=period_start,
-                period_end=period_end
-            )
-            
-            # 3. Генерация отчетов
-            logger.info("Step 3: Generating reports...")
-            self._generate_reports(result, period_start, period_end)
-            
-            # 4. Вывод сводки
+            # 5. Вывод сводки
             self._print_summary(result)
             
-            logger.info("=" * 80)
-            logger.info("Audit completed successfully!")
-            logger.info("=" * 80)
-            
         except Exception as e:
             logger.error(f"Audit failed: {e}", exc_info=True)
             sys.exit(1)
     
+    def audit(self, period_start: datetime, period_end: datetime) -> Tuple[ReconciliationResult, List[Path]]:
+        """Загрузка, сверка, отчеты и сохранение результата; возвращает результат и пути отчетов"""
+        logger.info("=" * 80)
+        logger.info(f"Starting VendBot Audit for period {period_start.date()} to {period_end.date()}")
+        logger.info("=" * 80)
+        
+        # 1. Загрузка данных
+        logger.info("Step 1: Loading data files...")
+        if self.store_path:
+            with AuditStateStore(self.store_path) as store:
+                data = self._load_from_store(store, period_start, period_end)
+                
+                # 2. Сверка
+                run_id = store.begin_run(period_start, period_end)
+                engine = self._create_engine()
+                engine.matches = []
+                result = self._reconcile(engine, data, period_start, period_end)
+                store.save_matches(run_id, engine.matches)
+                store.finish_run(run_id, result)
+        elif self.checkpoint:
+            # Инкрементальный режим читает файлы потоком: в памяти остается только новое окно
+            data = self._load_from_columnar() if self.columnar_path else self._stream_all_data()
+            
+            # 2. Сверка
+            logger.info(f"Step 2: Running incremental reconciliation (checkpoint {self.checkpoint})...")
+            result = self._reconcile_incremental(data, period_start, period_end)
+        else:
+            data = self._load_from_columnar() if self.columnar_path else self._load_all_data()
+            
+            # 2. Сверка
+            result = self._reconcile(self._create_engine(), data, period_start, period_end)
+        
+        # Ряд расхода ингредиентов (в инкрементальном режиме продажи не хранятся целиком)
+        if not self.checkpoint:
+            self._add_consumption_series(result, data, period_start, period_end)
+        
+        # 3. Генерация отчетов
+        logger.info("Step 3: Generating reports...")
+        report_paths = self._generate_reports(result, period_start, period_end)
+        
+        # 4. Сохранение результата в Postgres
+        if self.result_store:
+            run_id = self.run_id or run_id_for_period(period_start, period_end)
+            logger.info(f"Step 4: Saving results to Postgres (run {run_id})...")
+            asyncio.run(self.result_store.save_result(run_id, result))
+        
+        logger.info("=" * 80)
+        logger.info("Audit completed successfully!")
+        logger.info("=" * 80)
+        
+        return result, report_paths
+    
+    def _create_engine(self) -> ReconciliationEngine:
+        """Создание движка сверки"""
+        engine_class = self.ENGINES[self.engine]
+        if engine_class is ParallelReconciliationEngine:
+            return engine_class(workers=self.workers)
+        return engine_class()
+    
+    def _create_reporter(self, report_format: str) -> BaseReporter:
+        """Создание генератора отчета"""
+        reporter_class = self.REPORT_FORMATS[report_format]
+        if reporter_class is ParallelExcelReporter:
+            return reporter_class(workers=self.workers)
+        return reporter_class()
+    
+    def _reconcile(self, engine: ReconciliationEngine, data: dict,
+                   period_start: datetime, period_end: datetime):
+        """Сверка загруженных данных"""
+        logger.info(f"Step 2: Running reconciliation ({self.engine} engine)...")
+        return engine.reconcile_all(
+            sales=data['sales'],
+            receipts=data['receipts'],
+            qr_transactions=data['qr_transactions'],
+            period_start=period_start,
+            period_end=period_end
+        )
+    
+    def _add_consumption_series(self, result: ReconciliationResult, data: dict,
+                                period_start: datetime, period_end: datetime):
+        """Ряд расхода ингредиентов между пополнениями (нужны рецепты и движения ингредиентов)"""
+        if not data['recipes'] or not data['inventory_movements']:
+            logger.info("Ingredient consumption series skipped: no recipes or inventory movements")
+            return
+        
+        logger.info("Step 2a: Building ingredient consumption series...")
+        result.consumption_series = IngredientAnalyzer().consumption_series(
+            data['sales'], data['recipes'], data['inventory_movements'], period_start, period_end
+        )
+        logger.info(f"Consumption series: {len(result.consumption_series)} buckets")
+    
+    def _reconcile_incremental(self, data: dict, period_start: datetime, period_end: datetime):
+        """Инкрементальная сверка: обрабатываются только данные после контрольной точки"""
+        reconciler = None
+        if self.checkpoint.exists():
+            reconciler = IncrementalReconciler.load(self.checkpoint)
+            if reconciler.period_start != period_start:
+                logger.warning(f"Checkpoint period starts at {reconciler.period_start}, "
+                               f"not {period_start}. Starting from scratch.")
+                reconciler = None
+        
+        if reconciler is None:
+            reconciler = IncrementalReconciler(period_start)
+        
+        # Окно полуоткрытое, поэтому отметка ставится сразу после конца периода
+        watermark = period_end + timedelta(microseconds=1)
+        if watermark > reconciler.watermark:
+            reconciler.advance(
+                data['sales'], data['receipts'], data['qr_transactions'], watermark
+            )
+            reconciler.save(self.checkpoint)
+        
+        return reconciler.result(period_end)
+    
+    def _sources(self) -> List[Tuple[str, str, Path, Callable[[Path], BaseLoader]]]:
+        """Входные файлы: (источник, ключ данных, путь, фабрика загрузчика)
+
+        Фабрики сериализуются pickle: файлы загружаются в пуле процессов.
+        """
+        sources = [
+            ('sales', 'sales', self.data_folder / 'sales_report.xlsx', SalesLoader),
+            ('receipts', 'receipts', self.data_folder / 'kkm_receipts.csv', FiscalReceiptLoader)
+        ]
+        
+        for service in ['click', 'payme', 'uzum']:
+            sources.append((
+                f'qr_{service}', 'qr_transactions', self.data_folder / f'qr_{service}.xlsx',
+                partial(QRTransactionLoader, service=service)
+            ))
+        
+        sources.append(('recipes', 'recipes', self.data_folder / 'recipes.json', RecipeLoader))
+        sources.append(('inventory', 'inventory_movements', self.data_folder / 'inventory_movements.csv',
+                        InventoryLoader))
+        return sources
+    
     def _load_all_data(self) -> dict:
-        """Загрузка всех необходимых файлов"""
+        """Загрузка всех необходимых файлов (параллельно, по процессу на файл)"""
         data = {
             'sales': [],
             'receipts': [],
             'qr_transactions': [],
-            'recipes': {}
+            'recipes': {},
+            'inventory_movements': []
         }
         
-        # Загрузка продаж
-        sales_file = self.data_folder / 'sales_report.xlsx'
-        if sales_file.exists():
-            loader = SalesLoader(sales_file)
-            data['sales'] = loader.load()
-        else:
-            logger.warning(f"Sales file not found: {sales_file}")
+        tasks = []
+        for source, key, path, make_loader in self._sources():
+            if not path.exists():
+                logger.warning(f"{source} file not found: {path}")
+                continue
+            tasks.append(LoadTask(source, key, path, make_loader))
         
-        # Загрузка чеков
-        receipts_file = self.data_folder / 'kkm_receipts.csv'
-        if receipts_file.exists():
-            loader = FiscalReceiptLoader(receipts_file)
-            data['receipts'] = loader.load()
-        else:
-            logger.warning(f"Receipts file not found: {receipts_file}")
-        
-        # Загрузка QR транзакций
-        qr_services = ['click', 'payme', 'uzum']
-        for service in qr_services:
-            qr_file = self.data_folder / f'qr_{service}.xlsx'
-            if qr_file.exists():
-                loader = QRTransactionLoader(qr_file, service)
-                data['qr_transactions'].extend(loader.load())
+        started = time.perf_counter()
+        cache_folder = self.cache.cache_folder if self.cache else None
+        results = load_files(tasks, cache_folder, self.workers)
+        
+        failed = []
+        for result in results:
+            if result.error:
+                logger.error(f"{result.source}: loading {result.path} failed after "
+                             f"{result.elapsed:.2f}s: {result.error}")
+                failed.append(result.source)
+                continue
+            
+            logger.info(f"{result.source}: loaded {len(result.records)} records in {result.elapsed:.2f}s "
+                        f"({result.count(logging.WARNING)} warnings, {result.count(logging.ERROR)} errors)")
+            if result.key == 'recipes':
+                data['recipes'] = result.records
             else:
-                logger.warning(f"QR file not found: {qr_file}")
+                data[result.key].extend(result.records)
         
-        # Загрузка рецептов
-        recipes_file = self.data_folder / 'recipes.json'
-        if recipes_file.exists():
-            loader = RecipeLoader(recipes_file)
-            data['recipes'] = loader.load()
-        else:
-            logger.warning(f"Recipes file not found: {recipes_file}")
+        logger.info(f"Loaded {len(results)} files in {time.perf_counter() - started:.2f}s")
+        
+        if failed:
+            raise RuntimeError(f"Failed to load: {', '.join(failed)}")
+        
+        return data
+    
+    def _stream(self, loader: BaseLoader):
+        """Записи загрузчика потоком (через кеш разобранных файлов, если он включен)"""
+        return self.cache.stream(loader) if self.cache else loader.stream()
+    
+    def _stream_all_data(self) -> dict:
+        """Потоковые источники: записи читаются из файлов по мере потребления"""
+        streams = {
+            'sales': [],
+            'receipts': [],
+            'qr_transactions': []
+        }
+        
+        for source, key, path, make_loader in self._sources():
+            if key in self.REFERENCE_KEYS:
+                continue
+            if not path.exists():
+                logger.warning(f"{source} file not found: {path}")
+                continue
+            
+            streams[key].append(self._stream(make_loader(path)))
         
+        return {key: chain.from_iterable(parts) for key, parts in streams.items()}
+    
+    def _load_from_store(self, store: AuditStateStore, period_start: datetime, period_end: datetime) -> dict:
+        """Загрузка через хранилище: разбираются только изменившиеся файлы"""
+        data = {'recipes': {}, 'inventory_movements': []}
+        
+        for source, key, path, make_loader in self._sources():
+            if not path.exists():
+                logger.warning(f"{source} file not found: {path}")
+                continue
+            
+            if key in self.REFERENCE_KEYS:
+                data[key] = make_loader(path).load()
+            else:
+                store.ingest(source, key, path, make_loader(path).load)
+        
+        data.update(store.load_period(period_start, period_end))
         return data
     
-    def _generate_reports(self, result, period_start: datetime, period_end: datetime):
-        """Генерация отчетов"""
-        reporter = ExcelReporter()
+    def _load_from_columnar(self) -> dict:
+        """Загрузка через колоночное хранилище
+
+        Изменившиеся файлы разбираются и записываются в хранилище, записи
+        читаются пакетами RecordBatch из отображенных в память файлов.
+        """
+        store = ColumnarStore(self.columnar_path)
+        data = {'recipes': {}, 'inventory_movements': []}
         
-        # Основной отчет
-        report_name = f"audit_report_{period_start.strftime('%Y%m%d')}_{period_end.strftime('%Y%m%d')}.xlsx"
-        report_path = self.output_folder / report_name
+        # Источники без входного файла в этом запуске не читаются, даже если остались в хранилище
+        sources = []
+        for source, key, path, make_loader in self._sources():
+            if not path.exists():
+                logger.warning(f"{source} file not found: {path}")
+                continue
+            
+            if key in self.REFERENCE_KEYS:
+                data[key] = make_loader(path).load()
+            else:
+                store.ingest(source, key, path, make_loader(path).load_batch)
+                sources.append(source)
         
-        reporter.generate_reconciliation_report(result, report_path)
-        logger.info(f"Report saved to: {report_path}")
+        data.update(store.load_all(sources))
+        return data
+    
+    def _generate_reports(self, result, period_start: datetime, period_end: datetime) -> List[Path]:
+        """Генерация отчетов; возвращает пути файлов"""
+        report_paths = []
+        for reporter in self.reporters:
+            for report_path in reporter.generate(result, self.output_folder):
+                logger.info(f"Report saved to: {report_path}")
+                report_paths.append(report_path)
+        return report_paths
     
     def _print_summary(self, result):
         """Вывод сводки в консоль"""
@@ -142,6 +389,8 @@ class AuditRunner:
         print(f"Всего QR транзакций: {result.total_transactions}")
         print(f"Успешно сверено: {result.matched_count}")
         print(f"Выявлено несоответствий: {len(result.discrepancies)}")
+        if result.consumption_series:
+            print(f"Интервалов расхода ингредиентов: {len(result.consumption_series)}")
         
         if result.total_sales > 0:
             success_rate = (result.matched_count / result.total_sales) * 100
@@ -159,22 +408,6 @@ class AuditRunner:
         print("=" * 60)
 
 
-def parse_period(period_str: str) -> tuple[datetime, datetime]:
-    """Парсинг периода из строки формата YYYY-MM-DD:YYYY-MM-DD"""
-    try:
-        start_str, end_str = period_str.split(':')
-        start_date = datetime.strptime(start_str, '%Y-%m-%d')
-        end_date = datetime.strptime(end_str, '%Y-%m-%d')
-        
-        # Устанавливаем время начала и конца дня
-        period_start = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        period_end = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        return period_start, period_end
-    except Exception as e:
-        raise ValueError(f"Invalid period format. Use YYYY-MM-DD:YYYY-MM-DD. Error: {e}")
-
-
 def main():
     """Точка входа"""
     parser = argparse.ArgumentParser(
@@ -199,6 +432,88 @@ def main():
         help='Folder for output reports (default: ./reports/)'
     )
     
+    parser.add_argument(
+        '--engine',
+        choices=sorted(AuditRunner.ENGINES),
+        default='python',
+        help='Reconciliation engine: python (record by record), vectorized (pandas) '
+             'or parallel (per-machine process pool) (default: python)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Worker processes for file loading, the parallel engine and parallel reports (default: CPU count)'
+    )
+    
+    parser.add_argument(
+        '--checkpoint',
+        default=None,
+        help='Incremental mode: reconciliation checkpoint file; only data after '
+             'the checkpoint is reconciled and the checkpoint is updated'
+    )
+    
+    parser.add_argument(
+        '--store',
+        default=None,
+        help='SQLite state store: unchanged input files are not re-parsed, '
+             'records and match links are kept between runs (python engine only, '
+             'not combined with --checkpoint or --columnar-store)'
+    )
+    
+    parser.add_argument(
+        '--cache-folder',
+        default='./audit_cache/',
+        help='Folder for parsed input files; unchanged files are not parsed again '
+             '(default: ./audit_cache/)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always parse input files, do not use the parsed-input cache'
+    )
+    
+    parser.add_argument(
+        '--columnar-store',
+        default=None,
+        help='Folder of the memory-mapped columnar store (.npy per column): it is built or '
+             'refreshed from the upload folder and records are read from it via mmap'
+    )
+    
+    parser.add_argument(
+        '--format',
+        nargs='+',
+        choices=sorted(AuditRunner.REPORT_FORMATS),
+        default=['xlsx'],
+        help='Report formats: xlsx (full workbook), xlsx-stream (full workbook, write-only mode), '
+             'xlsx-summary (summary workbook without the discrepancy list), xlsx-parallel '
+             '(summary workbook plus discrepancy parts written in worker processes), csv, parquet '
+             '(discrepancy, machine and payment tables) (default: xlsx)'
+    )
+    
+    parser.add_argument(
+        '--streaming-report',
+        action='store_true',
+        help='Same as --format xlsx-stream: write the Excel report in streaming (write-only) '
+             'mode, memory use does not depend on the number of discrepancies'
+    )
+    
+    parser.add_argument(
+        '--database-url',
+        default=None,
+        help='Postgres URL: the reconciliation result, discrepancies and summaries are '
+             'saved to audit_* tables for the API and the bot (created by alembic upgrade head)'
+    )
+    
+    parser.add_argument(
+        '--run-id',
+        default=None,
+        help='Audit run id in Postgres; saving the same run id again replaces its rows '
+             '(default: <start>_<end> of the period)'
+    )
+    
     parser.add_argument(
         '--verbose',
         action='store_true',
@@ -225,9 +540,26 @@ def main():
         sys.exit(1)
     
     output_folder = Path(args.output_folder)
+    checkpoint = Path(args.checkpoint) if args.checkpoint else None
+    store_path = Path(args.store) if args.store else None
+    cache_folder = None if args.no_cache else Path(args.cache_folder)
+    columnar_path = Path(args.columnar_store) if args.columnar_store else None
+    # Повторы форматов (в том числе после замены xlsx на xlsx-stream) не нужны
+    report_formats = list(dict.fromkeys(
+        'xlsx-stream' if report_format == 'xlsx' and args.streaming_report else report_format
+        for report_format in args.format
+    ))
     
     # Запуск аудита
-    runner = AuditRunner(data_folder, output_folder)
+    try:
+        runner = AuditRunner(data_folder, output_folder, engine=args.engine,
+                             workers=args.workers, checkpoint=checkpoint, store_path=store_path,
+                             cache_folder=cache_folder, columnar_path=columnar_path,
+                             report_formats=report_formats, database_url=args.database_url,
+                             run_id=args.run_id)
+    except (ImportError, ValueError) as e:
+        logger.error(e)
+        sys.exit(1)
     runner.run(period_start, period_end)
 
 
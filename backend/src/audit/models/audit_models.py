@@ -1,8 +1,39 @@
-from dataclasses import dataclass
-from datetime import datetime
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Optional, List, Dict, Any
 from enum import Enum
+from operator import attrgetter
+
+# Начало отсчета времени записей (время без часового пояса, как в выгрузках)
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Местное время выгрузок (Узбекистан, UTC+5, без перехода на летнее время):
+# время с часовым поясом переводится в него и хранится без пояса
+LOCAL_TIMEZONE = timezone(timedelta(hours=5))
+
+def to_tiyin(amount: Decimal) -> int:
+    """Перевод суммы в сумах в целое число тийинов"""
+    return int((amount * 100).to_integral_value())
+
+def from_tiyin(amount: int) -> Decimal:
+    """Перевод целого числа тийинов в сумму в сумах"""
+    return Decimal(amount) / 100
+
+def to_local(value: datetime) -> datetime:
+    """Время с часовым поясом - в местное время без пояса; время без пояса не меняется"""
+    if value.tzinfo is not None:
+        return value.astimezone(LOCAL_TIMEZONE).replace(tzinfo=None)
+    return value
+
+def to_timestamp(value: datetime) -> int:
+    """Перевод даты и времени в целое число микросекунд от EPOCH"""
+    return (to_local(value) - EPOCH) // MICROSECOND
+
+def from_timestamp(value: int) -> datetime:
+    """Перевод микросекунд от EPOCH в дату и время"""
+    return EPOCH + timedelta(microseconds=value)
 
 class PaymentMethod(Enum):
     CASH = "cash"
@@ -24,47 +55,215 @@ class DiscrepancyType(Enum):
     EXCESS_CONSUMPTION = "excess_consumption"
     UNKNOWN_PAYMENT = "unknown_payment"
 
-@dataclass
-class SaleRecord:
+class _Record:
+    """Базовый класс записей источников: __slots__, деньги в тийинах, время в микросекундах
+
+    Запись хранит только целые числа и строки (без Decimal, datetime и
+    словаря исходной строки), поэтому миллионы записей занимают в разы
+    меньше памяти, чем dataclass. Публичные атрибуты datetime и amount
+    вычисляются из timestamp и amount_tiyin.
+    """
+
+    __slots__ = ()
+
+    # Поля для repr в порядке прежнего dataclass
+    _repr_fields: tuple = ()
+
+    @property
+    def datetime(self) -> datetime:
+        return from_timestamp(self.timestamp)
+
+    @datetime.setter
+    def datetime(self, value: datetime):
+        self.timestamp = to_timestamp(value)
+
+    @property
+    def amount(self) -> Decimal:
+        return from_tiyin(self.amount_tiyin)
+
+    @amount.setter
+    def amount(self, value: Decimal):
+        self.amount_tiyin = to_tiyin(value)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Значения всех полей одним вызовом (для сравнения и pickle)
+        cls._getter = attrgetter(*cls.__slots__)
+
+    def _values(self) -> tuple:
+        return self._getter(self)
+
+    def __reduce__(self):
+        # Компактнее и быстрее стандартной сериализации объектов со __slots__
+        return _restore_record, (self.__class__, self._values())
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._values() == other._values()
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self._repr_fields)
+        return f"{self.__class__.__name__}({fields})"
+
+
+def _restore_record(cls, values: tuple):
+    """Восстановление записи из pickle (значения в порядке __slots__)"""
+    return cls.from_epoch(*values)
+
+
+class SaleRecord(_Record):
     """Запись о продаже из системы вендинга"""
-    id: str
-    machine_id: str
-    datetime: datetime
-    product_code: str
-    product_name: str
-    amount: Decimal
-    payment_method: PaymentMethod
-    quantity: int = 1
-    raw_data: Dict[str, Any] = None
-    
+
+    __slots__ = ('id', 'machine_id', 'timestamp', 'product_code', 'product_name',
+                 'amount_tiyin', 'payment_method', 'quantity', 'raw_row')
+
+    _repr_fields = ('id', 'machine_id', 'datetime', 'product_code', 'product_name',
+                    'amount', 'payment_method', 'quantity', 'raw_row')
+
+    def __init__(self,
+                 id: str,
+                 machine_id: str,
+                 datetime: datetime,
+                 product_code: str,
+                 product_name: str,
+                 amount: Decimal,
+                 payment_method: PaymentMethod,
+                 quantity: int = 1,
+                 raw_row: Optional[int] = None):
+        self.id = id
+        self.machine_id = machine_id
+        self.timestamp = to_timestamp(datetime)
+        self.product_code = product_code
+        self.product_name = product_name
+        self.amount_tiyin = to_tiyin(amount)
+        self.payment_method = payment_method
+        self.quantity = quantity
+        # Номер строки данных в исходном файле (вместо копии самой строки)
+        self.raw_row = raw_row
+
+    @classmethod
+    def from_epoch(cls,
+                   id: str,
+                   machine_id: str,
+                   timestamp: int,
+                   product_code: str,
+                   product_name: str,
+                   amount_tiyin: int,
+                   payment_method: PaymentMethod,
+                   quantity: int = 1,
+                   raw_row: Optional[int] = None) -> 'SaleRecord':
+        """Создание из уже нормализованных значений (микросекунды от эпохи, тийины)"""
+        sale = cls.__new__(cls)
+        sale.id = id
+        sale.machine_id = machine_id
+        sale.timestamp = timestamp
+        sale.product_code = product_code
+        sale.product_name = product_name
+        sale.amount_tiyin = amount_tiyin
+        sale.payment_method = payment_method
+        sale.quantity = quantity
+        sale.raw_row = raw_row
+        return sale
+
     def __hash__(self):
-        return hash((self.machine_id, self.datetime, self.amount))
+        return hash((self.machine_id, self.timestamp, self.amount_tiyin))
 
-@dataclass
-class FiscalReceipt:
+
+class FiscalReceipt(_Record):
     """Фискальный чек из ККМ"""
-    receipt_number: str
-    machine_id: str
-    datetime: datetime
-    amount: Decimal
-    payment_method: PaymentMethod  # cash or card
-    items: List[Dict[str, Any]] = None
-    raw_data: Dict[str, Any] = None
-    
+
+    __slots__ = ('receipt_number', 'machine_id', 'timestamp', 'amount_tiyin',
+                 'payment_method', 'items', 'raw_row')
+
+    _repr_fields = ('receipt_number', 'machine_id', 'datetime', 'amount',
+                    'payment_method', 'items', 'raw_row')
+
+    def __init__(self,
+                 receipt_number: str,
+                 machine_id: str,
+                 datetime: datetime,
+                 amount: Decimal,
+                 payment_method: PaymentMethod,  # cash or card
+                 items: List[Dict[str, Any]] = None,
+                 raw_row: Optional[int] = None):
+        self.receipt_number = receipt_number
+        self.machine_id = machine_id
+        self.timestamp = to_timestamp(datetime)
+        self.amount_tiyin = to_tiyin(amount)
+        self.payment_method = payment_method
+        self.items = items
+        self.raw_row = raw_row
+
+    @classmethod
+    def from_epoch(cls,
+                   receipt_number: str,
+                   machine_id: str,
+                   timestamp: int,
+                   amount_tiyin: int,
+                   payment_method: PaymentMethod,
+                   items: List[Dict[str, Any]] = None,
+                   raw_row: Optional[int] = None) -> 'FiscalReceipt':
+        """Создание из уже нормализованных значений (микросекунды от эпохи, тийины)"""
+        receipt = cls.__new__(cls)
+        receipt.receipt_number = receipt_number
+        receipt.machine_id = machine_id
+        receipt.timestamp = timestamp
+        receipt.amount_tiyin = amount_tiyin
+        receipt.payment_method = payment_method
+        receipt.items = items
+        receipt.raw_row = raw_row
+        return receipt
+
     def __hash__(self):
-        return hash((self.machine_id, self.datetime, self.amount))
+        return hash((self.machine_id, self.timestamp, self.amount_tiyin))
 
-@dataclass
-class QRTransaction:
+
+class QRTransaction(_Record):
     """Транзакция через QR-код"""
-    transaction_id: str
-    service: str  # click, payme, uzum
-    datetime: datetime
-    amount: Decimal
-    machine_id: Optional[str] = None
-    status: str = "success"
-    raw_data: Dict[str, Any] = None
-    
+
+    __slots__ = ('transaction_id', 'service', 'timestamp', 'amount_tiyin',
+                 'machine_id', 'status', 'raw_row')
+
+    _repr_fields = ('transaction_id', 'service', 'datetime', 'amount',
+                    'machine_id', 'status', 'raw_row')
+
+    def __init__(self,
+                 transaction_id: str,
+                 service: str,  # click, payme, uzum
+                 datetime: datetime,
+                 amount: Decimal,
+                 machine_id: Optional[str] = None,
+                 status: str = "success",
+                 raw_row: Optional[int] = None):
+        self.transaction_id = transaction_id
+        self.service = service
+        self.timestamp = to_timestamp(datetime)
+        self.amount_tiyin = to_tiyin(amount)
+        self.machine_id = machine_id
+        self.status = status
+        self.raw_row = raw_row
+
+    @classmethod
+    def from_epoch(cls,
+                   transaction_id: str,
+                   service: str,
+                   timestamp: int,
+                   amount_tiyin: int,
+                   machine_id: Optional[str] = None,
+                   status: str = "success",
+                   raw_row: Optional[int] = None) -> 'QRTransaction':
+        """Создание из уже нормализованных значений (микросекунды от эпохи, тийины)"""
+        transaction = cls.__new__(cls)
+        transaction.transaction_id = transaction_id
+        transaction.service = service
+        transaction.timestamp = timestamp
+        transaction.amount_tiyin = amount_tiyin
+        transaction.machine_id = machine_id
+        transaction.status = status
+        transaction.raw_row = raw_row
+        return transaction
+
     def __hash__(self):
         return hash((self.service, self.transaction_id))
 
@@ -109,6 +308,28 @@ class Discrepancy:
     amount_difference: Optional[Decimal] = None
     severity: str = "medium"  # low, medium, high, critical
 
+@dataclass
+class ConsumptionBucket:
+    """Расход ингредиента машины за интервал: теоретический и пополненный"""
+    machine_id: str
+    ingredient_code: str
+    start: datetime
+    end: datetime
+    theoretical: Decimal
+    refilled: Decimal
+    # False - интервал не закрыт пополнением (после последнего пополнения периода)
+    closed: bool = True
+
+    @property
+    def variance(self) -> Decimal:
+        return self.refilled - self.theoretical
+
+    @property
+    def variance_percent(self) -> Optional[float]:
+        if self.theoretical == 0:
+            return None
+        return float(self.variance / self.theoretical * 100)
+
 @dataclass
 class ReconciliationResult:
     """Результат сверки"""
@@ -120,4 +341,6 @@ class ReconciliationResult:
     matched_count: int
     discrepancies: List[Discrepancy]
     summary_by_machine: Dict[str, Dict[str, Any]]
-    summary_by_payment: Dict[str, Dict[str, Any]]
\ No newline at end of file
+    summary_by_payment: Dict[str, Dict[str, Any]]
+    # Ряд расхода ингредиентов (IngredientAnalyzer.consumption_series), если рассчитан
+    consumption_series: List[ConsumptionBucket] = field(default_factory=list)
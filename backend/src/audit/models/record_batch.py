@@ -0,0 +1,304 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .audit_models import SaleRecord, FiscalReceipt, QRTransaction, PaymentMethod
+
+# Коды методов оплаты: позиция в PAYMENT_METHODS
+PAYMENT_METHODS = list(PaymentMethod)
+PAYMENT_CODES = {method: code for code, method in enumerate(PAYMENT_METHODS)}
+PAYMENT_VALUES = np.array([method.value for method in PAYMENT_METHODS], dtype=object)
+
+# Метод оплаты QR транзакции по платежной системе
+QR_SERVICE_METHODS = {
+    'click': PaymentMethod.QR_CLICK,
+    'payme': PaymentMethod.QR_PAYME,
+    'uzum': PaymentMethod.QR_UZUM
+}
+
+# Вид записей: класс записи и поля, хранимые отдельными колонками объектов
+KINDS = {
+    'sales': (SaleRecord, ('id', 'product_code', 'product_name', 'quantity')),
+    'receipts': (FiscalReceipt, ('receipt_number', 'items')),
+    'qr_transactions': (QRTransaction, ('transaction_id', 'service', 'status'))
+}
+
+
+class RecordBatch:
+    """Колоночный пакет записей одного вида (продажи, чеки или QR транзакции)
+
+    Основные поля хранятся параллельными массивами NumPy:
+    machine_codes - коды машин (категории - machines), timestamps -
+    микросекунды от эпохи (int64), amounts - тийины (int64),
+    payment_codes - коды методов оплаты (позиция в PAYMENT_METHODS),
+    rows - номер строки в исходном файле (-1 - неизвестен). Остальные
+    поля записей - колонки объектов в fields.
+
+    Строки упорядочены по (машина, время), поэтому записи одной машины
+    и их временной диапазон - непрерывный срез: for_machine() и between()
+    для одной машины возвращают представления (views) без копирования.
+    """
+
+    __slots__ = ('kind', 'machines', 'machine_codes', 'timestamps', 'amounts',
+                 'payment_codes', 'rows', 'fields', '_machine_lookup')
+
+    def __init__(self,
+                 kind: str,
+                 machines: np.ndarray,
+                 machine_codes: np.ndarray,
+                 timestamps: np.ndarray,
+                 amounts: np.ndarray,
+                 payment_codes: np.ndarray,
+                 rows: np.ndarray,
+                 fields: Dict[str, np.ndarray]):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown record kind: {kind}")
+        self.kind = kind
+        self.machines = machines
+        self.machine_codes = machine_codes
+        self.timestamps = timestamps
+        self.amounts = amounts
+        self.payment_codes = payment_codes
+        self.rows = rows
+        self.fields = fields
+        self._machine_lookup: Optional[Dict[Any, int]] = None
+
+    @classmethod
+    def from_columns(cls,
+                     kind: str,
+                     machine_ids: Sequence[Optional[str]],
+                     timestamps: Sequence[int],
+                     amounts: Sequence[int],
+                     payment_methods: Sequence[PaymentMethod],
+                     rows: Optional[Sequence[int]] = None,
+                     **fields: Sequence[Any]) -> 'RecordBatch':
+        """Пакет из колонок значений (в любом порядке строк)
+
+        fields - остальные поля записей вида kind (см. KINDS).
+        """
+        names = KINDS[kind][1]
+        missing = set(names) - set(fields)
+        if missing:
+            raise ValueError(f"Missing fields for {kind}: {missing}")
+
+        size = len(timestamps)
+        payment_codes = np.fromiter(
+            (PAYMENT_CODES[method] for method in payment_methods), dtype=np.int8, count=size
+        )
+        if rows is None:
+            rows = np.full(size, -1, dtype=np.int64)
+        elif not isinstance(rows, np.ndarray):
+            rows = np.fromiter((-1 if row is None else row for row in rows), dtype=np.int64, count=size)
+
+        return cls._sorted(kind, machine_ids, timestamps, amounts, payment_codes, rows,
+                           {name: fields[name] for name in names})
+
+    @classmethod
+    def _sorted(cls,
+                kind: str,
+                machine_ids: Sequence[Optional[str]],
+                timestamps: Sequence[int],
+                amounts: Sequence[int],
+                payment_codes: np.ndarray,
+                rows: np.ndarray,
+                fields: Dict[str, Sequence[Any]]) -> 'RecordBatch':
+        """Пакет со строками, упорядоченными по (машина, время)"""
+        # None (машина не указана) остается отдельной категорией
+        machine_codes, machines = pd.factorize(_object_column(machine_ids), use_na_sentinel=False)
+        machines = np.asarray(machines, dtype=object)
+        machines[pd.isna(machines)] = None
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+
+        order = np.lexsort((timestamps, machine_codes))
+        return cls(
+            kind,
+            machines,
+            machine_codes.astype(np.int32)[order],
+            timestamps[order],
+            np.asarray(amounts, dtype=np.int64)[order],
+            np.asarray(payment_codes, dtype=np.int8)[order],
+            np.asarray(rows, dtype=np.int64)[order],
+            {name: _object_column(column)[order] for name, column in fields.items()}
+        )
+
+    @classmethod
+    def from_records(cls, kind: str, records: Iterable[Any]) -> 'RecordBatch':
+        """Пакет из объектов записей"""
+        records = list(records)
+        names = KINDS[kind][1]
+        if kind == 'qr_transactions':
+            payment_methods = [QR_SERVICE_METHODS.get(record.service, PaymentMethod.UNKNOWN) for record in records]
+        else:
+            payment_methods = [record.payment_method for record in records]
+
+        return cls.from_columns(
+            kind,
+            [record.machine_id for record in records],
+            [record.timestamp for record in records],
+            [record.amount_tiyin for record in records],
+            payment_methods,
+            [record.raw_row for record in records],
+            **{name: [getattr(record, name) for record in records] for name in names}
+        )
+
+    @classmethod
+    def concat(cls, batches: Sequence['RecordBatch']) -> 'RecordBatch':
+        """Объединение пакетов одного вида (например, порций загрузчика)"""
+        if not batches:
+            raise ValueError("Nothing to concatenate")
+        kind = batches[0].kind
+        if any(batch.kind != kind for batch in batches):
+            raise ValueError("Cannot concatenate batches of different kinds")
+        if len(batches) == 1:
+            return batches[0]
+
+        return cls._sorted(
+            kind,
+            np.concatenate([batch.machine_ids for batch in batches]),
+            np.concatenate([batch.timestamps for batch in batches]),
+            np.concatenate([batch.amounts for batch in batches]),
+            np.concatenate([batch.payment_codes for batch in batches]),
+            np.concatenate([batch.rows for batch in batches]),
+            {
+                name: np.concatenate([batch.fields[name] for batch in batches])
+                for name in KINDS[kind][1]
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        """Запись по позиции или пакет-представление по срезу"""
+        if isinstance(key, slice):
+            return self._view(key)
+        return self.record(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        for position in range(len(self)):
+            yield self.record(position)
+
+    @property
+    def machine_ids(self) -> np.ndarray:
+        """ID машин по строкам (массив объектов)"""
+        return self.machines[self.machine_codes]
+
+    @property
+    def payment_values(self) -> np.ndarray:
+        """Значения методов оплаты по строкам ('cash', 'card', ...)"""
+        return PAYMENT_VALUES[self.payment_codes]
+
+    def machine_list(self) -> List[Optional[str]]:
+        """ID машин, присутствующих в пакете, в порядке строк"""
+        codes = np.unique(self.machine_codes)
+        return self.machines[codes].tolist()
+
+    def for_machine(self, machine_id: Optional[str]) -> 'RecordBatch':
+        """Записи одной машины (представление без копирования)"""
+        code = self._machine_code(machine_id)
+        if code is None:
+            return self._view(slice(0, 0))
+        start, end = np.searchsorted(self.machine_codes, [code, code + 1])
+        return self._view(slice(int(start), int(end)))
+
+    def iter_machines(self) -> Iterator[tuple]:
+        """Пары (ID машины, представление с ее записями)"""
+        codes = self.machine_codes
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], bounds)) if len(codes) else np.array([], dtype=np.int64)
+        ends = np.concatenate((bounds, [len(codes)])) if len(codes) else np.array([], dtype=np.int64)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield self.machines[codes[start]], self._view(slice(start, end))
+
+    def between(self, start: int, end: int) -> 'RecordBatch':
+        """Записи с временем в [start, end] (микросекунды от эпохи)
+
+        Для пакета одной машины - представление без копирования; для
+        нескольких машин строки выбираются маской (копия).
+        """
+        codes = self.machine_codes
+        if len(codes) == 0 or codes[0] == codes[-1]:
+            lower = np.searchsorted(self.timestamps, start, side='left')
+            upper = np.searchsorted(self.timestamps, end, side='right')
+            return self._view(slice(int(lower), int(upper)))
+
+        mask = (self.timestamps >= start) & (self.timestamps <= end)
+        return self._derive(mask)
+
+    def record(self, position: int) -> Any:
+        """Объект записи для строки position"""
+        record_class, names = KINDS[self.kind]
+        machine_id = self.machines[self.machine_codes[position]]
+        timestamp = int(self.timestamps[position])
+        amount = int(self.amounts[position])
+        row = int(self.rows[position])
+        raw_row = None if row < 0 else row
+        values = {name: _python_value(self.fields[name][position]) for name in names}
+
+        if self.kind == 'sales':
+            return record_class.from_epoch(
+                values['id'], machine_id, timestamp, values['product_code'], values['product_name'],
+                amount, PAYMENT_METHODS[self.payment_codes[position]], values['quantity'], raw_row
+            )
+        if self.kind == 'receipts':
+            return record_class.from_epoch(
+                values['receipt_number'], machine_id, timestamp, amount,
+                PAYMENT_METHODS[self.payment_codes[position]], values['items'], raw_row
+            )
+        return record_class.from_epoch(
+            values['transaction_id'], values['service'], timestamp, amount,
+            machine_id, values['status'], raw_row
+        )
+
+    def to_records(self) -> List[Any]:
+        """Все записи объектами"""
+        return list(self)
+
+    def _machine_code(self, machine_id: Optional[str]) -> Optional[int]:
+        if self._machine_lookup is None:
+            self._machine_lookup = {machine: code for code, machine in enumerate(self.machines.tolist())}
+        return self._machine_lookup.get(machine_id)
+
+    def _view(self, key: slice) -> 'RecordBatch':
+        """Пакет-представление среза строк (массивы не копируются)"""
+        if key.step not in (None, 1):
+            raise ValueError("Only contiguous slices are supported")
+        return self._derive(key)
+
+    def _derive(self, selector: Union[slice, np.ndarray]) -> 'RecordBatch':
+        """Пакет из строк по срезу (представление) или маске (копия)"""
+        batch = RecordBatch(
+            self.kind,
+            self.machines,
+            self.machine_codes[selector],
+            self.timestamps[selector],
+            self.amounts[selector],
+            self.payment_codes[selector],
+            self.rows[selector],
+            {name: column[selector] for name, column in self.fields.items()}
+        )
+        batch._machine_lookup = self._machine_lookup
+        return batch
+
+
+def _object_column(values: Sequence[Any]) -> np.ndarray:
+    """Колонка значений произвольного типа (списки позиций чека не разворачиваются)"""
+    if isinstance(values, np.ndarray):
+        if values.dtype == object:
+            return values
+        # Скаляры NumPy заменяются значениями Python
+        values = values.tolist()
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def _python_value(value: Any) -> Any:
+    """Значение Python вместо скаляра NumPy (колонки, открытые из файлов .npy)"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def as_records(records: Union[RecordBatch, Sequence[Any]]) -> Sequence[Any]:
+    """Объекты записей из пакета или последовательность как есть"""
+    if isinstance(records, RecordBatch):
+        return records.to_records()
+    return records
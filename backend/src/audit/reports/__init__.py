@@ -0,0 +1,17 @@
+from .base_reporter import BaseReporter
+from .excel_reporter import ExcelReporter
+from .streaming_reporter import StreamingExcelReporter
+from .summary_reporter import SummaryExcelReporter
+from .table_reporter import TableReporter, CsvReporter, ParquetReporter
+from .parallel_reporter import ParallelExcelReporter
+
+__all__ = [
+    'BaseReporter',
+    'ExcelReporter',
+    'StreamingExcelReporter',
+    'SummaryExcelReporter',
+    'TableReporter',
+    'CsvReporter',
+    'ParquetReporter',
+    'ParallelExcelReporter',
+]
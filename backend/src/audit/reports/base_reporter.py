@@ -0,0 +1,26 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Optional
+
+from ..models.audit_models import ReconciliationResult
+
+
+class BaseReporter(ABC):
+    """Базовый класс для генераторов отчетов
+
+    Генератор записывает результат сверки в папку отчетов одним или
+    несколькими файлами; имена файлов строятся из FILE_PREFIX и периода.
+    """
+
+    # Префикс имен файлов отчета
+    FILE_PREFIX = 'audit_report'
+
+    @abstractmethod
+    def generate(self, result: ReconciliationResult, output_folder: Path) -> List[Path]:
+        """Генерация отчета; возвращает пути созданных файлов"""
+        pass
+
+    def report_name(self, result: ReconciliationResult, prefix: Optional[str] = None) -> str:
+        """Имя отчета без расширения: префикс (по умолчанию FILE_PREFIX) и период сверки"""
+        return (f"{prefix or self.FILE_PREFIX}_{result.period_start.strftime('%Y%m%d')}"
+                f"_{result.period_end.strftime('%Y%m%d')}")
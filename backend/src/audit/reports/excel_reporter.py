@@ -3,16 +3,59 @@ from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
 import logging
 
-from ..models.audit_models import ReconciliationResult, Discrepancy, DiscrepancyType
+from ..models.audit_models import ReconciliationResult, Discrepancy, DiscrepancyType, ConsumptionBucket
+from .base_reporter import BaseReporter
 
 logger = logging.getLogger(__name__)
 
-class ExcelReporter:
+
+class ColumnWidths:
+    """Ширина колонок листа, накапливаемая по мере записи строк
+    
+    Длина каждого значения вычисляется один раз при записи; ширина
+    применяется к листу один раз в конце, без повторного обхода ячеек.
+    """
+    
+    def __init__(self, max_width: int = 50, padding: int = 2):
+        self.max_width = max_width
+        self.padding = padding
+        self.lengths: List[int] = []
+    
+    def update(self, values: List[Any]):
+        """Учет значений строки (по колонкам, начиная с A)"""
+        lengths = self.lengths
+        for col_idx, value in enumerate(values):
+            if value is None:
+                continue
+            length = len(value) if type(value) is str else len(str(value))
+            if col_idx >= len(lengths):
+                lengths.extend([0] * (col_idx + 1 - len(lengths)))
+            if length > lengths[col_idx]:
+                lengths[col_idx] = length
+    
+    def widths(self) -> List[int]:
+        """Ширина колонок: самое длинное значение плюс отступ, не больше max_width"""
+        return [min(length + self.padding, self.max_width) for length in self.lengths]
+    
+    def apply(self, ws):
+        """Установка ширины колонок листа"""
+        for col_idx, width in enumerate(self.widths(), start=1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+
+class ExcelReporter(BaseReporter):
     """Генератор Excel отчетов"""
     
+    # Заголовки таблиц отчета
+    DISCREPANCY_HEADERS = ["Тип", "Машина", "Дата/Время", "Описание", "Сумма разницы", "Важность"]
+    MACHINE_HEADERS = ["Машина", "Продаж", "Сумма", "Несоответствий", "Наличные", "Карта", "QR"]
+    PAYMENT_HEADERS = ["Метод оплаты", "Количество", "Сумма", "Сверено", "Не сверено", "% успеха"]
+    CONSUMPTION_HEADERS = ["Машина", "Ингредиент", "Начало", "Конец", "Теоретический расход",
+                           "Пополнено", "Отклонение", "Отклонение, %", "Закрыт пополнением"]
+    
     def __init__(self):
         self.wb = None
         self.styles = self._create_styles()
@@ -51,6 +94,11 @@ class ExcelReporter:
             )
         }
     
+    def generate(self, result: ReconciliationResult, output_folder: Path) -> List[Path]:
+        """Генерация отчета о сверке в папку отчетов"""
+        output_path = output_folder / f"{self.report_name(result)}.xlsx"
+        return [self.generate_reconciliation_report(result, output_path)]
+    
     def generate_reconciliation_report(self, 
                                      result: ReconciliationResult,
                                      output_path: Path) -> Path:
@@ -67,6 +115,8 @@ class ExcelReporter:
         self._create_discrepancies_sheet(result.discrepancies)
         self._create_machine_summary_sheet(result.summary_by_machine)
         self._create_payment_summary_sheet(result.summary_by_payment)
+        if result.consumption_series:
+            self._create_consumption_sheet(result.consumption_series)
         
         # Сохраняем файл
         self.wb.save(output_path)
@@ -80,24 +130,19 @@ class ExcelReporter:
         
         # Заголовок
         ws.merge_cells('A1:F1')
-        ws['A1'] = f"Отчет о сверке за период {result.period_start.date()} - {result.period_end.date()}"
+        ws['A1'] = self._summary_title(result)
         ws['A1'].font = self.styles['header']['font']
         ws['A1'].fill = self.styles['header']['fill']
         ws['A1'].alignment = self.styles['header']['alignment']
+        widths = ColumnWidths()
+        widths.update([ws['A1'].value])
         
         # Основные показатели
-        data = [
-            ["Показатель", "Значение"],
-            ["Всего продаж", result.total_sales],
-            ["Всего чеков", result.total_receipts],
-            ["Всего QR транзакций", result.total_transactions],
-            ["Сверено успешно", result.matched_count],
-            ["Выявлено несоответствий", len(result.discrepancies)],
-            ["% успешной сверки", f"{(result.matched_count / result.total_sales * 100):.1f}%" if result.total_sales > 0 else "0%"]
-        ]
+        data = self._summary_rows(result, len(result.discrepancies))
         
         start_row = 3
         for row_idx, row_data in enumerate(data):
+            widths.update(row_data)
             for col_idx, value in enumerate(row_data):
                 cell = ws.cell(row=start_row + row_idx, column=col_idx + 1, value=value)
                 if row_idx == 0:
@@ -106,15 +151,16 @@ class ExcelReporter:
                 cell.border = self.styles['border']
         
         # Автоширина колонок
-        self._autosize_columns(ws)
+        widths.apply(ws)
     
     def _create_discrepancies_sheet(self, discrepancies: List[Discrepancy]):
         """Создание листа с несоответствиями"""
         ws = self.wb.create_sheet("Несоответствия")
         
         # Заголовки
-        headers = ["Тип", "Машина", "Дата/Время", "Описание", "Сумма разницы", "Важность"]
-        for col_idx, header in enumerate(headers):
+        widths = ColumnWidths()
+        widths.update(self.DISCREPANCY_HEADERS)
+        for col_idx, header in enumerate(self.DISCREPANCY_HEADERS):
             cell = ws.cell(row=1, column=col_idx + 1, value=header)
             cell.font = Font(bold=True)
             cell.fill = self.styles['subheader']['fill']
@@ -122,107 +168,172 @@ class ExcelReporter:
         
         # Данные
         for row_idx, discrepancy in enumerate(discrepancies, start=2):
-            ws.cell(row=row_idx, column=1, value=discrepancy.type.value)
-            ws.cell(row=row_idx, column=2, value=discrepancy.machine_id)
-            ws.cell(row=row_idx, column=3, value=discrepancy.datetime.strftime("%Y-%m-%d %H:%M:%S"))
-            ws.cell(row=row_idx, column=4, value=discrepancy.description)
-            ws.cell(row=row_idx, column=5, value=float(discrepancy.amount_difference) if discrepancy.amount_difference else "")
+            values = self._discrepancy_values(discrepancy)
+            widths.update(values)
+            for col_idx, value in enumerate(values):
+                ws.cell(row=row_idx, column=col_idx + 1, value=value)
             
-            severity_cell = ws.cell(row=row_idx, column=6, value=discrepancy.severity)
+            severity_cell = ws.cell(row=row_idx, column=6)
             severity_cell.fill = self.styles.get(discrepancy.severity, {}).get('fill', PatternFill())
             
             # Применяем границы
             for col in range(1, 7):
                 ws.cell(row=row_idx, column=col).border = self.styles['border']
         
-        self._autosize_columns(ws)
+        widths.apply(ws)
     
     def _create_machine_summary_sheet(self, summary: Dict[str, Dict[str, Any]]):
         """Создание листа со сводкой по машинам"""
         ws = self.wb.create_sheet("По машинам")
         
         # Заголовки
-        headers = ["Машина", "Продаж", "Сумма", "Несоответствий", "Наличные", "Карта", "QR"]
-        for col_idx, header in enumerate(headers):
+        widths = ColumnWidths()
+        widths.update(self.MACHINE_HEADERS)
+        for col_idx, header in enumerate(self.MACHINE_HEADERS):
             cell = ws.cell(row=1, column=col_idx + 1, value=header)
             cell.font = Font(bold=True)
             cell.fill = self.styles['subheader']['fill']
             cell.border = self.styles['border']
         
         # Данные
-        row_idx = 2
-        for machine_id, data in sorted(summary.items()):
-            ws.cell(row=row_idx, column=1, value=machine_id)
-            ws.cell(row=row_idx, column=2, value=data['total_sales'])
-            ws.cell(row=row_idx, column=3, value=float(data['total_amount']))
-            ws.cell(row=row_idx, column=4, value=data['discrepancies'])
-            
-            # Методы оплаты
-            ws.cell(row=row_idx, column=5, value=data['payment_methods'].get('cash', 0))
-            ws.cell(row=row_idx, column=6, value=data['payment_methods'].get('card', 0))
-            
-            qr_total = (data['payment_methods'].get('qr_click', 0) +
-                       data['payment_methods'].get('qr_payme', 0) +
-                       data['payment_methods'].get('qr_uzum', 0))
-            ws.cell(row=row_idx, column=7, value=qr_total)
+        for row_idx, values in enumerate(self._machine_rows(summary), start=2):
+            widths.update(values)
+            for col_idx, value in enumerate(values):
+                ws.cell(row=row_idx, column=col_idx + 1, value=value)
             
             # Применяем границы
             for col in range(1, 8):
                 ws.cell(row=row_idx, column=col).border = self.styles['border']
-            
-            row_idx += 1
         
-        self._autosize_columns(ws)
+        widths.apply(ws)
     
     def _create_payment_summary_sheet(self, summary: Dict[str, Dict[str, Any]]):
         """Создание листа со сводкой по методам оплаты"""
         ws = self.wb.create_sheet("По оплате")
         
         # Заголовки
-        headers = ["Метод оплаты", "Количество", "Сумма", "Сверено", "Не сверено", "% успеха"]
-        for col_idx, header in enumerate(headers):
+        widths = ColumnWidths()
+        widths.update(self.PAYMENT_HEADERS)
+        for col_idx, header in enumerate(self.PAYMENT_HEADERS):
             cell = ws.cell(row=1, column=col_idx + 1, value=header)
             cell.font = Font(bold=True)
             cell.fill = self.styles['subheader']['fill']
             cell.border = self.styles['border']
         
         # Данные
-        row_idx = 2
-        for payment_method, data in sorted(summary.items()):
-            ws.cell(row=row_idx, column=1, value=payment_method)
-            ws.cell(row=row_idx, column=2, value=data['count'])
-            ws.cell(row=row_idx, column=3, value=float(data['amount']))
-            ws.cell(row=row_idx, column=4, value=data['matched'])
-            ws.cell(row=row_idx, column=5, value=data['unmatched'])
-            
-            success_rate = (data['matched'] / data['count'] * 100) if data['count'] > 0 else 0
-            ws.cell(row=row_idx, column=6, value=f"{success_rate:.1f}%")
+        for row_idx, (values, problematic) in enumerate(self._payment_rows(summary), start=2):
+            widths.update(values)
+            for col_idx, value in enumerate(values):
+                ws.cell(row=row_idx, column=col_idx + 1, value=value)
             
             # Подсветка проблемных методов
-            if success_rate < 90:
+            if problematic:
                 for col in range(1, 7):
                     ws.cell(row=row_idx, column=col).fill = self.styles['medium']['fill']
             
             # Применяем границы
             for col in range(1, 7):
                 ws.cell(row=row_idx, column=col).border = self.styles['border']
-            
-            row_idx += 1
         
-        self._autosize_columns(ws)
+        widths.apply(ws)
     
-    def _autosize_columns(self, ws):
-        """Автоматическая настройка ширины колонок"""
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
\ No newline at end of file
+    def _create_consumption_sheet(self, series: List[ConsumptionBucket]):
+        """Создание листа с рядом расхода ингредиентов"""
+        ws = self.wb.create_sheet("Расход ингредиентов")
+        
+        # Заголовки
+        widths = ColumnWidths()
+        widths.update(self.CONSUMPTION_HEADERS)
+        for col_idx, header in enumerate(self.CONSUMPTION_HEADERS):
+            cell = ws.cell(row=1, column=col_idx + 1, value=header)
+            cell.font = Font(bold=True)
+            cell.fill = self.styles['subheader']['fill']
+            cell.border = self.styles['border']
+        
+        # Данные
+        for row_idx, values in enumerate(self._consumption_rows(series), start=2):
+            widths.update(values)
+            for col_idx, value in enumerate(values):
+                cell = ws.cell(row=row_idx, column=col_idx + 1, value=value)
+                cell.border = self.styles['border']
+        
+        widths.apply(ws)
+    
+    @staticmethod
+    def _summary_title(result: ReconciliationResult) -> str:
+        return f"Отчет о сверке за период {result.period_start.date()} - {result.period_end.date()}"
+    
+    @staticmethod
+    def _summary_rows(result: ReconciliationResult, discrepancy_count: int) -> List[List[Any]]:
+        """Таблица основных показателей (первая строка - заголовки)"""
+        return [
+            ["Показатель", "Значение"],
+            ["Всего продаж", result.total_sales],
+            ["Всего чеков", result.total_receipts],
+            ["Всего QR транзакций", result.total_transactions],
+            ["Сверено успешно", result.matched_count],
+            ["Выявлено несоответствий", discrepancy_count],
+            ["% успешной сверки", f"{(result.matched_count / result.total_sales * 100):.1f}%" if result.total_sales > 0 else "0%"]
+        ]
+    
+    @staticmethod
+    def _discrepancy_values(discrepancy: Discrepancy) -> List[Any]:
+        """Значения строки несоответствия (в порядке DISCREPANCY_HEADERS)"""
+        return [
+            discrepancy.type.value,
+            discrepancy.machine_id,
+            discrepancy.datetime.strftime("%Y-%m-%d %H:%M:%S"),
+            discrepancy.description,
+            float(discrepancy.amount_difference) if discrepancy.amount_difference else "",
+            discrepancy.severity
+        ]
+    
+    @staticmethod
+    def _machine_rows(summary: Dict[str, Dict[str, Any]]) -> Iterator[List[Any]]:
+        """Строки сводки по машинам (в порядке MACHINE_HEADERS)"""
+        for machine_id, data in sorted(summary.items()):
+            payment_methods = data['payment_methods']
+            qr_total = (payment_methods.get('qr_click', 0) +
+                        payment_methods.get('qr_payme', 0) +
+                        payment_methods.get('qr_uzum', 0))
+            yield [
+                machine_id,
+                data['total_sales'],
+                float(data['total_amount']),
+                data['discrepancies'],
+                payment_methods.get('cash', 0),
+                payment_methods.get('card', 0),
+                qr_total
+            ]
+    
+    @staticmethod
+    def _payment_rows(summary: Dict[str, Dict[str, Any]]) -> Iterator[Tuple[List[Any], bool]]:
+        """Строки сводки по методам оплаты и признак проблемного метода (успех < 90%)"""
+        for payment_method, data in sorted(summary.items()):
+            success_rate = (data['matched'] / data['count'] * 100) if data['count'] > 0 else 0
+            values = [
+                payment_method,
+                data['count'],
+                float(data['amount']),
+                data['matched'],
+                data['unmatched'],
+                f"{success_rate:.1f}%"
+            ]
+            yield values, success_rate < 90
+    
+    @staticmethod
+    def _consumption_rows(series: List[ConsumptionBucket]) -> Iterator[List[Any]]:
+        """Строки ряда расхода ингредиентов (в порядке CONSUMPTION_HEADERS)"""
+        for bucket in series:
+            variance_percent = bucket.variance_percent
+            yield [
+                bucket.machine_id,
+                bucket.ingredient_code,
+                bucket.start.strftime("%Y-%m-%d %H:%M:%S"),
+                bucket.end.strftime("%Y-%m-%d %H:%M:%S"),
+                float(bucket.theoretical),
+                float(bucket.refilled),
+                float(bucket.variance),
+                round(variance_percent, 1) if variance_percent is not None else "",
+                "да" if bucket.closed else "нет"
+            ]
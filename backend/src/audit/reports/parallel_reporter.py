@@ -0,0 +1,114 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+import os
+import time
+
+from ..models.audit_models import ReconciliationResult
+from .base_reporter import BaseReporter
+from .excel_reporter import ExcelReporter
+from .streaming_reporter import StreamingExcelReporter
+from .summary_reporter import SummaryExcelReporter
+
+logger = logging.getLogger(__name__)
+
+
+def render_discrepancy_part(output_path: Path, title: str, rows: List[List[Any]]) -> Tuple[int, float]:
+    """Запись части листа несоответствий в рабочем процессе
+
+    Возвращает число строк и время записи в секундах.
+    """
+    started = time.perf_counter()
+    count = StreamingExcelReporter().generate_discrepancies_workbook(rows, output_path, title)
+    return count, time.perf_counter() - started
+
+
+class ParallelExcelReporter(BaseReporter):
+    """Excel отчет, листы которого пишутся параллельно
+
+    Основная книга (audit_parallel_<период>.xlsx) - сводка, типы
+    несоответствий и сводки по машинам и методам оплаты - пишется в
+    текущем процессе. Лист несоответствий делится на части по
+    ROWS_PER_PART строк, и каждая часть пишется отдельной книгой
+    audit_discrepancies_<период>_partNN.xlsx в своем рабочем процессе
+    (openpyxl write_only). Время записи каждого листа выводится в журнал
+    и сохраняется в timings.
+    """
+
+    # Свой префикс: основная книга не заменяет полный отчет audit_report_<период>.xlsx
+    FILE_PREFIX = 'audit_parallel'
+
+    # Строк несоответствий в одной части (предел Excel - 1 048 576 строк на лист)
+    ROWS_PER_PART = 100000
+
+    # Префикс имен файлов частей листа несоответствий
+    PART_PREFIX = 'audit_discrepancies'
+
+    def __init__(self, workers: Optional[int] = None, rows_per_part: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.rows_per_part = rows_per_part or self.ROWS_PER_PART
+        self.timings: Dict[str, float] = {}
+
+    def generate(self, result: ReconciliationResult, output_folder: Path) -> List[Path]:
+        """Генерация отчета; возвращает пути основной книги и частей"""
+        started = time.perf_counter()
+        self.timings = {}
+        main_path = output_folder / f"{self.report_name(result)}.xlsx"
+        self._remove_stale_parts(result, output_folder)
+        parts = self._parts(result, output_folder)
+
+        paths = []
+        if self.workers == 1 or len(result.discrepancies) == 0:
+            self._write_main(result, main_path)
+            for path, title, rows in parts:
+                self._record_part(path, title, *render_discrepancy_part(path, title, rows))
+                paths.append(path)
+        else:
+            part_count = -(-len(result.discrepancies) // self.rows_per_part)
+            with ProcessPoolExecutor(max_workers=min(self.workers, part_count)) as executor:
+                futures = []
+                for path, title, rows in parts:
+                    futures.append((path, title, executor.submit(render_discrepancy_part, path, title, rows)))
+                    paths.append(path)
+
+                # Основная книга пишется, пока рабочие процессы заняты частями
+                self._write_main(result, main_path)
+                for path, title, future in futures:
+                    self._record_part(path, title, *future.result())
+
+        logger.info(f"Parallel report: {len(paths) + 1} workbooks in {time.perf_counter() - started:.2f}s "
+                    f"({self.workers} workers)")
+        return [main_path] + paths
+
+    def _parts(self, result: ReconciliationResult, output_folder: Path) -> Iterator[Tuple[Path, str, List[List[Any]]]]:
+        """Части листа несоответствий: путь книги, название листа и значения строк
+
+        В рабочие процессы передаются готовые значения строк, а не объекты
+        несоответствий со ссылками на записи.
+        """
+        discrepancies = result.discrepancies
+        part_name = self.report_name(result, self.PART_PREFIX)
+        for number, start in enumerate(range(0, len(discrepancies), self.rows_per_part), start=1):
+            rows = [ExcelReporter._discrepancy_values(discrepancy)
+                    for discrepancy in discrepancies[start:start + self.rows_per_part]]
+            yield output_folder / f"{part_name}_part{number:02d}.xlsx", f"Несоответствия {number}", rows
+
+    def _remove_stale_parts(self, result: ReconciliationResult, output_folder: Path):
+        """Удаление частей прежнего отчета за тот же период (их могло быть больше)"""
+        part_name = self.report_name(result, self.PART_PREFIX)
+        for path in output_folder.glob(f"{part_name}_part*.xlsx"):
+            path.unlink()
+            logger.info(f"Removed stale report part {path.name}")
+
+    def _write_main(self, result: ReconciliationResult, output_path: Path):
+        """Основная книга отчета (без построчного листа несоответствий)"""
+        started = time.perf_counter()
+        SummaryExcelReporter().generate_reconciliation_report(result, output_path)
+        elapsed = time.perf_counter() - started
+        self.timings['Сводка'] = elapsed
+        logger.info(f"Sheets 'Сводка', 'Типы несоответствий', 'По машинам', 'По оплате': {elapsed:.2f}s")
+
+    def _record_part(self, path: Path, title: str, count: int, elapsed: float):
+        self.timings[title] = elapsed
+        logger.info(f"Sheet '{title}': {count} rows in {elapsed:.2f}s ({path.name})")
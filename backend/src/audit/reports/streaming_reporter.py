@@ -0,0 +1,217 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from pathlib import Path
+from itertools import chain, islice
+from typing import Iterable, List, Optional, Any
+import logging
+
+from ..models.audit_models import ReconciliationResult, Discrepancy
+from .excel_reporter import ExcelReporter, ColumnWidths
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ('critical', 'high', 'medium', 'low')
+
+
+class StreamingExcelReporter(ExcelReporter):
+    """Потоковый генератор Excel отчетов (openpyxl write_only)
+
+    Строки сразу сериализуются в файл листа и не хранятся в памяти,
+    поэтому расход памяти не зависит от числа несоответствий. Оформление
+    задается общими именованными стилями книги (NamedStyle), а не
+    отдельными объектами Border/PatternFill на каждую ячейку.
+
+    В режиме write_only ширина колонок задается до первой строки листа,
+    поэтому для листа несоответствий она считается по первым
+    WIDTH_SAMPLE_ROWS строкам, которые удерживаются до записи заголовков.
+    """
+
+    # Число строк несоответствий, по которым определяется ширина колонок
+    WIDTH_SAMPLE_ROWS = 1000
+
+    def generate_reconciliation_report(self,
+                                       result: ReconciliationResult,
+                                       output_path: Path,
+                                       discrepancies: Optional[Iterable[Discrepancy]] = None) -> Path:
+        """Генерация отчета о сверке
+
+        discrepancies - итератор несоответствий (например, генератор,
+        читающий их порциями); по умолчанию - result.discrepancies.
+        """
+        logger.info(f"Generating streaming reconciliation report to {output_path}")
+
+        self.wb = Workbook(write_only=True)
+        self._register_named_styles()
+
+        # Листы книги write_only пишутся независимо друг от друга, поэтому
+        # сводка (с числом несоответствий) заполняется после их подсчета
+        summary_ws = self.wb.create_sheet("Сводка")
+        discrepancy_count = self._write_discrepancies_sheet(
+            result.discrepancies if discrepancies is None else discrepancies
+        )
+        self._write_summary_sheet(summary_ws, result, discrepancy_count)
+        self._write_machine_summary_sheet(result.summary_by_machine)
+        self._write_payment_summary_sheet(result.summary_by_payment)
+        if result.consumption_series:
+            self._write_consumption_sheet(result.consumption_series)
+
+        self.wb.save(output_path)
+        logger.info(f"Report saved to {output_path} ({discrepancy_count} discrepancies)")
+
+        return output_path
+
+    def _register_named_styles(self):
+        """Именованные стили отчета (одна запись стиля на книгу)"""
+        border = self.styles['border']
+
+        title = NamedStyle(name='audit_title')
+        title.font = self.styles['header']['font']
+        title.fill = self.styles['header']['fill']
+        title.alignment = self.styles['header']['alignment']
+        self.wb.add_named_style(title)
+
+        column_header = NamedStyle(name='audit_column_header')
+        column_header.font = Font(bold=True)
+        column_header.fill = self.styles['subheader']['fill']
+        column_header.border = border
+        self.wb.add_named_style(column_header)
+
+        cell = NamedStyle(name='audit_cell')
+        cell.font = DEFAULT_FONT
+        cell.border = border
+        self.wb.add_named_style(cell)
+
+        for severity in SEVERITIES:
+            style = NamedStyle(name=f'audit_{severity}')
+            style.font = DEFAULT_FONT
+            style.fill = self.styles[severity]['fill']
+            style.border = border
+            self.wb.add_named_style(style)
+
+    def _cell(self, ws, value: Any, style: str = 'audit_cell') -> WriteOnlyCell:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    def _header_row(self, ws, headers: List[str]) -> List[WriteOnlyCell]:
+        return [self._cell(ws, header, 'audit_column_header') for header in headers]
+
+    def _write_summary_sheet(self, ws, result: ReconciliationResult, discrepancy_count: int):
+        """Лист со сводкой"""
+        title = self._summary_title(result)
+        data = self._summary_rows(result, discrepancy_count)
+        widths = ColumnWidths()
+        widths.update([title])
+        for row_data in data:
+            widths.update(row_data)
+        widths.apply(ws)
+
+        ws.append([self._cell(ws, title, 'audit_title')])
+        ws.merged_cells.add('A1:F1')
+        ws.append([])
+
+        ws.append(self._header_row(ws, data[0]))
+        for row_data in data[1:]:
+            ws.append([self._cell(ws, value) for value in row_data])
+
+    def generate_discrepancies_workbook(self,
+                                        rows: Iterable[List[Any]],
+                                        output_path: Path,
+                                        title: str = "Несоответствия") -> int:
+        """Книга с одним листом несоответствий; возвращает число строк
+
+        rows - значения строк в порядке DISCREPANCY_HEADERS (см.
+        _discrepancy_values), например, часть листа большого отчета.
+        """
+        self.wb = Workbook(write_only=True)
+        self._register_named_styles()
+        count = self._write_discrepancy_rows(title, rows)
+        self.wb.save(output_path)
+        return count
+
+    def _write_discrepancies_sheet(self, discrepancies: Iterable[Discrepancy]) -> int:
+        """Лист с несоответствиями; возвращает число записанных строк"""
+        return self._write_discrepancy_rows("Несоответствия", map(self._discrepancy_values, discrepancies))
+
+    def _write_discrepancy_rows(self, title: str, rows: Iterable[List[Any]]) -> int:
+        """Лист несоответствий из значений строк (важность - последняя колонка)"""
+        ws = self.wb.create_sheet(title)
+        rows = iter(rows)
+
+        # Ширина колонок - по заголовкам и первым строкам
+        widths = ColumnWidths()
+        widths.update(self.DISCREPANCY_HEADERS)
+        sample = list(islice(rows, self.WIDTH_SAMPLE_ROWS))
+        for values in sample:
+            widths.update(values)
+        widths.apply(ws)
+
+        ws.append(self._header_row(ws, self.DISCREPANCY_HEADERS))
+
+        # Строка сериализуется в момент append, поэтому ячейки со стилями
+        # создаются один раз на каждую важность и переиспользуются
+        columns = len(self.DISCREPANCY_HEADERS)
+        templates = {
+            severity: self._row_template(ws, ['audit_cell'] * (columns - 1) + [f'audit_{severity}'])
+            for severity in SEVERITIES
+        }
+        default = self._row_template(ws, ['audit_cell'] * columns)
+
+        count = 0
+        for values in chain(sample, rows):
+            row = templates.get(values[-1], default)
+            for cell, value in zip(row, values):
+                cell.value = value
+            ws.append(row)
+            count += 1
+
+        return count
+
+    def _row_template(self, ws, styles: List[str]) -> List[WriteOnlyCell]:
+        """Ячейки строки с заданными стилями для повторного использования"""
+        return [self._cell(ws, None, style) for style in styles]
+
+    def _write_machine_summary_sheet(self, summary):
+        """Лист со сводкой по машинам"""
+        ws = self.wb.create_sheet("По машинам")
+        rows = list(self._machine_rows(summary))
+        widths = ColumnWidths()
+        widths.update(self.MACHINE_HEADERS)
+        for values in rows:
+            widths.update(values)
+        widths.apply(ws)
+
+        ws.append(self._header_row(ws, self.MACHINE_HEADERS))
+        for values in rows:
+            ws.append([self._cell(ws, value) for value in values])
+
+    def _write_payment_summary_sheet(self, summary):
+        """Лист со сводкой по методам оплаты"""
+        ws = self.wb.create_sheet("По оплате")
+        rows = list(self._payment_rows(summary))
+        widths = ColumnWidths()
+        widths.update(self.PAYMENT_HEADERS)
+        for values, _ in rows:
+            widths.update(values)
+        widths.apply(ws)
+
+        ws.append(self._header_row(ws, self.PAYMENT_HEADERS))
+        for values, problematic in rows:
+            style = 'audit_medium' if problematic else 'audit_cell'
+            ws.append([self._cell(ws, value, style) for value in values])
+
+    def _write_consumption_sheet(self, series):
+        """Лист с рядом расхода ингредиентов"""
+        ws = self.wb.create_sheet("Расход ингредиентов")
+        rows = list(self._consumption_rows(series))
+        widths = ColumnWidths()
+        widths.update(self.CONSUMPTION_HEADERS)
+        for values in rows:
+            widths.update(values)
+        widths.apply(ws)
+
+        ws.append(self._header_row(ws, self.CONSUMPTION_HEADERS))
+        for values in rows:
+            ws.append([self._cell(ws, value) for value in values])
@@ -0,0 +1,77 @@
+from openpyxl import Workbook
+from openpyxl.styles import Font, PatternFill
+from collections import defaultdict
+from decimal import Decimal
+from pathlib import Path
+from typing import List
+import logging
+
+from ..models.audit_models import ReconciliationResult, Discrepancy
+from .excel_reporter import ExcelReporter, ColumnWidths
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryExcelReporter(ExcelReporter):
+    """Краткий Excel отчет для просмотра человеком
+
+    Сводка, несоответствия, сгруппированные по типу и важности, и сводки
+    по машинам и методам оплаты - без построчного листа несоответствий,
+    поэтому размер книги не зависит от их числа. Полные таблицы для
+    больших периодов пишутся в CSV или Parquet.
+    """
+
+    FILE_PREFIX = 'audit_summary'
+
+    TYPE_HEADERS = ["Тип", "Важность", "Количество", "Сумма разницы"]
+
+    def generate_reconciliation_report(self,
+                                       result: ReconciliationResult,
+                                       output_path: Path) -> Path:
+        """Генерация краткого отчета о сверке"""
+        logger.info(f"Generating summary report to {output_path}")
+
+        self.wb = Workbook()
+        self.wb.remove(self.wb.active)
+
+        self._create_summary_sheet(result)
+        self._create_types_sheet(result.discrepancies)
+        self._create_machine_summary_sheet(result.summary_by_machine)
+        self._create_payment_summary_sheet(result.summary_by_payment)
+
+        self.wb.save(output_path)
+        logger.info(f"Summary report saved to {output_path}")
+
+        return output_path
+
+    def _create_types_sheet(self, discrepancies: List[Discrepancy]):
+        """Лист с числом и суммой несоответствий по типу и важности"""
+        ws = self.wb.create_sheet("Типы несоответствий")
+
+        widths = ColumnWidths()
+        widths.update(self.TYPE_HEADERS)
+        for col_idx, header in enumerate(self.TYPE_HEADERS):
+            cell = ws.cell(row=1, column=col_idx + 1, value=header)
+            cell.font = Font(bold=True)
+            cell.fill = self.styles['subheader']['fill']
+            cell.border = self.styles['border']
+
+        counts = defaultdict(int)
+        amounts = defaultdict(Decimal)
+        for discrepancy in discrepancies:
+            key = (discrepancy.type.value, discrepancy.severity)
+            counts[key] += 1
+            if discrepancy.amount_difference:
+                amounts[key] += discrepancy.amount_difference
+
+        # Самые частые несоответствия - первыми
+        groups = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        for row_idx, ((type_value, severity), count) in enumerate(groups, start=2):
+            values = [type_value, severity, count, float(amounts[(type_value, severity)])]
+            widths.update(values)
+            for col_idx, value in enumerate(values):
+                ws.cell(row=row_idx, column=col_idx + 1, value=value).border = self.styles['border']
+
+            ws.cell(row=row_idx, column=2).fill = self.styles.get(severity, {}).get('fill', PatternFill())
+
+        widths.apply(ws)
@@ -0,0 +1,173 @@
+from abc import abstractmethod
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+import csv
+import logging
+
+import pandas as pd
+
+from ..models.audit_models import ReconciliationResult, Discrepancy, ConsumptionBucket
+from .base_reporter import BaseReporter
+
+logger = logging.getLogger(__name__)
+
+# Колонки таблиц отчета
+DISCREPANCY_COLUMNS = [
+    'type', 'machine_id', 'datetime', 'description', 'amount_difference', 'severity',
+    'sale_id', 'receipt_number', 'transaction_id'
+]
+MACHINE_COLUMNS = [
+    'machine_id', 'total_sales', 'total_amount', 'discrepancies',
+    'cash', 'card', 'qr_click', 'qr_payme', 'qr_uzum'
+]
+PAYMENT_COLUMNS = ['payment_method', 'count', 'amount', 'matched', 'unmatched', 'success_rate']
+CONSUMPTION_COLUMNS = [
+    'machine_id', 'ingredient_code', 'start', 'end', 'theoretical', 'refilled',
+    'variance', 'variance_percent', 'closed'
+]
+
+# Колонки с десятичными значениями (Decimal)
+AMOUNT_COLUMNS = {'amount_difference', 'total_amount', 'amount', 'theoretical', 'refilled', 'variance'}
+
+
+def discrepancy_rows(discrepancies: Iterable[Discrepancy]) -> Iterator[tuple]:
+    """Строки таблицы несоответствий (в порядке DISCREPANCY_COLUMNS)"""
+    for discrepancy in discrepancies:
+        yield (
+            discrepancy.type.value,
+            discrepancy.machine_id,
+            discrepancy.datetime,
+            discrepancy.description,
+            discrepancy.amount_difference,
+            discrepancy.severity,
+            discrepancy.sale_record.id if discrepancy.sale_record else None,
+            discrepancy.receipt.receipt_number if discrepancy.receipt else None,
+            discrepancy.transaction.transaction_id if discrepancy.transaction else None
+        )
+
+
+def machine_rows(summary: Dict[str, Dict[str, Any]]) -> Iterator[tuple]:
+    """Строки сводки по машинам (в порядке MACHINE_COLUMNS)"""
+    for machine_id, data in sorted(summary.items()):
+        payment_methods = data['payment_methods']
+        yield (
+            machine_id,
+            data['total_sales'],
+            data['total_amount'],
+            data['discrepancies'],
+            payment_methods.get('cash', 0),
+            payment_methods.get('card', 0),
+            payment_methods.get('qr_click', 0),
+            payment_methods.get('qr_payme', 0),
+            payment_methods.get('qr_uzum', 0)
+        )
+
+
+def payment_rows(summary: Dict[str, Dict[str, Any]]) -> Iterator[tuple]:
+    """Строки сводки по методам оплаты (в порядке PAYMENT_COLUMNS)"""
+    for payment_method, data in sorted(summary.items()):
+        success_rate = round(data['matched'] / data['count'] * 100, 1) if data['count'] > 0 else 0.0
+        yield (
+            payment_method,
+            data['count'],
+            data['amount'],
+            data['matched'],
+            data['unmatched'],
+            success_rate
+        )
+
+
+def consumption_rows(series: Iterable[ConsumptionBucket]) -> Iterator[tuple]:
+    """Строки ряда расхода ингредиентов (в порядке CONSUMPTION_COLUMNS)"""
+    for bucket in series:
+        variance_percent = bucket.variance_percent
+        yield (
+            bucket.machine_id,
+            bucket.ingredient_code,
+            bucket.start,
+            bucket.end,
+            bucket.theoretical,
+            bucket.refilled,
+            bucket.variance,
+            round(variance_percent, 1) if variance_percent is not None else None,
+            bucket.closed
+        )
+
+
+class TableReporter(BaseReporter):
+    """Отчет набором плоских таблиц: несоответствия, сводки по машинам и по оплате
+
+    Ряд расхода ингредиентов, если он добавлен в результат
+    (result.consumption_series), пишется таблицей consumption.
+    Каждая таблица пишется отдельным файлом <имя отчета>_<таблица>.<EXTENSION>.
+    В отличие от Excel, число строк не ограничено, а оформление не
+    требуется, поэтому таблицы пишутся намного быстрее.
+    """
+
+    EXTENSION = ''
+
+    def generate(self, result: ReconciliationResult, output_folder: Path) -> List[Path]:
+        """Запись таблиц отчета; возвращает пути файлов"""
+        name = self.report_name(result)
+        tables = [
+            ('discrepancies', DISCREPANCY_COLUMNS, discrepancy_rows(result.discrepancies)),
+            ('machines', MACHINE_COLUMNS, machine_rows(result.summary_by_machine)),
+            ('payments', PAYMENT_COLUMNS, payment_rows(result.summary_by_payment))
+        ]
+        if result.consumption_series:
+            tables.append(('consumption', CONSUMPTION_COLUMNS, consumption_rows(result.consumption_series)))
+
+        paths = []
+        for table, columns, rows in tables:
+            path = output_folder / f"{name}_{table}.{self.EXTENSION}"
+            count = self._write_table(path, columns, rows)
+            logger.info(f"Table {table} saved to {path} ({count} rows)")
+            paths.append(path)
+        return paths
+
+    @abstractmethod
+    def _write_table(self, path: Path, columns: Sequence[str], rows: Iterable[tuple]) -> int:
+        """Запись таблицы в файл; возвращает число строк"""
+        pass
+
+
+class CsvReporter(TableReporter):
+    """Таблицы отчета в CSV (UTF-8, разделитель - запятая)
+
+    Строки пишутся по мере получения, суммы - точными десятичными
+    значениями, дата и время - 'YYYY-MM-DD HH:MM:SS'.
+    """
+
+    EXTENSION = 'csv'
+
+    def _write_table(self, path: Path, columns: Sequence[str], rows: Iterable[tuple]) -> int:
+        count = 0
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        return count
+
+
+class ParquetReporter(TableReporter):
+    """Таблицы отчета в Parquet (pandas, движок pyarrow или fastparquet)
+
+    Суммы пишутся числами с плавающей точкой, как в Excel отчете,
+    дата и время - типом timestamp.
+    """
+
+    EXTENSION = 'parquet'
+
+    def __init__(self):
+        if find_spec('pyarrow') is None and find_spec('fastparquet') is None:
+            raise ImportError("Parquet reports require pyarrow or fastparquet to be installed")
+
+    def _write_table(self, path: Path, columns: Sequence[str], rows: Iterable[tuple]) -> int:
+        df = pd.DataFrame.from_records(list(rows), columns=columns)
+        for column in AMOUNT_COLUMNS.intersection(columns):
+            df[column] = df[column].astype('float64')
+        df.to_parquet(path, index=False)
+        return len(df)
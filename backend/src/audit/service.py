@@ -0,0 +1,210 @@
+"""
+Сервис заданий аудита для долгоживущих процессов (бот, API)
+
+Модуль не импортирует pandas/openpyxl: сверка выполняется в пуле
+процессов, которые загружают тяжелые модули один раз при старте.
+"""
+
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import uuid4
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Статусы задания
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+@dataclass(frozen=True)
+class AuditRequest:
+    """Параметры аудита; одинаковые запросы выполняются одним заданием"""
+    period_start: datetime
+    period_end: datetime
+    data_folder: Path
+    output_folder: Path
+    report_formats: Tuple[str, ...] = ('xlsx',)
+
+
+@dataclass
+class AuditJob:
+    """Задание аудита и его состояние"""
+    job_id: str
+    request: AuditRequest
+    status: str = QUEUED
+    created_at: datetime = field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    reports: List[Path] = field(default_factory=list)
+    summary: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    # Уведомления о завершении (по одному на каждый запрос задания)
+    subscribers: List[Callable[['AuditJob'], Awaitable[None]]] = field(default_factory=list, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+
+def _warm_up():
+    """Инициализация рабочего процесса: импорт модулей сверки и отчетов"""
+    from . import main  # noqa: F401
+
+
+def run_audit_job(request: AuditRequest, runner_options: Dict[str, Any]) -> Tuple[List[Path], Dict[str, Any]]:
+    """Аудит в рабочем процессе; возвращает пути отчетов и сводку"""
+    from .main import AuditRunner
+    from .logic import IngredientAnalyzer
+
+    runner = AuditRunner(request.data_folder, request.output_folder,
+                         report_formats=request.report_formats, **runner_options)
+    result, reports = runner.audit(request.period_start, request.period_end)
+
+    summary = {
+        'total_sales': result.total_sales,
+        'total_receipts': result.total_receipts,
+        'total_transactions': result.total_transactions,
+        'matched_count': result.matched_count,
+        'discrepancies': len(result.discrepancies),
+        'top_types': Counter(d.type.value for d in result.discrepancies).most_common(5)
+    }
+    if result.consumption_series:
+        # Интервалы между пополнениями с отклонением расхода сверх допуска
+        summary['consumption_variances'] = len(
+            IngredientAnalyzer().bucket_discrepancies(result.consumption_series)
+        )
+    return reports, summary
+
+
+class AuditJobService:
+    """Очередь заданий аудита с пулом "прогретых" рабочих процессов
+
+    Процессы пула создаются при start() и сразу импортируют pandas,
+    openpyxl и модули аудита, поэтому задание не платит за запуск
+    интерпретатора и импорт. Одновременно выполняется не больше workers
+    заданий, остальные ждут в очереди.
+
+    Запрос, совпадающий с еще не завершенным заданием (период, папки,
+    форматы), не создает новое задание: возвращается существующее, а
+    уведомление добавляется к нему. Состояние задания можно опрашивать
+    (get), ждать (wait) или получить через on_finish.
+    """
+
+    # Число завершенных заданий, которые хранятся для опроса
+    HISTORY_SIZE = 100
+
+    def __init__(self, workers: int = 1, **runner_options):
+        """runner_options - параметры AuditRunner (engine, cache_folder, database_url, ...)"""
+        self.workers = workers
+        self.runner_options = runner_options
+        self.jobs: 'OrderedDict[str, AuditJob]' = OrderedDict()
+        self._active: Dict[AuditRequest, AuditJob] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(workers)
+
+    def start(self):
+        """Создание пула; процессы запускаются и импортируют модули сразу"""
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up)
+        for _ in range(self.workers):
+            self._pool.submit(os.getpid)
+        logger.info(f"Audit job service started ({self.workers} workers)")
+
+    def shutdown(self):
+        """Остановка пула; задания в очереди отменяются"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("Audit job service stopped")
+
+    def submit(self,
+               period_start: datetime,
+               period_end: datetime,
+               data_folder: Path,
+               output_folder: Path,
+               report_formats: Sequence[str] = ('xlsx',),
+               on_finish: Optional[Callable[[AuditJob], Awaitable[None]]] = None) -> Tuple[AuditJob, bool]:
+        """Постановка задания в очередь; возвращает задание и признак того, что оно новое"""
+        request = AuditRequest(period_start, period_end, Path(data_folder).resolve(),
+                               Path(output_folder).resolve(), tuple(report_formats))
+        if not request.data_folder.exists():
+            raise FileNotFoundError(f"Data folder not found: {request.data_folder}")
+
+        job = self._active.get(request)
+        if job is not None:
+            if on_finish:
+                job.subscribers.append(on_finish)
+            logger.info(f"Audit job {job.job_id} is already {job.status}, request attached")
+            return job, False
+
+        self.start()
+        job = AuditJob(job_id=uuid4().hex[:12], request=request)
+        if on_finish:
+            job.subscribers.append(on_finish)
+
+        self._active[request] = job
+        self.jobs[job.job_id] = job
+        self._trim_history()
+        job.task = asyncio.get_running_loop().create_task(self._run(job))
+        logger.info(f"Audit job {job.job_id} queued: {period_start.date()} - {period_end.date()}, "
+                    f"{request.data_folder}")
+        return job, True
+
+    def get(self, job_id: str) -> Optional[AuditJob]:
+        """Задание по ID (для опроса состояния)"""
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str) -> AuditJob:
+        """Ожидание завершения задания"""
+        job = self.jobs[job_id]
+        if job.task is not None:
+            await asyncio.shield(job.task)
+        return job
+
+    async def _run(self, job: AuditJob):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._slots:
+                self.start()
+                job.status = RUNNING
+                job.started_at = datetime.now()
+                job.reports, job.summary = await loop.run_in_executor(
+                    self._pool, run_audit_job, job.request, self.runner_options
+                )
+            job.status = COMPLETED
+            logger.info(f"Audit job {job.job_id} completed in "
+                        f"{(datetime.now() - job.started_at).total_seconds():.1f}s")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e) or type(e).__name__
+            logger.error(f"Audit job {job.job_id} failed: {job.error}")
+            if isinstance(e, BrokenProcessPool):
+                # Рабочий процесс аварийно завершился: следующее задание создаст новый пул
+                self.shutdown()
+        finally:
+            job.finished_at = datetime.now()
+            self._active.pop(job.request, None)
+
+        for callback in job.subscribers:
+            try:
+                await callback(job)
+            except Exception as e:
+                logger.error(f"Audit job {job.job_id} notification failed: {e}")
+
+    def _trim_history(self):
+        """Удаление самых старых завершенных заданий сверх HISTORY_SIZE"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.HISTORY_SIZE)]:
+            del self.jobs[job_id]
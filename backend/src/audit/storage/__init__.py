@@ -0,0 +1,9 @@
+from .sqlite_store import AuditStateStore
+from .columnar_store import ColumnarStore
+from .postgres_store import PostgresResultStore
+
+__all__ = [
+    'AuditStateStore',
+    'ColumnarStore',
+    'PostgresResultStore',
+]
@@ -0,0 +1,218 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from dataclasses import asdict
+from decimal import Decimal
+from pathlib import Path
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from ..models.record_batch import RecordBatch, KINDS
+from ..utils.files import FileFingerprint, file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Числовые колонки пакета и их типы в файлах .npy
+ARRAY_COLUMNS = {
+    'machine_codes': np.int32,
+    'timestamps': np.int64,
+    'amounts': np.int64,
+    'payment_codes': np.int8,
+    'rows': np.int64
+}
+
+# Поля записей, хранимые не текстом: целые числа и JSON (позиции чека)
+INTEGER_FIELDS = {'quantity'}
+JSON_FIELDS = {'items'}
+
+
+class ColumnarStore:
+    """Колоночное хранилище нормализованных записей (файлы .npy, memory-mapped)
+
+    Для каждого источника (входного файла) - папка <root>/<source>/:
+    meta.json - вид записей, число строк, категории машин и отпечаток
+    входного файла; <колонка>.npy - колонки RecordBatch. Числовые и
+    текстовые колонки (строки фиксированной ширины) открываются через
+    mmap, поэтому несколько запусков аудита и API читают одни и те же
+    страницы файлов без повторного разбора Excel. Позиции чеков хранятся
+    JSON-строками и разбираются при чтении.
+
+    Папка источника пишется во временную и заменяет прежнюю целиком,
+    поэтому читатели видят либо старую, либо новую версию.
+    """
+
+    VERSION = 1
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def ingest(self, source: str, kind: str, path: Path, load_batch: Callable[[], RecordBatch]) -> bool:
+        """Запись источника, если входной файл изменился
+
+        Возвращает True, если файл был разобран, и False, если
+        хранилище уже содержит его данные.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown record kind: {kind}")
+
+        meta = self._read_meta(source)
+        if meta is not None and meta['kind'] == kind and meta['fingerprint']:
+            stored = FileFingerprint(**meta['fingerprint'])
+            if stored.path == str(path.resolve()) and stored.matches_stat(path):
+                logger.info(f"Columnar store: {source} is up to date ({path})")
+                return False
+
+            if file_sha256(path) == stored.sha256:
+                # Содержимое прежнее - обновляем только отпечаток
+                meta['fingerprint'] = asdict(FileFingerprint.of(path))
+                self._write_json(self.root / source / 'meta.json', meta)
+                logger.info(f"Columnar store: {source} content is unchanged ({path})")
+                return False
+
+        fingerprint = FileFingerprint.of(path)
+        batch = load_batch()
+        if batch.kind != kind:
+            raise ValueError(f"Expected {kind} records for {source}, got {batch.kind}")
+
+        self.write(source, batch, fingerprint)
+        logger.info(f"Columnar store: saved {len(batch)} {kind} from {path}")
+        return True
+
+    def write(self, source: str, batch: RecordBatch, fingerprint: Optional[FileFingerprint] = None):
+        """Атомарная запись пакета источника"""
+        folder = self.root / source
+        temp_folder = self.root / f'{source}.{os.getpid()}.tmp'
+        if temp_folder.exists():
+            shutil.rmtree(temp_folder)
+        temp_folder.mkdir()
+
+        try:
+            for column, dtype in ARRAY_COLUMNS.items():
+                np.save(temp_folder / f'{column}.npy', np.ascontiguousarray(getattr(batch, column), dtype=dtype))
+
+            for name, values in batch.fields.items():
+                np.save(temp_folder / f'{name}.npy', self._encode_field(name, values))
+
+            self._write_json(temp_folder / 'meta.json', {
+                'version': self.VERSION,
+                'kind': batch.kind,
+                'count': len(batch),
+                'machines': batch.machines.tolist(),
+                'fingerprint': asdict(fingerprint) if fingerprint else None
+            })
+
+            # Прежняя версия убирается только после того, как новая полностью записана
+            old_folder = self.root / f'{source}.{os.getpid()}.old'
+            if folder.exists():
+                os.replace(folder, old_folder)
+            os.replace(temp_folder, folder)
+            if old_folder.exists():
+                shutil.rmtree(old_folder)
+        finally:
+            if temp_folder.exists():
+                shutil.rmtree(temp_folder)
+
+    def read(self, source: str, mmap: bool = True) -> RecordBatch:
+        """Пакет источника; колонки отображаются в память (mmap_mode='r')"""
+        meta = self._read_meta(source)
+        if meta is None:
+            raise KeyError(f"Source not found in columnar store: {source}")
+
+        folder = self.root / source
+        mmap_mode = 'r' if mmap else None
+        arrays = {
+            column: np.load(folder / f'{column}.npy', mmap_mode=mmap_mode)
+            for column in ARRAY_COLUMNS
+        }
+        fields = {
+            name: self._decode_field(name, np.load(folder / f'{name}.npy', mmap_mode=mmap_mode))
+            for name in KINDS[meta['kind']][1]
+        }
+
+        machines = np.empty(len(meta['machines']), dtype=object)
+        machines[:] = meta['machines']
+
+        return RecordBatch(meta['kind'], machines, fields=fields, **arrays)
+
+    def sources(self) -> Dict[str, str]:
+        """Источники хранилища: имя -> вид записей"""
+        sources = {}
+        for folder in sorted(self.root.iterdir()):
+            if folder.is_dir() and '.' not in folder.name:
+                meta = self._read_meta(folder.name)
+                if meta is not None:
+                    sources[folder.name] = meta['kind']
+        return sources
+
+    def load_all(self, sources: Optional[Iterable[str]] = None) -> Dict[str, RecordBatch]:
+        """Пакеты всех видов записей
+
+        sources - читаемые источники (по умолчанию - все источники
+        хранилища). Вид с одним источником отдается отображенным в память
+        без копирования; пакеты нескольких источников объединяются (копия).
+        """
+        stored = self.sources()
+        selected = stored if sources is None else {source: stored[source] for source in sources if source in stored}
+
+        by_kind: Dict[str, List[RecordBatch]] = {kind: [] for kind in KINDS}
+        for source, kind in selected.items():
+            by_kind[kind].append(self.read(source))
+
+        return {
+            kind: RecordBatch.concat(batches) if batches else RecordBatch.from_records(kind, [])
+            for kind, batches in by_kind.items()
+        }
+
+    def _read_meta(self, source: str) -> Optional[dict]:
+        """Метаданные источника текущей версии формата"""
+        meta_path = self.root / source / 'meta.json'
+        if not meta_path.exists():
+            return None
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+        except Exception as e:
+            logger.warning(f"Columnar store: unreadable metadata {meta_path}: {e}")
+            return None
+
+        if meta.get('version') != self.VERSION:
+            return None
+        return meta
+
+    @staticmethod
+    def _write_json(path: Path, data: Any):
+        temp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _encode_field(name: str, values: np.ndarray) -> np.ndarray:
+        """Колонка поля в массив фиксированного типа (без pickle)"""
+        if name in INTEGER_FIELDS:
+            return np.asarray(values, dtype=np.int64)
+        if name in JSON_FIELDS:
+            return np.array([
+                json.dumps([{'name': item['name'], 'amount': str(item['amount'])} for item in value or []],
+                           ensure_ascii=False)
+                for value in values.tolist()
+            ], dtype=str)
+        return np.array(values.tolist(), dtype=str)
+
+    @staticmethod
+    def _decode_field(name: str, column: np.ndarray) -> np.ndarray:
+        """Колонка поля из файла (позиции чеков разбираются из JSON)"""
+        if name not in JSON_FIELDS:
+            return column
+
+        decoded = np.empty(len(column), dtype=object)
+        for position, value in enumerate(column.tolist()):
+            decoded[position] = [
+                {'name': item['name'], 'amount': Decimal(item['amount'])}
+                for item in json.loads(value)
+            ]
+        return decoded
@@ -0,0 +1,167 @@
+from typing import List, Dict, Iterable, Any, Optional, Sequence
+from datetime import datetime
+from importlib.util import find_spec
+from itertools import islice
+import logging
+
+from ..models.audit_models import ReconciliationResult
+from ..reports.table_reporter import (
+    DISCREPANCY_COLUMNS, MACHINE_COLUMNS, PAYMENT_COLUMNS,
+    discrepancy_rows, machine_rows, payment_rows
+)
+
+logger = logging.getLogger(__name__)
+
+
+def run_id_for_period(period_start: datetime, period_end: datetime) -> str:
+    """ID запуска по умолчанию: период сверки (повторная сверка периода заменяет его результат)"""
+    return f"{period_start.strftime('%Y%m%d')}_{period_end.strftime('%Y%m%d')}"
+
+
+class PostgresResultStore:
+    """История результатов сверки в Postgres (asyncpg)
+
+    Запуск сверки (ReconciliationResult) хранится в audit_runs, его
+    несоответствия и сводки по машинам и методам оплаты - в таблицах с
+    колонками табличных отчетов (CsvReporter/ParquetReporter) и индексами
+    по машине, типу и времени несоответствия.
+
+    Таблицы - модели db.models.audit, в базе приложения их создает
+    миграция alembic (alembic upgrade head). Строки пишутся командой COPY
+    (copy_records_to_table) порциями по batch_size, без построчных INSERT.
+    Запуск записывается в одной транзакции: прерванная запись не
+    оставляет частичных данных, а повторная запись того же run_id
+    заменяет прежний результат.
+    """
+
+    # Строк в одной команде COPY
+    BATCH_SIZE = 50000
+
+    def __init__(self, dsn: str, batch_size: Optional[int] = None):
+        if find_spec('asyncpg') is None:
+            raise ImportError("Postgres result store requires asyncpg to be installed")
+        # URL SQLAlchemy (postgresql+asyncpg://) asyncpg не принимает
+        self.dsn = dsn.replace('+asyncpg', '')
+        self.batch_size = batch_size or self.BATCH_SIZE
+
+    async def _connect(self):
+        import asyncpg
+        return await asyncpg.connect(self.dsn)
+
+    async def create_schema(self):
+        """Создание таблиц и индексов по моделям, если их нет
+
+        Для отдельной базы истории без alembic; save_result() схему не создает.
+        """
+        from sqlalchemy.dialects import postgresql
+        from sqlalchemy.schema import CreateIndex, CreateTable
+        from db.models.audit import AUDIT_TABLES
+
+        dialect = postgresql.dialect()
+        statements = []
+        for table in AUDIT_TABLES:
+            statements.append(CreateTable(table, if_not_exists=True))
+            statements.extend(CreateIndex(index, if_not_exists=True) for index in table.indexes)
+
+        conn = await self._connect()
+        try:
+            async with conn.transaction():
+                for statement in statements:
+                    await conn.execute(str(statement.compile(dialect=dialect)))
+        finally:
+            await conn.close()
+
+    async def save_result(self, run_id: str, result: ReconciliationResult) -> int:
+        """Запись результата сверки под run_id; возвращает число записанных несоответствий"""
+        started_at = datetime.now()
+        conn = await self._connect()
+        try:
+            async with conn.transaction():
+                # Строки прежней записи того же запуска удаляются каскадно
+                await conn.execute('DELETE FROM audit_runs WHERE run_id = $1', run_id)
+                await conn.execute(
+                    "INSERT INTO audit_runs (run_id, period_start, period_end, status, started_at) "
+                    "VALUES ($1, $2, $3, 'writing', $4)",
+                    run_id, result.period_start, result.period_end, started_at
+                )
+
+                count = await self._copy(conn, 'audit_discrepancies', run_id,
+                                         DISCREPANCY_COLUMNS, discrepancy_rows(result.discrepancies))
+                await self._copy(conn, 'audit_machine_summaries', run_id,
+                                 MACHINE_COLUMNS, machine_rows(result.summary_by_machine))
+                await self._copy(conn, 'audit_payment_summaries', run_id,
+                                 PAYMENT_COLUMNS, payment_rows(result.summary_by_payment))
+
+                await conn.execute(
+                    "UPDATE audit_runs SET status = 'completed', finished_at = $2, total_sales = $3, "
+                    "total_receipts = $4, total_transactions = $5, matched_count = $6, discrepancies = $7 "
+                    "WHERE run_id = $1",
+                    run_id, datetime.now(), result.total_sales, result.total_receipts,
+                    result.total_transactions, result.matched_count, count
+                )
+        finally:
+            await conn.close()
+
+        logger.info(f"Postgres: saved audit run {run_id} ({count} discrepancies) "
+                    f"in {(datetime.now() - started_at).total_seconds():.2f}s")
+        return count
+
+    async def _copy(self, conn, table: str, run_id: str,
+                    columns: Sequence[str], rows: Iterable[tuple]) -> int:
+        """Запись строк таблицы командами COPY порциями по batch_size; возвращает число строк"""
+        rows = iter(rows)
+        count = 0
+        while True:
+            batch = [(run_id,) + row for row in islice(rows, self.batch_size)]
+            if not batch:
+                break
+            await conn.copy_records_to_table(table, records=batch, columns=['run_id', *columns])
+            count += len(batch)
+            logger.debug(f"Postgres: {table} - {count} rows copied")
+        return count
+
+    async def runs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Последние завершенные запуски сверки"""
+        conn = await self._connect()
+        try:
+            rows = await conn.fetch(
+                "SELECT * FROM audit_runs WHERE status = 'completed' "
+                "ORDER BY finished_at DESC LIMIT $1", limit
+            )
+        finally:
+            await conn.close()
+        return [dict(row) for row in rows]
+
+    async def discrepancies(self,
+                            run_id: Optional[str] = None,
+                            machine_id: Optional[str] = None,
+                            discrepancy_type: Optional[str] = None,
+                            since: Optional[datetime] = None,
+                            until: Optional[datetime] = None,
+                            limit: int = 1000) -> List[Dict[str, Any]]:
+        """Несоответствия по запуску, машине, типу и интервалу времени (новые - первыми)"""
+        filters = {
+            'run_id = {}': run_id,
+            'machine_id = {}': machine_id,
+            'type = {}': discrepancy_type,
+            'datetime >= {}': since,
+            'datetime <= {}': until
+        }
+        conditions = []
+        values = []
+        for condition, value in filters.items():
+            if value is not None:
+                values.append(value)
+                conditions.append(condition.format(f'${len(values)}'))
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+        values.append(limit)
+
+        conn = await self._connect()
+        try:
+            rows = await conn.fetch(
+                f"SELECT * FROM audit_discrepancies {where}ORDER BY datetime DESC LIMIT ${len(values)}",
+                *values
+            )
+        finally:
+            await conn.close()
+        return [dict(row) for row in rows]
@@ -0,0 +1,373 @@
+from typing import List, Dict, Tuple, Any, Callable, Optional
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+import json
+import logging
+import sqlite3
+
+from ..models.audit_models import (
+    SaleRecord, FiscalReceipt, QRTransaction, PaymentMethod,
+    ReconciliationResult, to_timestamp, from_timestamp
+)
+from ..utils.files import FileFingerprint, file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Формат хранения времени: лексикографический порядок совпадает с хронологическим
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS source_files (
+    source TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    loaded_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    machine_id TEXT NOT NULL,
+    datetime TEXT NOT NULL,
+    product_code TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    payment_method TEXT NOT NULL,
+    quantity INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sales_machine_datetime ON sales (machine_id, datetime);
+CREATE INDEX IF NOT EXISTS ix_sales_amount_datetime ON sales (amount, datetime);
+CREATE INDEX IF NOT EXISTS ix_sales_source_datetime ON sales (source, datetime);
+CREATE INDEX IF NOT EXISTS ix_sales_datetime ON sales (datetime);
+
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    receipt_number TEXT NOT NULL,
+    machine_id TEXT NOT NULL,
+    datetime TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    payment_method TEXT NOT NULL,
+    items TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_receipts_machine_datetime ON receipts (machine_id, datetime);
+CREATE INDEX IF NOT EXISTS ix_receipts_amount_datetime ON receipts (amount, datetime);
+CREATE INDEX IF NOT EXISTS ix_receipts_source_datetime ON receipts (source, datetime);
+CREATE INDEX IF NOT EXISTS ix_receipts_datetime ON receipts (datetime);
+
+CREATE TABLE IF NOT EXISTS qr_transactions (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    transaction_id TEXT NOT NULL,
+    service TEXT NOT NULL,
+    machine_id TEXT,
+    datetime TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_qr_machine_datetime ON qr_transactions (machine_id, datetime);
+CREATE INDEX IF NOT EXISTS ix_qr_amount_datetime ON qr_transactions (amount, datetime);
+CREATE INDEX IF NOT EXISTS ix_qr_source_datetime ON qr_transactions (source, datetime);
+CREATE INDEX IF NOT EXISTS ix_qr_datetime ON qr_transactions (datetime);
+
+CREATE TABLE IF NOT EXISTS audit_runs (
+    id INTEGER PRIMARY KEY,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    total_sales INTEGER,
+    matched_count INTEGER,
+    discrepancies INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS match_links (
+    run_id INTEGER NOT NULL REFERENCES audit_runs (id) ON DELETE CASCADE,
+    sale_id INTEGER NOT NULL REFERENCES sales (id) ON DELETE CASCADE,
+    receipt_id INTEGER REFERENCES receipts (id) ON DELETE CASCADE,
+    transaction_id INTEGER REFERENCES qr_transactions (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS ix_match_links_run ON match_links (run_id);
+CREATE INDEX IF NOT EXISTS ix_match_links_sale ON match_links (sale_id);
+CREATE INDEX IF NOT EXISTS ix_match_links_receipt ON match_links (receipt_id);
+CREATE INDEX IF NOT EXISTS ix_match_links_transaction ON match_links (transaction_id);
+"""
+
+# Таблица хранилища для каждого вида записей
+TABLES = {
+    'sales': 'sales',
+    'receipts': 'receipts',
+    'qr_transactions': 'qr_transactions'
+}
+
+
+def _format_datetime(value: datetime) -> str:
+    return value.strftime(DATETIME_FORMAT)
+
+
+class AuditStateStore:
+    """Локальное хранилище нормализованных данных аудита (SQLite)
+
+    Хранит продажи, чеки и QR транзакции (суммы - в тийинах) с индексами
+    (machine_id, datetime) и (amount, datetime), отпечатки загруженных
+    файлов, запуски сверки и найденные пары.
+
+    Файл источника загружается в одной транзакции вместе со своим
+    отпечатком, поэтому после сбоя повторный запуск догружает только
+    незагруженные файлы. Неизменившийся файл повторно не разбирается.
+    Новая выгрузка источника заменяет его записи в пределах своего
+    временного диапазона, записи вне диапазона сохраняются.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self.conn.executescript(SCHEMA)
+
+        # id(записи) -> (таблица, rowid) для записей, выданных load_period
+        self._row_ids: Dict[int, Tuple[str, int]] = {}
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> 'AuditStateStore':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def ingest(self, source: str, kind: str, path: Path, load: Callable[[], List[Any]]) -> bool:
+        """Загрузка файла источника в хранилище, если он изменился
+
+        Возвращает True, если файл был разобран, и False, если
+        хранилище уже содержит его данные.
+        """
+        if kind not in TABLES:
+            raise ValueError(f"Unknown record kind: {kind}")
+
+        row = self.conn.execute(
+            'SELECT path, size, mtime_ns, sha256 FROM source_files WHERE source = ?', (source,)
+        ).fetchone()
+
+        if row:
+            stored = FileFingerprint(*row)
+            if stored.path == str(path.resolve()) and stored.matches_stat(path):
+                logger.info(f"Store: {source} is up to date ({path})")
+                return False
+
+            sha256 = file_sha256(path)
+            if sha256 == stored.sha256:
+                # Содержимое не изменилось (файл скопирован или "тронут") - обновляем только отпечаток
+                self._save_fingerprint(source, FileFingerprint.of(path), None)
+                self.conn.commit()
+                logger.info(f"Store: {source} content is unchanged ({path})")
+                return False
+
+        fingerprint = FileFingerprint.of(path)
+        records = load()
+
+        with self.conn:
+            self._replace_records(source, kind, records)
+            self._save_fingerprint(source, fingerprint, len(records))
+
+        logger.info(f"Store: ingested {len(records)} {kind} from {path}")
+        return True
+
+    def load_period(self, period_start: datetime, period_end: datetime) -> Dict[str, List[Any]]:
+        """Записи всех видов с datetime в [period_start, period_end]"""
+        bounds = (_format_datetime(period_start), _format_datetime(period_end))
+        self._row_ids = {}
+
+        sales = []
+        for row in self.conn.execute(
+            'SELECT id, record_id, machine_id, datetime, product_code, product_name, '
+            'amount, payment_method, quantity FROM sales '
+            'WHERE datetime BETWEEN ? AND ? ORDER BY datetime, id', bounds
+        ):
+            sale = SaleRecord.from_epoch(
+                id=row[1],
+                machine_id=row[2],
+                timestamp=to_timestamp(datetime.fromisoformat(row[3])),
+                product_code=row[4],
+                product_name=row[5],
+                amount_tiyin=row[6],
+                payment_method=PaymentMethod(row[7]),
+                quantity=row[8]
+            )
+            self._row_ids[id(sale)] = ('sales', row[0])
+            sales.append(sale)
+
+        receipts = []
+        for row in self.conn.execute(
+            'SELECT id, receipt_number, machine_id, datetime, amount, payment_method, items '
+            'FROM receipts WHERE datetime BETWEEN ? AND ? ORDER BY datetime, id', bounds
+        ):
+            receipt = FiscalReceipt.from_epoch(
+                receipt_number=row[1],
+                machine_id=row[2],
+                timestamp=to_timestamp(datetime.fromisoformat(row[3])),
+                amount_tiyin=row[4],
+                payment_method=PaymentMethod(row[5]),
+                items=[
+                    {'name': item['name'], 'amount': Decimal(item['amount'])}
+                    for item in json.loads(row[6] or '[]')
+                ]
+            )
+            self._row_ids[id(receipt)] = ('receipts', row[0])
+            receipts.append(receipt)
+
+        qr_transactions = []
+        for row in self.conn.execute(
+            'SELECT id, transaction_id, service, machine_id, datetime, amount, status '
+            'FROM qr_transactions WHERE datetime BETWEEN ? AND ? ORDER BY datetime, id', bounds
+        ):
+            transaction = QRTransaction.from_epoch(
+                transaction_id=row[1],
+                service=row[2],
+                machine_id=row[3],
+                timestamp=to_timestamp(datetime.fromisoformat(row[4])),
+                amount_tiyin=row[5],
+                status=row[6]
+            )
+            self._row_ids[id(transaction)] = ('qr_transactions', row[0])
+            qr_transactions.append(transaction)
+
+        logger.info(f"Store: loaded {len(sales)} sales, {len(receipts)} receipts, "
+                    f"{len(qr_transactions)} QR transactions for {period_start} - {period_end}")
+
+        return {
+            'sales': sales,
+            'receipts': receipts,
+            'qr_transactions': qr_transactions
+        }
+
+    def begin_run(self, period_start: datetime, period_end: datetime) -> int:
+        """Начало запуска сверки; незавершенный запуск за тот же период продолжается"""
+        bounds = (_format_datetime(period_start), _format_datetime(period_end))
+
+        row = self.conn.execute(
+            "SELECT id FROM audit_runs WHERE period_start = ? AND period_end = ? AND status = 'running' "
+            "ORDER BY id DESC LIMIT 1", bounds
+        ).fetchone()
+
+        with self.conn:
+            if row:
+                run_id = row[0]
+                self.conn.execute('DELETE FROM match_links WHERE run_id = ?', (run_id,))
+                logger.info(f"Store: resuming audit run {run_id}")
+            else:
+                run_id = self.conn.execute(
+                    "INSERT INTO audit_runs (period_start, period_end, status, started_at) "
+                    "VALUES (?, ?, 'running', ?)",
+                    bounds + (_format_datetime(datetime.now()),)
+                ).lastrowid
+
+        return run_id
+
+    def save_matches(self, run_id: int, matches: List[Tuple[SaleRecord, Any]]):
+        """Сохранение пар (продажа, чек/транзакция) для записей из load_period"""
+        links = []
+        for sale, counterpart in matches:
+            sale_row = self._row_ids.get(id(sale))
+            counterpart_row = self._row_ids.get(id(counterpart))
+            if not sale_row or not counterpart_row:
+                continue
+
+            table, counterpart_id = counterpart_row
+            links.append((
+                run_id,
+                sale_row[1],
+                counterpart_id if table == 'receipts' else None,
+                counterpart_id if table == 'qr_transactions' else None
+            ))
+
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO match_links (run_id, sale_id, receipt_id, transaction_id) VALUES (?, ?, ?, ?)',
+                links
+            )
+
+        logger.info(f"Store: saved {len(links)} match links for run {run_id}")
+
+    def finish_run(self, run_id: int, result: ReconciliationResult):
+        """Отметка о завершении запуска сверки"""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE audit_runs SET status = 'completed', finished_at = ?, "
+                "total_sales = ?, matched_count = ?, discrepancies = ? WHERE id = ?",
+                (_format_datetime(datetime.now()), result.total_sales,
+                 result.matched_count, len(result.discrepancies), run_id)
+            )
+
+    def _save_fingerprint(self, source: str, fingerprint: FileFingerprint, row_count: Optional[int]):
+        """Сохранение отпечатка файла источника"""
+        if row_count is None:
+            row_count = self.conn.execute(
+                'SELECT row_count FROM source_files WHERE source = ?', (source,)
+            ).fetchone()[0]
+
+        self.conn.execute(
+            'INSERT OR REPLACE INTO source_files '
+            '(source, path, size, mtime_ns, sha256, row_count, loaded_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (source, fingerprint.path, fingerprint.size, fingerprint.mtime_ns,
+             fingerprint.sha256, row_count, _format_datetime(datetime.now()))
+        )
+
+    def _replace_records(self, source: str, kind: str, records: List[Any]):
+        """Замена записей источника в пределах временного диапазона новой выгрузки"""
+        table = TABLES[kind]
+
+        if records:
+            first = min(record.timestamp for record in records)
+            last = max(record.timestamp for record in records)
+            self.conn.execute(
+                f'DELETE FROM {table} WHERE source = ? AND datetime BETWEEN ? AND ?',
+                (source, _format_datetime(from_timestamp(first)), _format_datetime(from_timestamp(last)))
+            )
+
+        if kind == 'sales':
+            self.conn.executemany(
+                'INSERT INTO sales (source, record_id, machine_id, datetime, product_code, '
+                'product_name, amount, payment_method, quantity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    (source, sale.id, sale.machine_id, _format_datetime(sale.datetime),
+                     sale.product_code, sale.product_name, sale.amount_tiyin,
+                     sale.payment_method.value, sale.quantity)
+                    for sale in records
+                )
+            )
+        elif kind == 'receipts':
+            self.conn.executemany(
+                'INSERT INTO receipts (source, receipt_number, machine_id, datetime, amount, '
+                'payment_method, items) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    (source, receipt.receipt_number, receipt.machine_id,
+                     _format_datetime(receipt.datetime), receipt.amount_tiyin,
+                     receipt.payment_method.value,
+                     json.dumps([
+                         {'name': item['name'], 'amount': str(item['amount'])}
+                         for item in receipt.items or []
+                     ], ensure_ascii=False))
+                    for receipt in records
+                )
+            )
+        else:
+            self.conn.executemany(
+                'INSERT INTO qr_transactions (source, transaction_id, service, machine_id, '
+                'datetime, amount, status) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    (source, transaction.transaction_id, transaction.service, transaction.machine_id,
+                     _format_datetime(transaction.datetime), transaction.amount_tiyin,
+                     transaction.status)
+                    for transaction in records
+                )
+            )
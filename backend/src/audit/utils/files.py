@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from pathlib import Path
+import hashlib
+
+# Размер блока при хешировании файла
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class FileFingerprint:
+    """Отпечаток входного файла: путь, размер, время изменения и хеш содержимого"""
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str
+
+    @classmethod
+    def of(cls, path: Path) -> 'FileFingerprint':
+        """Отпечаток файла (с хешированием содержимого)"""
+        stat = path.stat()
+        return cls(str(path.resolve()), stat.st_size, stat.st_mtime_ns, file_sha256(path))
+
+    def matches_stat(self, path: Path) -> bool:
+        """Быстрая проверка без чтения файла: совпадают ли размер и время изменения"""
+        stat = path.stat()
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,17 @@
+from datetime import datetime
+
+
+def parse_period(period_str: str) -> tuple[datetime, datetime]:
+    """Парсинг периода из строки формата YYYY-MM-DD:YYYY-MM-DD"""
+    try:
+        start_str, end_str = period_str.split(':')
+        start_date = datetime.strptime(start_str, '%Y-%m-%d')
+        end_date = datetime.strptime(end_str, '%Y-%m-%d')
+        
+        # Устанавливаем время начала и конца дня
+        period_start = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        period_end = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+        
+        return period_start, period_end
+    except Exception as e:
+        raise ValueError(f"Invalid period format. Use YYYY-MM-DD:YYYY-MM-DD. Error: {e}")